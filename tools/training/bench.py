@@ -0,0 +1,276 @@
+"""
+ONNX Runtime 벤치마크 스윕
+=========================
+모델 변형(fp32 / 동적 INT8 / 정적 INT8 / assets/models 배포 모델) × intra/inter-op 스레드 × 실행 모드 × 배치
+조합마다 다음을 측정해 JSON으로 저장하고, 저장된 기준선과 비교합니다.
+    - 지연 시간 p50 / p95 / p99 / 평균 (ms/배치), 처리량 (images/s)
+    - 세션 생성 시간 (ms)
+    - 최대 메모리: 조합마다 새 프로세스에서 실행 → 세션 생성~추론 동안 늘어난 최대 RSS (MB)
+
+모델이 batch=1로 하드코딩된 경우(onnx2torch 변환 export 등) batch > 1 조합은 "unsupported"로 기록합니다.
+--phone: 휴대폰 대용 설정 (intra 1~2, inter 1, sequential, batch 1)
+
+사용법:
+    python bench.py                                   # assets/models/*.onnx, 기본 스윕
+    python bench.py --export checkpoints/doc_aligner_finetuned.onnx --phone   # export 변형(_int8, _static_int8 등) 포함
+    python bench.py --model fp32=a.onnx --model int8=b.onnx --threads 1,2,4 --batch 1,8 --execution-mode sequential,parallel
+    python bench.py --phone --save-baseline bench_baseline.json                # 기준선 저장
+    python bench.py --phone --baseline bench_baseline.json --regression-pct 10 # 기준선 대비 회귀 확인
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import onnxruntime as ort
+
+from telemetry import current_rss_mb, peak_rss_mb
+
+EXECUTION_MODES = {"sequential": ort.ExecutionMode.ORT_SEQUENTIAL, "parallel": ort.ExecutionMode.ORT_PARALLEL}
+PHONE_THREADS = [1, 2]
+
+# export_onnx.py 출력 이름 규칙 (<이름>.onnx 기준 접미사 → 변형 이름)
+EXPORT_VARIANTS = [("", "fp32"), ("_int8", "dynamic_int8"), ("_static_int8", "static_int8"),
+                   ("_mixed_int8", "mixed_int8")]
+
+
+# ========== 측정 ==========
+
+def _session(onnx_path: str, intra: int = 0, inter: int = 0, mode: str = "sequential"):
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = intra
+    opts.inter_op_num_threads = inter
+    opts.execution_mode = EXECUTION_MODES[mode]
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    opts.log_severity_level = 4  # batch 미지원 실행 오류는 결과에 "unsupported"로 기록
+    return ort.InferenceSession(str(onnx_path), opts, providers=["CPUExecutionProvider"])
+
+
+def sample_input(sess, batch: int = 1, frame=(720, 1280)) -> dict:
+    """
+    세션 입력에 맞는 랜덤 입력 — float32 [batch, 3, H, W] (img, 기본 256)
+    또는 전처리 내장 모델(export_onnx --embed-preprocess)의 uint8 [H, W, 3] 프레임 (batch 1만)
+    """
+    inp = sess.get_inputs()[0]
+    if inp.type == "tensor(uint8)":
+        if batch != 1:
+            raise ValueError("전처리 내장 모델은 프레임 1장 입력만 지원")
+        return {inp.name: np.random.randint(0, 256, (*frame, 3), dtype=np.uint8)}
+    size = [d if isinstance(d, int) else 256 for d in inp.shape[-2:]]  # 해상도 스윕 export는 고정 H, W
+    return {inp.name: np.random.rand(batch, 3, *size).astype(np.float32)}
+
+
+def measure(onnx_path: str, intra: int = 0, inter: int = 0, mode: str = "sequential", batch: int = 1,
+            runs: int = 100, warmup: int = 10) -> dict:
+    """
+    한 설정의 세션 생성 시간 + 지연 시간 분포 (intra/inter 0 = ORT 기본값)
+    batch > 1을 모델이 지원하지 않으면 {"unsupported": 오류 메시지}
+    """
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    sess = _session(onnx_path, intra, inter, mode)
+    init_ms = (time.perf_counter() - start) * 1000
+
+    try:
+        feed = sample_input(sess, batch)
+        for _ in range(warmup):
+            sess.run(None, feed)
+    except Exception as e:  # ORT Fail (Reshape batch=1 하드코딩 등)
+        return {"init_ms": init_ms, "unsupported": str(e).splitlines()[0][:200]}
+
+    times = np.empty(runs)
+    for i in range(runs):
+        t = time.perf_counter()
+        sess.run(None, feed)
+        times[i] = time.perf_counter() - t
+    times *= 1000
+    p50, p95, p99 = np.percentile(times, [50, 95, 99])
+    return {
+        "init_ms": init_ms,
+        "mean_ms": float(times.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "throughput": float(batch * 1000 / times.mean()),
+        "rss_delta_mb": current_rss_mb() - rss_before,
+    }
+
+
+def _measure_isolated(onnx_path: str, intra: int, inter: int, mode: str, batch: int, runs: int, warmup: int) -> dict:
+    """새 프로세스 본체 — 다른 세션의 할당이 섞이지 않은 최대 RSS 측정"""
+    baseline = current_rss_mb()
+    result = measure(onnx_path, intra, inter, mode, batch, runs, warmup)
+    result["peak_mem_mb"] = max(0.0, peak_rss_mb() - baseline)
+    return result
+
+
+# ========== 스윕 ==========
+
+def sweep_configs(threads: list, inter_threads: list, modes: list, batches: list) -> list:
+    """(intra, inter, mode, batch) 조합 — sequential 모드는 inter-op 스레드를 쓰지 않으므로 inter=1만"""
+    configs = []
+    for intra, inter, mode, batch in itertools.product(threads, inter_threads, modes, batches):
+        if mode == "sequential" and inter != inter_threads[0]:
+            continue
+        configs.append((intra, inter if mode == "parallel" else 1, mode, batch))
+    return configs
+
+
+def run_suite(models: dict, configs: list, runs: int = 100, warmup: int = 10) -> list:
+    """모델 × 설정마다 새 프로세스에서 측정 (순차 실행 → 측정끼리 코어 경합 없음)"""
+    ctx = mp.get_context("spawn")
+    results = []
+    total = len(models) * len(configs)
+    for name, path in models.items():
+        for intra, inter, mode, batch in configs:
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                result = pool.submit(_measure_isolated, str(path), intra, inter, mode, batch, runs, warmup).result()
+            entry = {"model": name, "path": str(path), "size_mb": Path(path).stat().st_size / 1024 / 1024,
+                     "intra": intra, "inter": inter, "mode": mode, "batch": batch, **result}
+            results.append(entry)
+            print(f"  [{len(results):3d}/{total}] {_format_row(entry)}")
+    return results
+
+
+def _key(entry: dict) -> str:
+    return f"{entry['model']}|intra={entry['intra']}|inter={entry['inter']}|{entry['mode']}|batch={entry['batch']}"
+
+
+def _format_row(entry: dict) -> str:
+    head = (f"{entry['model']:<24} intra {entry['intra']:>2} inter {entry['inter']:>2} "
+            f"{entry['mode']:<10} batch {entry['batch']:>3}")
+    if "unsupported" in entry:
+        return f"{head} | unsupported ({entry['unsupported'][:60]})"
+    return (f"{head} | p50 {entry['p50_ms']:7.2f}ms p95 {entry['p95_ms']:7.2f}ms p99 {entry['p99_ms']:7.2f}ms "
+            f"| {entry['throughput']:7.1f} img/s | init {entry['init_ms']:6.1f}ms | mem {entry['peak_mem_mb']:6.1f}MB")
+
+
+# ========== 기준선 비교 ==========
+
+def diff_baseline(results: list, baseline: dict, regression_pct: float = 10.0) -> list:
+    """같은 (모델, 설정) 키의 p50/p95/init 변화율, regression_pct 이상 느려지면 회귀로 표시"""
+    previous = {_key(e): e for e in baseline.get("results", []) if "unsupported" not in e}
+    diffs = []
+    for entry in results:
+        old = previous.get(_key(entry))
+        if old is None or "unsupported" in entry:
+            continue
+        change = {m: (entry[m] - old[m]) / old[m] * 100 for m in ("p50_ms", "p95_ms", "init_ms") if old[m] > 0}
+        diffs.append({"key": _key(entry), **{f"{m}_pct": v for m, v in change.items()},
+                      "regression": change.get("p50_ms", 0) > regression_pct})
+
+    print(f"\n=== 기준선 대비 ({baseline.get('created', '?')}, 회귀 기준 p50 +{regression_pct:g}%) ===")
+    for d in diffs:
+        mark = "  <-- 회귀" if d["regression"] else ""
+        print(f"  {d['key']:<70} p50 {d.get('p50_ms_pct', 0):+6.1f}% p95 {d.get('p95_ms_pct', 0):+6.1f}% "
+              f"init {d.get('init_ms_pct', 0):+6.1f}%{mark}")
+    missing = len(previous) - len(diffs)
+    if missing > 0:
+        print(f"  (기준선에만 있는 조합 {missing}개)")
+    return diffs
+
+
+# ========== 진입점 ==========
+
+def _parse_list(text: str, cast=int) -> list:
+    return [cast(v) for v in text.split(",") if v]
+
+
+def collect_models(args) -> dict:
+    """--model NAME=PATH, --export 변형, --assets (assets/models/*.onnx) → {이름: 경로}"""
+    models = {}
+    for spec in args.model:
+        name, _, path = spec.rpartition("=")
+        models[name or Path(path).stem] = path
+    for export in args.export:
+        base = Path(export)
+        for suffix, variant in EXPORT_VARIANTS:
+            path = base.with_name(base.stem + suffix + base.suffix)
+            if path.exists():
+                models[f"{base.stem}:{variant}"] = str(path)
+    if args.assets or not models:
+        for path in sorted(Path(args.assets_dir).glob("*.onnx")):
+            models[f"assets:{path.stem}"] = str(path)
+    return models
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="DocAligner ONNX 벤치마크 스윕")
+    parser.add_argument("--model", action="append", default=[], help="벤치마크할 모델 (NAME=PATH, 여러 번 지정)")
+    parser.add_argument("--export", action="append", default=[],
+                        help="export_onnx.py 출력 (<이름>.onnx) — 같은 위치의 _int8/_static_int8/_mixed_int8 변형 포함")
+    parser.add_argument("--assets", action="store_true",
+                        help="assets/models/*.onnx 포함 (다른 모델을 지정하지 않으면 기본 포함)")
+    parser.add_argument("--assets-dir", type=str, default="assets/models", help="배포 모델 디렉토리")
+    parser.add_argument("--threads", type=str, default=None,
+                        help="intra-op 스레드 목록 (기본: 1,2,4,... 코어 수까지, --phone은 1,2)")
+    parser.add_argument("--inter-threads", type=str, default="1,2", help="inter-op 스레드 목록 (parallel 모드만)")
+    parser.add_argument("--execution-mode", type=str, default="sequential,parallel",
+                        help="실행 모드 목록 (sequential, parallel)")
+    parser.add_argument("--batch", type=str, default="1,4,16", help="배치 크기 목록")
+    parser.add_argument("--phone", action="store_true",
+                        help="휴대폰 대용 설정: intra 1,2 / inter 1 / sequential / batch 1")
+    parser.add_argument("--runs", type=int, default=100, help="설정당 측정 반복 수")
+    parser.add_argument("--warmup", type=int, default=10, help="설정당 워밍업 반복 수")
+    parser.add_argument("--output", type=str, default="bench_results.json", help="결과 JSON 경로")
+    parser.add_argument("--baseline", type=str, default=None, help="비교할 기준선 JSON (이전 --output/--save-baseline)")
+    parser.add_argument("--regression-pct", type=float, default=10.0, help="p50 회귀 판정 기준 (%%)")
+    parser.add_argument("--save-baseline", type=str, default=None, help="이번 결과를 기준선 JSON으로도 저장")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+
+    cores = os.cpu_count() or 1
+    if args.phone:
+        threads = _parse_list(args.threads) if args.threads else PHONE_THREADS
+        inter_threads, modes, batches = [1], ["sequential"], [1]
+    else:
+        threads = _parse_list(args.threads) if args.threads else \
+            [t for t in (1, 2, 4, 8, 16, 32) if t < cores] + [cores]
+        inter_threads = _parse_list(args.inter_threads)
+        modes = _parse_list(args.execution_mode, str)
+        batches = _parse_list(args.batch)
+
+    models = collect_models(args)
+    if not models:
+        sys.exit("벤치마크할 모델이 없습니다 (--model / --export / --assets-dir 확인)")
+    configs = sweep_configs(threads, inter_threads, modes, batches)
+
+    print("=== ONNX 벤치마크 스윕 ===")
+    print(f"  모델 {len(models)}개 × 설정 {len(configs)}개 (runs {args.runs}, warmup {args.warmup})")
+    for name, path in models.items():
+        print(f"    {name}: {path}")
+    results = run_suite(models, configs, runs=args.runs, warmup=args.warmup)
+
+    report = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "environment": {
+            "onnxruntime": ort.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+            "cpu_count": cores,
+        },
+        "settings": {"runs": args.runs, "warmup": args.warmup, "phone": args.phone},
+        "results": results,
+    }
+    if args.baseline:
+        report["baseline"] = args.baseline
+        report["diff"] = diff_baseline(results, json.loads(Path(args.baseline).read_text()), args.regression_pct)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n  결과: {args.output}")
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"  기준선 저장: {args.save_baseline}")
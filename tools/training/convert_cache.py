@@ -0,0 +1,71 @@
+"""
+ONNX → PyTorch 변환 캐시
+========================
+train.py / export_onnx.py / profile_model.py는 시작할 때마다 onnx.load + onnx2torch.convert를 수행합니다.
+변환된 GraphModule을 디스크에 저장해 두고 다음 실행부터는 torch.load만 합니다.
+
+캐시 키: ONNX 파일 내용 SHA-256 + onnx2torch/torch 버전
+    → 파일이 바뀌거나 라이브러리가 업그레이드되면 자동으로 다시 변환 (이전 항목은 삭제)
+캐시 위치: $DOC_ALIGNER_CACHE_DIR 또는 ~/.cache/doc_aligner/onnx2torch
+
+사용법:
+    from convert_cache import load_converted
+    model = load_converted("assets/models/lcnet050_p_multi_decoder_l3_d64_256_fp32.onnx")
+"""
+
+import hashlib
+import os
+from importlib import metadata
+from pathlib import Path
+
+import onnx
+import torch
+from onnx2torch import convert
+
+
+def cache_dir() -> Path:
+    return Path(os.environ.get("DOC_ALIGNER_CACHE_DIR", Path.home() / ".cache" / "doc_aligner" / "onnx2torch"))
+
+
+def _cache_key(onnx_path) -> str:
+    digest = hashlib.sha256()
+    with open(onnx_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    try:
+        o2t_version = metadata.version("onnx2torch")
+    except metadata.PackageNotFoundError:
+        o2t_version = "unknown"
+    digest.update(f"onnx2torch={o2t_version};torch={torch.__version__}".encode())
+    return digest.hexdigest()[:20]
+
+
+def load_converted(onnx_path, use_cache: bool = True):
+    """ONNX 모델을 onnx2torch GraphModule로 변환 (캐시 적중 시 변환 생략)"""
+    if not use_cache:
+        return convert(onnx.load(str(onnx_path)))
+
+    stem = Path(onnx_path).stem
+    path = cache_dir() / f"{stem}-{_cache_key(onnx_path)}.pt"
+    if path.exists():
+        try:
+            model = torch.load(path, map_location="cpu", weights_only=False)
+            print(f"  변환 캐시 사용: {path}")
+            return model
+        except Exception as e:  # 손상/비호환 캐시 → 다시 변환
+            print(f"  [경고] 변환 캐시 로드 실패 ({e}), 다시 변환")
+
+    model = convert(onnx.load(str(onnx_path)))
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        for stale in path.parent.glob(f"{stem}-*.pt"):  # 같은 모델의 이전 버전 항목 정리
+            if stale != path and len(stale.stem) == len(path.stem):
+                stale.unlink(missing_ok=True)
+        # 임시 파일에 쓴 뒤 교체 (동시 실행/중단 시 반쯤 쓰인 캐시 방지)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        torch.save(model, tmp)
+        os.replace(tmp, path)
+        print(f"  변환 캐시 저장: {path}")
+    except OSError as e:
+        print(f"  [경고] 변환 캐시 저장 실패 ({e})")
+    return model
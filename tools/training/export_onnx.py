@@ -1,50 +1,103 @@
 """
 Fine-tuned 모델 → ONNX 변환 + 양자화
 =====================================
-학습된 PyTorch 체크포인트를 ONNX로 변환하고,
-INT8 동적 양자화로 크기를 줄입니다.
+학습된 PyTorch 체크포인트를 ONNX로 변환하고, INT8 양자화로 크기/지연 시간을 줄입니다.
+    - dynamic: 가중치만 INT8 (activation은 실행 중 양자화, 보정 데이터 불필요)
+    - static : 데이터셋 splits["val"]로 activation 범위를 보정한 QDQ INT8 (Conv 연산 자체가 INT8 커널)
+    - mixed  : 레이어별 민감도(한 레이어씩 INT8 → val 코너 오차)를 측정해 오차 예산 안에서
+               가장 빠른 INT8/fp32 레이어 조합 선택 (mixed_precision_report.json)
 
 사용법:
     python export_onnx.py --checkpoint checkpoints/checkpoint_best.pt
     python export_onnx.py --checkpoint checkpoints/checkpoint_best.pt --quantize
+    python export_onnx.py --checkpoint checkpoints/checkpoint_best.pt --quantize static --data dataset \
+        --calib-method entropy --per-channel --compare  # fp32 / 동적 / 정적 INT8 속도·코너 오차 비교
+    python export_onnx.py --checkpoint checkpoints/checkpoint_best.pt --quantize mixed --data dataset \
+        --accuracy-budget 0.5  # val 코너 오차 +0.5px 이내에서 가장 빠른 혼합 정밀도
+    python export_onnx.py --checkpoint checkpoints/checkpoint_best.pt --quantize --offline-opt --ort-format
+    python export_onnx.py --optimize assets/models/doc_aligner_book_v2_int8.onnx --ort-format  # 기존 asset 사전 최적화
+
+--offline-opt / --optimize: ORT 그래프 최적화를 미리 적용해 저장 (앱 세션 생성 시 최적화 시간 단축)
+    - 사용하지 않는 노드/initializer/출력 제거 → ORT offline 최적화 (*_opt.onnx, --ort-format이면 *.ort도)
+    - 원본 대비 세션 생성 시간 / 첫 추론 지연 비교 (앱과 같은 설정: 스레드 2, 바이트에서 로드)
     python export_onnx.py --checkpoint checkpoints/checkpoint_best.pt --output assets/models/doc_aligner_book.onnx
+    python export_onnx.py --checkpoint checkpoints_qat/checkpoint_best.pt  # QAT(--stage 3) 체크포인트 → QDQ INT8
+
+--accuracy: validate_onnx는 랜덤 입력으로 PyTorch/ONNX 출력 일치만 확인하므로, 실제 테스트셋에서
+fp32/양자화 모델의 유형별(document/book/binder/negative) 코너 오차, success@5/10/20px, has_obj 정확도, 처리량 비교
+    python export_onnx.py --checkpoint checkpoints/checkpoint_best.pt --quantize static --data dataset --accuracy
+    python export_onnx.py --accuracy a.onnx a_int8.onnx --data dataset  # 기존 ONNX만 검증
+
+--resolutions: 입력 해상도별 export + 양자화 → 테스트셋 코너 오차 / 지연 시간 Pareto 표 (resolution_sweep.json)
+    python export_onnx.py --checkpoint checkpoints/checkpoint_best.pt --quantize --data dataset \
+        --resolutions 160,192,224,256 --accuracy-bar 5  # 오차 5px 이내에서 가장 빠른 해상도 추천
+
+--embed-preprocess: 리사이즈(bilinear) → NCHW → /255를 그래프 앞에 붙여 uint8 [H, W, 3] 프레임(임의 크기)을 직접 입력
+(*_raw.onnx, 입력 이름 image), 프레임 크기별 외부 전처리 + 추론 대비 지연 비교 (preprocess_comparison.json)
+    python export_onnx.py --checkpoint checkpoints/checkpoint_best.pt --quantize --embed-preprocess
+    python export_onnx.py --embed-preprocess assets/models/doc_aligner_book_v2_int8.onnx --raw-channel-order bgr
+
+--benchmark는 기본 스레드 설정 한 가지만 측정합니다. 스레드/실행 모드/배치/모델 변형 스윕과
+기준선 비교는 bench.py (python bench.py --export checkpoints/doc_aligner_finetuned.onnx --phone)
 """
 
 import argparse
+import json
+import random
+import shutil
+import sys
+import tempfile
 from pathlib import Path
 
 import numpy as np
-import onnx
 import onnxruntime as ort
 import torch
-from onnx2torch import convert
+from onnxruntime.quantization import CalibrationDataReader, CalibrationMethod
+from bench import measure, sample_input
+from convert_cache import load_converted
+from graph_opt import optimize_model
+from qat import is_qat_model, prepare_qat
+from student import build_student
 
 
-def load_model(onnx_path: str, checkpoint_path: str, device: str = "cpu"):
-    """ONNX 원본 + 학습된 가중치 로드"""
+def load_model(onnx_path: str, checkpoint_path: str, device: str = "cpu", graph_opt: bool = True,
+               use_cache: bool = True):
+    """
+    ONNX 원본 + 학습된 가중치 로드 (graph_opt: 전체 Conv+BN 융합/상수 폴딩, 수치 검증 후 적용)
+    QAT 체크포인트(stage 3)면 fake-quant를 삽입한 뒤 로드 → export 결과는 QDQ INT8 ONNX
+    지식 증류 체크포인트(--teacher)면 원본 ONNX 대신 student 모델 구성
+    """
     print(f"모델 로드 중...")
     print(f"  원본 ONNX: {onnx_path}")
     print(f"  체크포인트: {checkpoint_path}")
 
-    # ONNX → PyTorch 변환
-    onnx_model = onnx.load(onnx_path)
-    model = convert(onnx_model)
+    ckpt = torch.load(checkpoint_path, map_location=device, weights_only=False)
+    train_args = ckpt.get("args", {})
+    if train_args.get("teacher"):
+        model = build_student(train_args["student_width"], train_args["student_depth"])
+    else:
+        # ONNX → PyTorch 변환 (내용 해시 키 캐시)
+        model = load_converted(onnx_path, use_cache=use_cache)
 
     # 학습된 가중치 로드
-    ckpt = torch.load(checkpoint_path, map_location=device, weights_only=False)
+    if train_args.get("stage") == 3 and not train_args.get("teacher"):
+        model = prepare_qat(model)
     model.load_state_dict(ckpt["model"])
     model.eval()
 
     print(f"  Epoch: {ckpt['epoch'] + 1}")
     print(f"  Best val dist: {ckpt.get('best_val_dist', 'N/A')}")
 
+    if graph_opt:
+        model = optimize_model(model)
+
     return model
 
 
-def export_onnx(model, output_path: str, device: str = "cpu"):
-    """PyTorch → ONNX 변환"""
+def export_onnx(model, output_path: str, device: str = "cpu", resolution: int = 256):
+    """PyTorch → ONNX 변환 (resolution ≠ 256은 enable_flexible_resolution 적용 모델, 입력 H/W 고정)"""
     model = model.to(device).eval()
-    dummy = torch.randn(1, 3, 256, 256, device=device)
+    dummy = torch.randn(1, 3, resolution, resolution, device=device)
 
     print(f"\nONNX export 중...")
     torch.onnx.export(
@@ -67,13 +120,33 @@ def export_onnx(model, output_path: str, device: str = "cpu"):
     return output_path
 
 
+def _constants_to_initializers(model_proto):
+    """
+    Constant 노드 → initializer
+    graph_opt 융합 가중치(비영속 버퍼)는 Constant 노드로 export되는데,
+    ORT 양자화기는 Conv/MatMul weight가 initializer일 때만 양자화
+    """
+    import onnx
+
+    graph = model_proto.graph
+    for node in list(graph.node):
+        if node.op_type != "Constant" or node.attribute[0].name != "value":
+            continue
+        tensor = onnx.helper.get_attribute_value(node.attribute[0])
+        tensor.name = node.output[0]
+        graph.initializer.append(tensor)
+        graph.node.remove(node)
+    return model_proto
+
+
 def quantize_onnx(input_path: str, output_path: str):
     """ONNX 동적 양자화 (INT8)"""
+    import onnx
     from onnxruntime.quantization import quantize_dynamic, QuantType
 
     print(f"\nINT8 양자화 중...")
     quantize_dynamic(
-        input_path,
+        _constants_to_initializers(onnx.load(input_path)),
         output_path,
         weight_type=QuantType.QUInt8,
     )
@@ -88,7 +161,229 @@ def quantize_onnx(input_path: str, output_path: str):
     return output_path
 
 
-def validate_onnx(model, onnx_path: str, device: str = "cpu", n_tests: int = 10):
+CALIBRATION_METHODS = {"minmax": CalibrationMethod.MinMax, "entropy": CalibrationMethod.Entropy,
+                       "percentile": CalibrationMethod.Percentile}
+_QUANT_OPS = ("Conv", "Gemm", "MatMul")
+
+
+class CornerCalibrationReader(CalibrationDataReader):
+    """
+    정적 양자화 보정 입력 — 데이터셋 splits["val"] 이미지 (학습과 같은 전처리, 증강 없음, batch 1)
+    resolution: 해상도 스윕 export 입력 크기 (None이면 256)
+    """
+
+    def __init__(self, data_dir: str, num_samples: int = 200, seed: int = 0, input_name: str = "img",
+                 resolution: int = None):
+        from train import CornerDataset
+
+        data_path = Path(data_dir)
+        indices = json.loads((data_path / "splits.json").read_text())["val"]
+        if 0 < num_samples < len(indices):
+            indices = sorted(random.Random(seed).sample(indices, num_samples))
+        cache_dir = data_path / "cache"
+        self.dataset = CornerDataset(data_path / "images", data_path / "labels", indices, augment=False,
+                                     cache_dir=cache_dir if (cache_dir / "images_u8.npy").exists() else None)
+        self.dataset.resolution = resolution
+        self.input_name = input_name
+        self._next = 0
+
+    def get_next(self):
+        if self._next >= len(self.dataset):
+            return None
+        img = self.dataset[self._next][0]
+        self._next += 1
+        return {self.input_name: img.unsqueeze(0).numpy()}
+
+    def rewind(self):
+        self._next = 0
+
+
+def _output_layers(model_proto) -> list:
+    """
+    그래프 출력 ~ 마지막 Conv/Gemm/MatMul까지의 노드 이름
+    정적 양자화에서 제외 → 좌표 출력 해상도 보존 (QAT에서 마지막 레이어 출력을 fp32로 두는 것과 같은 이유)
+    """
+    producers = {out: node for node in model_proto.graph.node for out in node.output}
+    stack = [o.name for o in model_proto.graph.output]
+    excluded, seen = [], set()
+    while stack:
+        node = producers.get(stack.pop())
+        if node is None or node.name in seen:
+            continue
+        seen.add(node.name)
+        excluded.append(node.name)
+        if node.op_type not in _QUANT_OPS:
+            stack.extend(node.input)
+    return excluded
+
+
+def _prepare_static(input_path: str, prep_path: str):
+    """shape 추론 + 그래프 최적화 (ORT 권장 전처리), 이름 없는 노드는 양자화 대상 지정을 위해 이름 부여"""
+    import onnx
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    quant_pre_process(_constants_to_initializers(onnx.load(input_path)), prep_path)
+    model_proto = onnx.load(prep_path)
+    Path(prep_path).unlink()
+    for i, node in enumerate(model_proto.graph.node):
+        node.name = node.name or f"{node.op_type}_{i}"
+    return model_proto
+
+
+def _quantize_static(model_proto, output_path, reader, method: str, per_channel: bool,
+                     nodes_to_quantize=None, nodes_to_exclude=None, cache_path=None):
+    """
+    QDQ 정적 양자화 (activation uint8 / weight int8)
+    cache_path: 보정 범위 JSON 캐시 (있으면 보정 추론 생략 → 같은 모델을 대상 노드만 바꿔 반복 양자화)
+    """
+    import copy
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+    quantize_static(
+        copy.deepcopy(model_proto),
+        output_path,
+        reader,
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=per_channel,
+        calibrate_method=CALIBRATION_METHODS[method],
+        nodes_to_quantize=nodes_to_quantize,
+        nodes_to_exclude=nodes_to_exclude,
+        calibration_cache_path=cache_path,
+    )
+    return output_path
+
+
+def quantize_static_onnx(input_path: str, output_path: str, data_dir: str, num_samples: int = 200,
+                         method: str = "minmax", per_channel: bool = True, resolution: int = None):
+    """
+    ONNX 정적 양자화 (QDQ, activation uint8 / weight int8)
+    method: minmax | entropy | percentile (activation 범위 보정 방식)
+    """
+    print(f"\nINT8 정적 양자화 중 (보정 {method}, per-channel={per_channel}, 샘플 {num_samples})...")
+    model_proto = _prepare_static(input_path, str(output_path).replace(".onnx", "_prep.onnx"))
+    excluded = _output_layers(model_proto)
+    _quantize_static(model_proto, output_path, CornerCalibrationReader(data_dir, num_samples, resolution=resolution),
+                     method, per_channel, nodes_to_exclude=excluded)
+
+    original_size = Path(input_path).stat().st_size / 1024 / 1024
+    quantized_size = Path(output_path).stat().st_size / 1024 / 1024
+    print(f"  fp32 유지 (출력 레이어): {', '.join(excluded)}")
+    print(f"  원본: {original_size:.2f} MB")
+    print(f"  양자화: {quantized_size:.2f} MB ({quantized_size / original_size * 100:.0f}%)")
+
+    return output_path
+
+
+def _split_loader(data_dir: str, split: str, num_samples: int = 0, batch_size: int = 64, seed: int = 0,
+                  resolution: int = None):
+    """데이터셋 분할 DataLoader (num_samples > 0이면 고정 시드로 일부만, memmap 캐시가 있으면 사용)"""
+    from torch.utils.data import DataLoader
+    from train import CornerDataset
+
+    data_path = Path(data_dir)
+    indices = json.loads((data_path / "splits.json").read_text())[split]
+    if 0 < num_samples < len(indices):
+        indices = sorted(random.Random(seed).sample(indices, num_samples))
+    cache_dir = data_path / "cache"
+    dataset = CornerDataset(data_path / "images", data_path / "labels", indices, augment=False,
+                            cache_dir=cache_dir if (cache_dir / "images_u8.npy").exists() else None)
+    dataset.resolution = resolution
+    return DataLoader(dataset, batch_size=batch_size, shuffle=False)
+
+
+def mixed_precision_onnx(input_path: str, output_path: str, data_dir: str, budget_px: float = 0.5,
+                         num_samples: int = 200, method: str = "minmax", per_channel: bool = True,
+                         eval_samples: int = 0, steps: int = 8):
+    """
+    민감도 기반 혼합 정밀도 정적 양자화
+        1. 레이어 민감도: Conv/Gemm/MatMul을 하나씩만 INT8로 양자화 → val 코너 오차 증가량 (px)
+        2. 민감도 낮은 순으로 k개를 INT8 (k = 전체의 1/steps 간격) → val 오차 + 지연 시간 측정
+        3. 오차 ≤ fp32 + budget_px인 조합 중 가장 빠른 것 선택 (없으면 fp32 그대로)
+    보정은 한 번만 수행하고 범위 캐시를 재사용, 결과는 mixed_precision_report.json
+    """
+    from train import CornerLoss, evaluate_onnx
+
+    print(f"\n혼합 정밀도 양자화 (val 오차 예산 +{budget_px}px, 보정 {method}, per-channel={per_channel})...")
+    work = Path(tempfile.mkdtemp(prefix="mixed_precision_"))
+    model_proto = _prepare_static(input_path, str(work / "prep.onnx"))
+    layers = [node.name for node in model_proto.graph.node if node.op_type in _QUANT_OPS]
+    reader = CornerCalibrationReader(data_dir, num_samples)
+    cache_path = work / "calibration.json"
+    val_dl = _split_loader(data_dir, "val", eval_samples)
+    criterion = CornerLoss()
+
+    def val_dist(path) -> float:
+        return evaluate_onnx(path, val_dl, criterion)["avg_corner_dist_px"]
+
+    baseline = val_dist(input_path)
+    print(f"  fp32 val 코너 오차: {baseline:.2f}px (val {len(val_dl.dataset)}장), 대상 레이어 {len(layers)}개")
+
+    # 1. 레이어별 민감도
+    sensitivity = {}
+    for i, name in enumerate(layers):
+        path = work / f"layer_{i:03d}.onnx"
+        _quantize_static(model_proto, path, reader, method, per_channel, nodes_to_quantize=[name],
+                         cache_path=cache_path)
+        sensitivity[name] = val_dist(path) - baseline
+        path.unlink()
+        print(f"    [{i + 1:3d}/{len(layers)}] {name:<48} {sensitivity[name]:+.3f}px")
+
+    # 2. 덜 민감한 레이어부터 INT8로 늘려가며 오차/지연 측정
+    order = sorted(layers, key=sensitivity.get)
+    candidates = [{"int8_layers": 0, "val_dist": baseline,
+                   "latency_ms": benchmark_onnx(input_path, verbose=False), "path": input_path}]
+    for k in sorted({max(1, round(len(layers) * j / steps)) for j in range(1, steps + 1)}):
+        path = work / f"mixed_{k:03d}.onnx"
+        _quantize_static(model_proto, path, reader, method, per_channel, nodes_to_quantize=order[:k],
+                         cache_path=cache_path)
+        candidates.append({"int8_layers": k, "val_dist": val_dist(path),
+                           "latency_ms": benchmark_onnx(str(path), verbose=False), "path": str(path)})
+
+    # 3. 예산 안에서 가장 빠른 조합
+    feasible = [c for c in candidates if c["val_dist"] <= baseline + budget_px]
+    best = min(feasible, key=lambda c: c["latency_ms"])
+    shutil.copy(best["path"], output_path)
+    shutil.rmtree(work, ignore_errors=True)
+
+    print(f"\n  {'int8':>5} {'fp32':>5} {'val_dist':>9} {'Δdist':>8} {'latency':>9} {'speedup':>8}")
+    for c in candidates:
+        mark = " <= 선택" if c is best else ("" if c in feasible else " (예산 초과)")
+        print(f"  {c['int8_layers']:>5} {len(layers) - c['int8_layers']:>5} {c['val_dist']:>7.2f}px "
+              f"{c['val_dist'] - baseline:>+6.2f}px {c['latency_ms']:>7.2f}ms "
+              f"{candidates[0]['latency_ms'] / c['latency_ms']:>7.2f}x{mark}")
+    if best["int8_layers"] == 0:
+        print(f"  예산 안의 INT8 조합이 fp32보다 빠르지 않음 → fp32 그대로 저장")
+    print(f"  저장: {output_path}")
+
+    int8 = set(order[:best["int8_layers"]])
+    report = {
+        "input": str(input_path),
+        "output": str(output_path),
+        "budget_px": budget_px,
+        "calibration": {"method": method, "per_channel": per_channel, "samples": len(reader.dataset)},
+        "val_samples": len(val_dl.dataset),
+        "fp32_val_dist": baseline,
+        "sensitivity": [{"layer": name, "delta_px": sensitivity[name]}
+                        for name in sorted(layers, key=sensitivity.get, reverse=True)],
+        "candidates": [{k: v for k, v in c.items() if k != "path"} for c in candidates],
+        "chosen": {
+            "int8_layers": [name for name in layers if name in int8],
+            "fp32_layers": [name for name in layers if name not in int8],
+            "val_dist": best["val_dist"],
+            "latency_ms": best["latency_ms"],
+        },
+    }
+    report_path = Path(output_path).parent / "mixed_precision_report.json"
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"  보고서: {report_path}")
+    return output_path
+
+
+def validate_onnx(model, onnx_path: str, device: str = "cpu", n_tests: int = 10, atol: float = 0.001,
+                  resolution: int = 256):
     """ONNX와 PyTorch 출력 비교 검증"""
     print(f"\nONNX 검증 중 ({n_tests}회)...")
     sess = ort.InferenceSession(onnx_path)
@@ -98,7 +393,7 @@ def validate_onnx(model, onnx_path: str, device: str = "cpu", n_tests: int = 10)
     max_diff_obj = 0
 
     for i in range(n_tests):
-        test_in = np.random.randn(1, 3, 256, 256).astype(np.float32)
+        test_in = np.random.randn(1, 3, resolution, resolution).astype(np.float32)
         onnx_out = sess.run(None, {"img": test_in})
 
         with torch.no_grad():
@@ -112,32 +407,479 @@ def validate_onnx(model, onnx_path: str, device: str = "cpu", n_tests: int = 10)
     print(f"  Points 최대 차이: {max_diff_pts:.8f}")
     print(f"  Has_obj 최대 차이: {max_diff_obj:.8f}")
 
-    if max_diff_pts < 0.001 and max_diff_obj < 0.001:
+    if max_diff_pts < atol and max_diff_obj < atol:
         print(f"  검증 통과! OK")
     else:
         print(f"  [경고] 차이가 큽니다. 확인 필요")
 
 
-def benchmark_onnx(onnx_path: str, n_runs: int = 100):
-    """ONNX Runtime 추론 속도 벤치마크"""
+def benchmark_onnx(onnx_path: str, n_runs: int = 100, verbose: bool = True) -> float:
+    """
+    ONNX Runtime 추론 속도 벤치마크 (평균 ms/image 반환, ORT 기본 스레드 설정)
+    스레드/배치/모델 변형 스윕 + 기준선 비교는 bench.py
+    """
+    if verbose:
+        print(f"\n추론 속도 벤치마크 ({n_runs}회)...")
+    result = measure(onnx_path, runs=n_runs)
+
+    if verbose:
+        print(f"  평균 추론 시간 (CPU): {result['mean_ms']:.2f} ms/image "
+              f"(p50 {result['p50_ms']:.2f} / p95 {result['p95_ms']:.2f} / p99 {result['p99_ms']:.2f})")
+        print(f"  FPS: {result['throughput']:.1f}")
+    return result["mean_ms"]
+
+
+def compare_quantization(models: dict, data_dir: str, output_json: str, batch_size: int = 64) -> dict:
+    """
+    models: {이름: ONNX 경로} — 테스트셋 코너 오차 (ONNX Runtime) + benchmark_onnx 지연 시간 비교
+    첫 모델(fp32)을 기준으로 속도 향상/오차 변화 표시, 결과는 output_json에 저장
+    """
+    from train import CornerLoss, evaluate_onnx
+
+    test_dl = _split_loader(data_dir, "test", batch_size=batch_size)
+
+    results = {}
+    for name, path in models.items():
+        metrics = evaluate_onnx(path, test_dl, CornerLoss())
+        print(f"\n[{name}] {path}")
+        results[name] = {
+            "path": str(path),
+            "size_mb": Path(path).stat().st_size / 1024 / 1024,
+            "latency_ms": benchmark_onnx(str(path)),
+            "avg_corner_dist_px": metrics["avg_corner_dist_px"],
+            "success_rate_10px": metrics["success_rate_10px"],
+        }
+
+    print(f"\n=== 양자화 비교 (test {len(test_dl.dataset)}장) ===")
+    print(f"  {'model':<14} {'size':>8} {'latency':>10} {'speedup':>8} {'dist':>8} {'Δdist':>8} {'ok@10px':>8}")
+    base = next(iter(results.values()))
+    for name, r in results.items():
+        print(f"  {name:<14} {r['size_mb']:>6.2f}MB {r['latency_ms']:>8.2f}ms "
+              f"{base['latency_ms'] / r['latency_ms']:>7.2f}x {r['avg_corner_dist_px']:>6.2f}px "
+              f"{r['avg_corner_dist_px'] - base['avg_corner_dist_px']:>+6.2f}px {r['success_rate_10px']:>8.1%}")
+    with open(output_json, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n  결과: {output_json}")
+    return results
+
+
+# ========== 실제 데이터 정확도 검증 ==========
+
+SUCCESS_THRESHOLDS = (5, 10, 20)
+SAMPLE_TYPES = ("document", "book", "binder", "negative")
+
+
+def _sample_types(data_dir: str, indices: list) -> list:
+    """metadata.json의 샘플 유형 (파일이 없으면 None → 호출 측에서 라벨 기준 document/negative)"""
+    meta_path = Path(data_dir) / "metadata.json"
+    if not meta_path.exists():
+        return None
+    types = {s["index"]: s["type"] for s in json.loads(meta_path.read_text())["samples"]}
+    return [types.get(i, "unknown") for i in indices]
+
+
+def _type_metrics(dists: np.ndarray, obj_correct: np.ndarray, has_obj: np.ndarray) -> dict:
+    """코너 메트릭은 문서가 있는 샘플만, has_obj 정확도는 전체 샘플 기준"""
+    positive = dists[has_obj]
+    metrics = {"count": int(len(dists)), "positives": int(has_obj.sum())}
+    if len(positive):
+        metrics["avg_corner_dist_px"] = float(positive.mean())
+        for t in SUCCESS_THRESHOLDS:
+            metrics[f"success_rate_{t}px"] = float((positive < t).mean())
+    metrics["has_obj_accuracy"] = float(obj_correct.mean()) if len(obj_correct) else 0.0
+    return metrics
+
+
+def validate_accuracy(models: dict, data_dir: str, output_json: str, split: str = "test",
+                      batch_size: int = 64) -> dict:
+    """
+    models: {이름: ONNX 경로} — 실제 데이터(splits[split])에서 ONNX Runtime 배치 추론 정확도 검증
+    샘플 유형(metadata.json: document/book/binder/negative)별 코너 오차, success@5/10/20px, has_obj 정확도와
+    추론 처리량(데이터 로드 제외)을 첫 모델(fp32) 대비로 표시, 결과는 output_json에 저장
+    """
+    import time
+    from train import _batched_call, _ort_session
+
+    loader = _split_loader(data_dir, split, batch_size=batch_size)
+    types = _sample_types(data_dir, loader.dataset.indices)
+
+    results = {}
+    for name, path in models.items():
+        sess = _ort_session(path)
+        input_name = sess.get_inputs()[0].name
+
+        def run(imgs):
+            points, has_obj = sess.run(None, {input_name: imgs.numpy()})
+            return torch.from_numpy(points), torch.from_numpy(has_obj)
+
+        state, elapsed = {}, 0.0
+        dists, obj_correct, has_obj = [], [], []
+        with torch.no_grad():
+            for imgs, gt_pts, gt_obj in loader:
+                start = time.perf_counter()
+                pred_pts, pred_obj = _batched_call(run, imgs, state)
+                elapsed += time.perf_counter() - start
+                gt = gt_obj.squeeze(-1) > 0.5
+                dists.append((torch.linalg.norm(pred_pts.view(-1, 4, 2) - gt_pts.view(-1, 4, 2), dim=-1)
+                              .mean(dim=1) * 256).numpy())
+                obj_correct.append(((torch.sigmoid(pred_obj.squeeze(-1)) > 0.5) == gt).numpy())
+                has_obj.append(gt.numpy())
+        dists, obj_correct, has_obj = np.concatenate(dists), np.concatenate(obj_correct), np.concatenate(has_obj)
+
+        sample_types = np.array(types if types is not None else
+                                ["document" if h else "negative" for h in has_obj])
+        by_type = {t: _type_metrics(dists[sample_types == t], obj_correct[sample_types == t],
+                                    has_obj[sample_types == t])
+                   for t in list(SAMPLE_TYPES) + sorted(set(sample_types) - set(SAMPLE_TYPES))
+                   if (sample_types == t).any()}
+        results[name] = {
+            "path": str(path),
+            "size_mb": Path(path).stat().st_size / 1024 / 1024,
+            "batched": state.get("batched", False),
+            "throughput": len(dists) / elapsed if elapsed else 0.0,
+            "overall": _type_metrics(dists, obj_correct, has_obj),
+            "by_type": by_type,
+        }
+
+    base = next(iter(results.values()))
+    print(f"\n=== 정확도 검증 ({split} {len(loader.dataset)}장, batch {batch_size}) ===")
+    print(f"  {'model':<14} {'type':<9} {'n':>5} {'dist':>8} {'Δdist':>8} "
+          + " ".join(f"{f'ok@{t}px':>8}" for t in SUCCESS_THRESHOLDS) + f" {'has_obj':>8}")
+    for name, r in results.items():
+        for group, m in [("all", r["overall"])] + list(r["by_type"].items()):
+            base_m = base["overall"] if group == "all" else base["by_type"].get(group, {})
+            if "avg_corner_dist_px" in m:
+                corners = (f"{m['avg_corner_dist_px']:>6.2f}px "
+                           f"{m['avg_corner_dist_px'] - base_m.get('avg_corner_dist_px', 0):>+6.2f}px "
+                           + " ".join(f"{m[f'success_rate_{t}px']:>8.1%}" for t in SUCCESS_THRESHOLDS))
+            else:  # negative: 코너 정답 없음
+                corners = f"{'-':>8} {'-':>8} " + " ".join(f"{'-':>8}" for _ in SUCCESS_THRESHOLDS)
+            print(f"  {name:<14} {group:<9} {m['count']:>5} {corners} {m['has_obj_accuracy']:>8.1%}")
+        speedup = r["throughput"] / base["throughput"] if base["throughput"] else 0.0
+        print(f"  {name:<14} 처리량 {r['throughput']:.1f} img/s ({speedup:.2f}x, "
+              f"{'배치' if r['batched'] else '샘플 단위'} 실행)")
+    with open(output_json, "w") as f:
+        json.dump({"split": split, "batch_size": batch_size, "models": results}, f, indent=2)
+    print(f"\n  결과: {output_json}")
+    return results
+
+
+# ========== 해상도 스윕 ==========
+
+def pareto_front(points: list) -> list:
+    """(지연 시간, 오차) 목록에서 다른 점에 양쪽 모두 지지 않는 점의 인덱스 (둘 다 작을수록 좋음)"""
+    return [i for i, (lat, err) in enumerate(points)
+            if not any(l <= lat and e <= err and (l, e) != (lat, err) for l, e in points)]
+
+
+def resolution_sweep(model, output_path: str, resolutions: list, data_dir: str, quantize: str = "dynamic",
+                     calib_samples: int = 200, calib_method: str = "minmax", per_channel: bool = True,
+                     threads: int = 2, runs: int = 100, accuracy_bar: float = None, batch_size: int = 64) -> dict:
+    """
+    입력 해상도별 export(fp32) + 양자화(quantize: dynamic | static | None) → 테스트셋 코너 오차 + 지연 시간
+    변환 모델은 enable_flexible_resolution으로 backbone만 저해상도로 실행 (head는 256 기준 feature 크기로 보간),
+    student는 입력 크기 제한이 없어 그대로 export. 출력: <이름>_r<해상도>(_int8|_static_int8).onnx
+    지연 시간(p50)-오차 Pareto 표, accuracy_bar(px)를 만족하는 가장 빠른 모델 추천 → resolution_sweep.json
+    호출 측은 입력을 해당 해상도로 리사이즈해야 합니다 (모델 입력 H/W 고정).
+    """
+    import copy
+    from graph_opt import enable_flexible_resolution
+    from train import CornerLoss, evaluate_onnx
+
+    flexible = copy.deepcopy(model).eval()
+    inserted = enable_flexible_resolution(flexible)
+    print(f"\n=== 해상도 스윕 ({', '.join(map(str, resolutions))}, 양자화 {quantize or '없음'}) ===")
+    if inserted:
+        print(f"  backbone → head 경계 보간 {inserted}개 삽입")
+
+    stem = output_path.replace(".onnx", "")
+    results = {}
+    for resolution in resolutions:
+        variants = {"fp32": export_onnx(flexible, f"{stem}_r{resolution}.onnx", resolution=resolution)}
+        validate_onnx(flexible, variants["fp32"], n_tests=3, resolution=resolution)
+        if quantize == "dynamic":
+            variants["dynamic_int8"] = quantize_onnx(variants["fp32"], f"{stem}_r{resolution}_int8.onnx")
+        elif quantize == "static":
+            variants["static_int8"] = quantize_static_onnx(
+                variants["fp32"], f"{stem}_r{resolution}_static_int8.onnx", data_dir, num_samples=calib_samples,
+                method=calib_method, per_channel=per_channel, resolution=resolution)
+
+        test_dl = _split_loader(data_dir, "test", batch_size=batch_size, resolution=resolution)
+        for precision, path in variants.items():
+            metrics = evaluate_onnx(path, test_dl, CornerLoss())
+            latency = measure(path, intra=threads, runs=runs)
+            results[f"r{resolution} {precision}"] = {
+                "path": str(path),
+                "resolution": resolution,
+                "precision": precision,
+                "size_mb": Path(path).stat().st_size / 1024 / 1024,
+                "p50_ms": latency["p50_ms"],
+                "p95_ms": latency["p95_ms"],
+                "avg_corner_dist_px": metrics["avg_corner_dist_px"],
+                "success_rate_10px": metrics["success_rate_10px"],
+            }
+
+    names = list(results)
+    front = {names[i] for i in pareto_front([(r["p50_ms"], r["avg_corner_dist_px"]) for r in results.values()])}
+    eligible = [n for n in names if accuracy_bar is not None and results[n]["avg_corner_dist_px"] <= accuracy_bar]
+    recommended = min(eligible, key=lambda n: results[n]["p50_ms"]) if eligible else None
+    for name, r in results.items():
+        r["pareto"] = name in front
+
+    print(f"\n=== 지연 시간 / 코너 오차 (test {len(test_dl.dataset)}장, 스레드 {threads}, p50 빠른 순) ===")
+    print(f"  {'model':<18} {'size':>8} {'p50':>9} {'p95':>9} {'dist':>8} {'ok@10px':>8}  pareto")
+    for name in sorted(names, key=lambda n: results[n]["p50_ms"]):
+        r = results[name]
+        mark = " *" if r["pareto"] else ""
+        mark += "  <-- 추천" if name == recommended else ""
+        print(f"  {name:<18} {r['size_mb']:>6.2f}MB {r['p50_ms']:>7.2f}ms {r['p95_ms']:>7.2f}ms "
+              f"{r['avg_corner_dist_px']:>6.2f}px {r['success_rate_10px']:>8.1%}{mark}")
+    if accuracy_bar is not None:
+        print(f"  오차 기준 {accuracy_bar:g}px: " + (f"{recommended} ({results[recommended]['path']})" if recommended
+                                                  else "만족하는 모델 없음"))
+
+    output_json = str(Path(output_path).parent / "resolution_sweep.json")
+    with open(output_json, "w") as f:
+        json.dump({"threads": threads, "accuracy_bar_px": accuracy_bar, "recommended": recommended,
+                   "models": results}, f, indent=2)
+    print(f"\n  결과: {output_json}")
+    return results
+
+
+# ========== 전처리 내장 ==========
+
+PREPROCESS_FRAMES = [(480, 640), (720, 1280), (1080, 1920), (3024, 4032)]  # (H, W) — 카메라 프리뷰 ~ 사진
+
+
+def embed_preprocessing(input_path: str, output_path: str, channel_order: str = "rgb", size: int = 256) -> str:
+    """
+    원본 uint8 HWC 프레임(임의 크기)을 바로 받는 ONNX 생성 — 호출 측 리사이즈/NCHW 변환/float 정규화 제거
+        image [H, W, 3] uint8 → Resize(bilinear, half_pixel = cv2.INTER_LINEAR) [1, size, size, 3] uint8
+        → Cast float32 → Transpose NCHW → ×1/255 (channel_order="bgr"이면 RGB로 채널 순서 변환) → 기존 img 입력
+    uint8 상태에서 먼저 축소하므로 float 변환은 size×size 크기에만 발생합니다.
+    """
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    print(f"\n전처리 내장 중 ({Path(input_path).name}, 입력 uint8 HWC {channel_order.upper()})...")
+    model_proto = onnx.load(input_path)
+    graph = model_proto.graph
+    img = graph.input[0]
+    graph.input.remove(img)
+    graph.input.insert(0, helper.make_tensor_value_info("image", TensorProto.UINT8, ["height", "width", 3]))
+
+    graph.initializer.extend([
+        numpy_helper.from_array(np.array([0], dtype=np.int64), "preprocess_axes"),
+        numpy_helper.from_array(np.array([1, size, size, 3], dtype=np.int64), "preprocess_sizes"),
+        numpy_helper.from_array(np.array(1 / 255, dtype=np.float32), "preprocess_scale"),
+    ])
+    nodes = [
+        helper.make_node("Unsqueeze", ["image", "preprocess_axes"], ["preprocess_nhwc"]),
+        helper.make_node("Resize", ["preprocess_nhwc", "", "", "preprocess_sizes"], ["preprocess_resized"],
+                         mode="linear", coordinate_transformation_mode="half_pixel"),
+        helper.make_node("Cast", ["preprocess_resized"], ["preprocess_float"], to=TensorProto.FLOAT),
+        helper.make_node("Transpose", ["preprocess_float"], ["preprocess_nchw"], perm=[0, 3, 1, 2]),
+    ]
+    if channel_order == "bgr":
+        graph.initializer.append(numpy_helper.from_array(np.array([2, 1, 0], dtype=np.int64), "preprocess_rgb"))
+        nodes.append(helper.make_node("Gather", ["preprocess_nchw", "preprocess_rgb"], ["preprocess_ordered"], axis=1))
+    nodes.append(helper.make_node("Mul", [nodes[-1].output[0], "preprocess_scale"], [img.name]))
+    for node in reversed(nodes):
+        graph.node.insert(0, node)
+
+    onnx.checker.check_model(model_proto)
+    onnx.save(model_proto, output_path)
+    print(f"  저장: {output_path} ({Path(output_path).stat().st_size / 1024 / 1024:.2f} MB)")
+    return output_path
+
+
+def _external_preprocess(frame: np.ndarray, channel_order: str = "rgb", size: int = 256) -> np.ndarray:
+    """기존 호출 측 전처리 (test_docaligner.detect_corners / 앱과 같은 순서: 리사이즈 → NCHW → float32 / 255)"""
+    import cv2
+
+    resized = cv2.resize(frame, (size, size), interpolation=cv2.INTER_LINEAR)
+    if channel_order == "bgr":
+        resized = resized[..., ::-1]
+    return np.transpose(resized, (2, 0, 1)).astype(np.float32)[None] / 255.0
+
+
+def compare_preprocessing(models: dict, output_json: str, channel_order: str = "rgb", runs: int = 50,
+                          frames: list = None) -> dict:
+    """
+    models: {원본 경로: 전처리 내장 경로} — 프레임 크기별 (외부 전처리 + 추론) vs (내장 그래프 추론) 지연 시간
+    외부 전처리는 OpenCV 기준이라 앱(Dart 픽셀 루프)보다 빠르므로 실제 기기에서의 차이는 더 큽니다.
+    """
+    import time
+    from bench import _session
+
+    results = {}
+    for original, embedded in models.items():
+        base_sess, raw_sess = _session(original), _session(embedded)
+        base_input = base_sess.get_inputs()[0].name
+        for height, width in frames or PREPROCESS_FRAMES:
+            frame = np.random.randint(0, 256, (height, width, 3), dtype=np.uint8)
+            pre, external, internal = [], [], []
+            for i in range(runs + 5):
+                start = time.perf_counter()
+                inp = _external_preprocess(frame, channel_order)
+                prepared = time.perf_counter()
+                expected = base_sess.run(None, {base_input: inp})
+                done = time.perf_counter()
+                actual = raw_sess.run(None, {"image": frame})
+                if i >= 5:  # 워밍업 제외
+                    pre.append((prepared - start) * 1000)
+                    external.append((done - start) * 1000)
+                    internal.append((time.perf_counter() - done) * 1000)
+            results[f"{Path(embedded).name} {width}x{height}"] = {
+                "original": str(original),
+                "embedded": str(embedded),
+                "frame": [height, width],
+                "external_preprocess_ms": float(np.median(pre)),
+                "external_total_ms": float(np.median(external)),
+                "embedded_total_ms": float(np.median(internal)),
+                # uint8 리사이즈 반올림 차이 (OpenCV 고정소수점 vs ORT)
+                "max_output_diff": max(float(np.abs(a - b).max()) for a, b in zip(expected, actual)),
+            }
+
+    print(f"\n=== 전처리 내장 비교 (중앙값 {runs}회, 입력 {channel_order.upper()}) ===")
+    print(f"  {'model / frame':<44} {'pre':>8} {'external':>10} {'embedded':>10} {'speedup':>8} {'max diff':>9}")
+    for key, r in results.items():
+        print(f"  {key:<44} {r['external_preprocess_ms']:>6.2f}ms {r['external_total_ms']:>8.2f}ms "
+              f"{r['embedded_total_ms']:>8.2f}ms {r['external_total_ms'] / r['embedded_total_ms']:>7.2f}x "
+              f"{r['max_output_diff']:>9.2e}")
+    with open(output_json, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n  결과: {output_json}")
+    return results
+
+
+# ========== 오프라인 최적화 / ORT 포맷 ==========
+
+OFFLINE_LEVELS = {"basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+                  "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+                  "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL}
+
+
+def prune_unused(model_proto, keep_outputs=None):
+    """keep_outputs(기본: 전체 그래프 출력)에 기여하지 않는 노드, 미사용 initializer/value_info/출력 제거"""
+    graph = model_proto.graph
+    keep = set(keep_outputs or [o.name for o in graph.output])
+    for output in [o for o in graph.output if o.name not in keep]:
+        graph.output.remove(output)
+
+    needed = set(keep)
+    live = []
+    for node in reversed(graph.node):
+        if any(out in needed for out in node.output):
+            live.append(node)
+            needed.update(i for i in node.input if i)
+            for attr in node.attribute:  # If/Loop 서브그래프가 바깥 값을 참조하는 경우
+                for sub in list(attr.g.node if attr.HasField("g") else []) + [n for g in attr.graphs for n in g.node]:
+                    needed.update(sub.input)
+    removed_nodes = len(graph.node) - len(live)
+    for node in [n for n in graph.node if n not in live]:
+        graph.node.remove(node)
+
+    removed_inits = [init for init in graph.initializer if init.name not in needed]
+    for init in removed_inits:
+        graph.initializer.remove(init)
+    for info in [v for v in graph.value_info if v.name not in needed]:
+        graph.value_info.remove(info)
+    return removed_nodes, len(removed_inits)
+
+
+def optimize_offline(input_path: str, output_path: str, level: str = "extended", ort_format: bool = False,
+                     keep_outputs=None) -> list:
+    """
+    미사용 노드/initializer/출력 제거 후 ORT offline 그래프 최적화 결과 저장
+    level: basic | extended (기본, 플랫폼 무관) | all (NCHWc 등 현재 CPU 전용 레이아웃 포함 → 배포용 비권장)
+    반환: [최적화 ONNX 경로(, ORT 포맷 경로)]
+    """
+    import onnx
+
+    print(f"\n오프라인 최적화 중 ({Path(input_path).name}, level={level})...")
+    model_proto = onnx.load(input_path)
+    removed_nodes, removed_inits = prune_unused(model_proto, keep_outputs)
+    print(f"  미사용 제거: 노드 {removed_nodes}, initializer {removed_inits}")
+
+    outputs = []
+    formats = [("ONNX", output_path)]
+    if ort_format:
+        formats.append(("ORT", str(Path(output_path).with_suffix(".ort"))))
+    for fmt, path in formats:
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = OFFLINE_LEVELS[level]
+        opts.optimized_model_filepath = path
+        opts.add_session_config_entry("session.save_model_format", fmt)
+        ort.InferenceSession(model_proto.SerializeToString(), opts, providers=["CPUExecutionProvider"])
+        size_mb = Path(path).stat().st_size / 1024 / 1024
+        print(f"  저장: {path} ({size_mb:.2f} MB)")
+        outputs.append(path)
+
+    # 최적화 전후 출력 일치 확인 (ORT 포맷은 같은 그래프를 직렬화만 달리함)
+    before_sess = ort.InferenceSession(input_path, providers=["CPUExecutionProvider"])
+    feed = sample_input(before_sess)
+    before = before_sess.run(None, feed)
+    after = ort.InferenceSession(output_path, providers=["CPUExecutionProvider"]).run(None, feed)
+    diff = max(float(np.abs(a - b).max()) for a, b in zip(before, after))
+    print(f"  원본 대비 최대 출력 차이: {diff:.2e}")
+    return outputs
+
+
+def measure_startup(onnx_path: str, runs: int = 5, level: str = "all") -> dict:
+    """
+    앱과 같은 조건(바이트에서 로드, intra/inter 스레드 2)으로 세션 생성 + 첫 추론 시간 (ms, runs회 중앙값)
+    level: 세션 생성 시 그래프 최적화 수준 (앱은 all, 사전 최적화 모델은 off도 가능)
+    """
     import time
 
-    print(f"\n추론 속도 벤치마크 ({n_runs}회)...")
-    sess = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
-    test_in = np.random.randn(1, 3, 256, 256).astype(np.float32)
+    levels = {**OFFLINE_LEVELS, "off": ort.GraphOptimizationLevel.ORT_DISABLE_ALL}
+    data = Path(onnx_path).read_bytes()
+    feed = None
+    create, first = [], []
+    for _ in range(runs):
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = 2
+        opts.inter_op_num_threads = 2
+        opts.graph_optimization_level = levels[level]
+        start = time.perf_counter()
+        sess = ort.InferenceSession(data, opts, providers=["CPUExecutionProvider"])
+        create.append((time.perf_counter() - start) * 1000)
+        feed = feed or sample_input(sess)
+        start = time.perf_counter()
+        sess.run(None, feed)
+        first.append((time.perf_counter() - start) * 1000)
+    return {"create_ms": float(np.median(create)), "first_run_ms": float(np.median(first))}
 
-    # 워밍업
-    for _ in range(10):
-        sess.run(None, {"img": test_in})
 
-    # 벤치마크
-    start = time.time()
-    for _ in range(n_runs):
-        sess.run(None, {"img": test_in})
-    elapsed = (time.time() - start) / n_runs * 1000
+def compare_startup(groups: dict, output_json: str, runs: int = 5) -> dict:
+    """
+    groups: {원본 경로: [사전 최적화 경로, ...]} — 원본(런타임 최적화 all) vs 사전 최적화(all / off) 시작 시간 비교
+    """
+    results = {}
+    for original, optimized in groups.items():
+        rows = [(original, "all")] + [(path, level) for path in optimized for level in ("all", "off")]
+        for path, level in rows:
+            results[f"{path} [{level}]"] = {
+                "path": str(path),
+                "original": str(original),
+                "runtime_level": level,
+                "size_mb": Path(path).stat().st_size / 1024 / 1024,
+                **measure_startup(path, runs=runs, level=level),
+            }
 
-    print(f"  평균 추론 시간 (CPU): {elapsed:.2f} ms/image")
-    print(f"  FPS: {1000/elapsed:.1f}")
+    print(f"\n=== 세션 시작 시간 (중앙값 {runs}회, 스레드 2) ===")
+    print(f"  {'model':<44} {'level':>5} {'size':>8} {'create':>9} {'first run':>10} {'total':>9} {'speedup':>8}")
+    for r in results.values():
+        base = results[f"{r['original']} [all]"]
+        total = r["create_ms"] + r["first_run_ms"]
+        print(f"  {Path(r['path']).name:<44} {r['runtime_level']:>5} {r['size_mb']:>6.2f}MB "
+              f"{r['create_ms']:>7.1f}ms {r['first_run_ms']:>8.1f}ms {total:>7.1f}ms "
+              f"{(base['create_ms'] + base['first_run_ms']) / total:>7.2f}x")
+    with open(output_json, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n  결과: {output_json}")
+    return results
 
 
 if __name__ == "__main__":
@@ -145,34 +887,150 @@ if __name__ == "__main__":
     parser.add_argument("--model", type=str,
                         default="assets/models/lcnet050_p_multi_decoder_l3_d64_256_fp32.onnx",
                         help="원본 ONNX 모델 경로")
-    parser.add_argument("--checkpoint", type=str, required=True,
-                        help="학습된 체크포인트 경로")
+    parser.add_argument("--checkpoint", type=str, default=None,
+                        help="학습된 체크포인트 경로 (--optimize만 사용할 때는 생략)")
     parser.add_argument("--output", type=str, default=None,
                         help="출력 ONNX 경로 (미지정시 자동)")
-    parser.add_argument("--quantize", action="store_true",
-                        help="INT8 양자화 수행")
+    parser.add_argument("--quantize", nargs="?", const="dynamic", choices=["dynamic", "static", "mixed"],
+                        default=None,
+                        help="INT8 양자화 수행 (dynamic: 가중치만, static: --data val 이미지로 activation 보정, "
+                             "mixed: 레이어 민감도 기반 INT8/fp32 혼합)")
+    parser.add_argument("--data", type=str, default="tools/training/dataset",
+                        help="정적 양자화 보정(splits val) / --compare 평가(splits test) 데이터셋 경로")
+    parser.add_argument("--calib-samples", type=int, default=200, help="정적 양자화 보정 샘플 수 (0: val 전체)")
+    parser.add_argument("--calib-method", type=str, default="minmax", choices=["minmax", "entropy", "percentile"],
+                        help="정적 양자화 activation 범위 보정 방식")
+    parser.add_argument("--per-channel", action="store_true", help="정적 양자화 weight를 채널별 scale로 양자화")
+    parser.add_argument("--accuracy-budget", type=float, default=0.5,
+                        help="mixed: 허용하는 val 코너 오차 증가량 (px, fp32 대비)")
+    parser.add_argument("--sensitivity-samples", type=int, default=0,
+                        help="mixed: 민감도/후보 평가에 쓸 val 샘플 수 (0: val 전체)")
+    parser.add_argument("--mixed-steps", type=int, default=8,
+                        help="mixed: INT8 레이어 수 후보 개수 (민감도 낮은 순 전체의 1/N 간격)")
+    parser.add_argument("--compare", action="store_true",
+                        help="fp32 / 동적 INT8 / 정적·혼합 INT8 테스트셋 코너 오차 + 속도 비교 (quantization_comparison.json)")
+    parser.add_argument("--accuracy", type=str, nargs="*", default=None,
+                        help="--data 테스트셋에서 export/양자화 모델의 유형별 코너 정확도 + 처리량 검증 "
+                             "(accuracy_report.json, 경로를 주면 해당 ONNX도 포함 — 체크포인트 없이 사용 가능)")
+    parser.add_argument("--accuracy-batch", type=int, default=64, help="정확도 검증 배치 크기")
+    parser.add_argument("--resolutions", type=str, default=None,
+                        help="해상도 스윕: 쉼표 구분 입력 해상도별 export + 양자화(--quantize, mixed는 static으로) → "
+                             "--data 테스트셋 오차/지연 Pareto 표 (예: 160,192,224,256, resolution_sweep.json)")
+    parser.add_argument("--accuracy-bar", type=float, default=None,
+                        help="해상도 스윕: 허용 코너 오차 (px) — 만족하는 가장 빠른 모델 추천")
+    parser.add_argument("--sweep-threads", type=int, default=2, help="해상도 스윕 지연 시간 측정 intra-op 스레드 (앱: 2)")
+    parser.add_argument("--embed-preprocess", type=str, nargs="*", default=None,
+                        help="리사이즈/NCHW/정규화를 그래프에 내장해 uint8 HWC 프레임을 직접 받는 *_raw.onnx 생성 "
+                             "(export/양자화 결과, 경로를 주면 해당 ONNX도 — 체크포인트 없이 사용 가능) + 외부 전처리 대비 지연 비교")
+    parser.add_argument("--raw-channel-order", type=str, default="rgb", choices=["rgb", "bgr"],
+                        help="전처리 내장 모델 입력 프레임 채널 순서 (앱 image 패키지: rgb, OpenCV imread: bgr)")
+    parser.add_argument("--preprocess-runs", type=int, default=50, help="전처리 내장 비교 반복 수 (중앙값)")
     parser.add_argument("--benchmark", action="store_true",
                         help="추론 속도 벤치마크")
+    parser.add_argument("--offline-opt", action="store_true",
+                        help="export/양자화 결과를 ORT offline 최적화 (*_opt.onnx) + 세션 시작 시간 비교")
+    parser.add_argument("--optimize", type=str, nargs="+", default=None,
+                        help="기존 ONNX 파일을 offline 최적화 (체크포인트 export 없이, 예: assets/models/*.onnx)")
+    parser.add_argument("--offline-level", type=str, default="extended", choices=list(OFFLINE_LEVELS),
+                        help="offline 최적화 수준 (all은 현재 CPU 전용 레이아웃 포함 → 배포용 비권장)")
+    parser.add_argument("--ort-format", action="store_true", help="offline 최적화 결과를 .ort 포맷으로도 저장")
+    parser.add_argument("--startup-runs", type=int, default=5, help="세션 시작 시간 측정 반복 수 (중앙값)")
+    parser.add_argument("--no-convert-cache", action="store_true",
+                        help="ONNX→PyTorch 변환 캐시 사용 안 함")
+    parser.add_argument("--no-graph-opt", action="store_true",
+                        help="변환 그래프 정리(Conv+BN 융합, 상수 폴딩) 생략")
     args = parser.parse_args()
+    if args.checkpoint is None and not args.optimize and not args.accuracy and not args.embed_preprocess:
+        parser.error("--checkpoint, --optimize, --accuracy PATH 또는 --embed-preprocess PATH가 필요합니다")
+
+    # 기존 ONNX 정확도 검증 / 전처리 내장 / 사전 최적화만 수행
+    if args.checkpoint is None:
+        report_dir = Path(args.output).parent if args.output else Path.cwd()  # asset 디렉토리에는 보고서 미저장
+        if args.accuracy:
+            validate_accuracy({Path(p).stem: p for p in args.accuracy}, args.data,
+                              str(report_dir / "accuracy_report.json"), batch_size=args.accuracy_batch)
+        if args.embed_preprocess:
+            embedded = {path: embed_preprocessing(path, path.replace(".onnx", "_raw.onnx"), args.raw_channel_order)
+                        for path in args.embed_preprocess}
+            compare_preprocessing(embedded, str(report_dir / "preprocess_comparison.json"),
+                                  channel_order=args.raw_channel_order, runs=args.preprocess_runs)
+        if not args.optimize:
+            sys.exit(0)
+        groups = {path: optimize_offline(path, path.replace(".onnx", "_opt.onnx"), level=args.offline_level,
+                                         ort_format=args.ort_format)
+                  for path in args.optimize}
+        compare_startup(groups, str(report_dir / "startup_comparison.json"), runs=args.startup_runs)
+        sys.exit(0)
+
+    # 모델 로드
+    model = load_model(args.model, args.checkpoint, graph_opt=not args.no_graph_opt,
+                       use_cache=not args.no_convert_cache)
+    qat = is_qat_model(model)
 
     # 출력 경로
     if args.output is None:
         ckpt_dir = Path(args.checkpoint).parent
-        args.output = str(ckpt_dir / "doc_aligner_finetuned.onnx")
-
-    # 모델 로드
-    model = load_model(args.model, args.checkpoint)
+        name = "doc_aligner_finetuned_qdq_int8.onnx" if qat else "doc_aligner_finetuned.onnx"
+        args.output = str(ckpt_dir / name)
 
     # ONNX export
     onnx_path = export_onnx(model, args.output)
-    validate_onnx(model, onnx_path)
+    # QDQ: ORT INT8 커널과 fake-quant의 반올림 차이(1 quantum)만큼 허용
+    validate_onnx(model, onnx_path, atol=0.01 if qat else 0.001)
 
     if args.benchmark:
         benchmark_onnx(onnx_path)
 
-    # 양자화
-    if args.quantize:
-        quant_path = args.output.replace(".onnx", "_int8.onnx")
-        quantize_onnx(onnx_path, quant_path)
-        if args.benchmark:
-            benchmark_onnx(quant_path)
+    # 양자화 (QAT 모델은 이미 QDQ INT8), --compare는 동적 INT8을 기준선으로 함께 생성
+    quantized = {}
+    if args.quantize and qat:
+        print(f"\nQAT 체크포인트: QDQ INT8로 export 완료, 추가 양자화 생략")
+    elif args.quantize:
+        if args.quantize == "dynamic" or args.compare:
+            quantized["dynamic_int8"] = quantize_onnx(onnx_path, args.output.replace(".onnx", "_int8.onnx"))
+        if args.quantize == "static":
+            quantized["static_int8"] = quantize_static_onnx(
+                onnx_path, args.output.replace(".onnx", "_static_int8.onnx"), args.data,
+                num_samples=args.calib_samples, method=args.calib_method, per_channel=args.per_channel)
+        if args.quantize == "mixed":
+            quantized["mixed_int8"] = mixed_precision_onnx(
+                onnx_path, args.output.replace(".onnx", "_mixed_int8.onnx"), args.data,
+                budget_px=args.accuracy_budget, num_samples=args.calib_samples, method=args.calib_method,
+                per_channel=args.per_channel, eval_samples=args.sensitivity_samples, steps=args.mixed_steps)
+        if args.benchmark and not args.compare:
+            for quant_path in quantized.values():
+                benchmark_onnx(quant_path)
+
+    if args.compare:
+        compare_quantization({"qat_qdq_int8" if qat else "fp32": onnx_path, **quantized}, args.data,
+                             str(Path(args.output).parent / "quantization_comparison.json"))
+
+    # 실제 데이터 정확도 검증 (fp32 + 양자화 결과 + 지정한 ONNX)
+    if args.accuracy is not None:
+        validate_accuracy({"qat_qdq_int8" if qat else "fp32": onnx_path, **quantized,
+                           **{Path(p).stem: p for p in args.accuracy}}, args.data,
+                          str(Path(args.output).parent / "accuracy_report.json"), batch_size=args.accuracy_batch)
+
+    # 해상도 스윕 (해상도별 export + 양자화 → 테스트셋 오차 / 지연 Pareto)
+    if args.resolutions:
+        sweep_quantize = None if qat else {"dynamic": "dynamic", "static": "static", "mixed": "static"}.get(
+            args.quantize or "dynamic")
+        resolution_sweep(model, args.output, [int(r) for r in args.resolutions.split(",")], args.data,
+                         quantize=sweep_quantize, calib_samples=args.calib_samples, calib_method=args.calib_method,
+                         per_channel=args.per_channel, threads=args.sweep_threads, accuracy_bar=args.accuracy_bar)
+
+    # 전처리 내장 (export/양자화 결과 + 지정한 ONNX) + 외부 전처리 대비 지연 비교
+    embedded = {}
+    if args.embed_preprocess is not None:
+        embedded = {path: embed_preprocessing(path, path.replace(".onnx", "_raw.onnx"), args.raw_channel_order)
+                    for path in [onnx_path, *quantized.values()] + args.embed_preprocess}
+        compare_preprocessing(embedded, str(Path(args.output).parent / "preprocess_comparison.json"),
+                              channel_order=args.raw_channel_order, runs=args.preprocess_runs)
+
+    # ORT offline 최적화 (export/양자화/전처리 내장 결과 전체) + 세션 시작 시간 비교
+    if args.offline_opt or args.optimize:
+        targets = [onnx_path, *quantized.values(), *embedded.values()] + list(args.optimize or [])
+        groups = {path: optimize_offline(path, path.replace(".onnx", "_opt.onnx"), level=args.offline_level,
+                                         ort_format=args.ort_format)
+                  for path in targets}
+        compare_startup(groups, str(Path(args.output).parent / "startup_comparison.json"), runs=args.startup_runs)
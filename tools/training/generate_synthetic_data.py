@@ -7,6 +7,7 @@
 사용법:
     python generate_synthetic_data.py --count 5000 --output dataset
     python generate_synthetic_data.py --count 100 --output dataset --visualize  # 시각화 포함
+    python generate_synthetic_data.py --count 5000 --output dataset --track-memory  # 500장마다 메모리 기록
 """
 
 import cv2
@@ -18,6 +19,8 @@ import os
 from pathlib import Path
 from typing import Tuple, List, Optional
 
+from memprof import MemoryTracker
+
 
 class SyntheticDocumentGenerator:
     """합성 문서/책 코너 감지 학습 데이터 생성기"""
@@ -645,8 +648,9 @@ def generate_dataset(
     binder_ratio: float = 0.0,
     visualize: bool = False,
     seed: int = 42,
+    track_memory: bool = False,
 ):
-    """전체 데이터셋 생성"""
+    """전체 데이터셋 생성 (track_memory: 500장마다 메모리 스냅샷 → <output>/memory_profile.json)"""
     random.seed(seed)
     np.random.seed(seed)
 
@@ -667,6 +671,8 @@ def generate_dataset(
     print(f"  바인더 비율: {binder_ratio:.0%}")
     print(f"  부정 샘플 비율: {negative_ratio:.0%}")
 
+    memory = MemoryTracker(output_path / "memory_profile.json", enabled=track_memory)
+    memory.start()
     generator = SyntheticDocumentGenerator(doc_dir, bg_dir, output_size=256)
 
     metadata = []
@@ -718,6 +724,8 @@ def generate_dataset(
 
         if (i + 1) % 500 == 0 or i == count - 1:
             print(f"  [{i + 1}/{count}] 생성 완료...")
+            if memory.enabled:
+                print(MemoryTracker.format(memory.snapshot(f"{i + 1} samples", periodic=True)))
 
     # 메타데이터 저장
     meta_path = output_path / "metadata.json"
@@ -749,6 +757,11 @@ def generate_dataset(
     with open(splits_path, "w") as f:
         json.dump(splits, f, indent=2)
 
+    if memory.enabled:
+        memory.snapshot("metadata")  # metadata 리스트/JSON 직렬화 포함
+        memory.save({"count": count})
+        memory.stop()
+
     print(f"\n=== 생성 완료 ===")
     print(f"  이미지: {img_dir}")
     print(f"  라벨: {label_dir}")
@@ -756,6 +769,8 @@ def generate_dataset(
     print(f"  분할: train={len(splits['train'])}, val={len(splits['val'])}, test={len(splits['test'])}")
     if visualize:
         print(f"  시각화: {vis_dir}")
+    if memory.enabled:
+        print(f"  메모리: {memory.path}" + (f" (누수 의심 경고 {len(memory.warnings)}건)" if memory.warnings else ""))
 
 
 if __name__ == "__main__":
@@ -769,6 +784,8 @@ if __name__ == "__main__":
     parser.add_argument("--binder-ratio", type=float, default=0.0, help="바인더 노트 샘플 비율")
     parser.add_argument("--visualize", action="store_true", help="시각화 이미지 생성")
     parser.add_argument("--seed", type=int, default=42, help="랜덤 시드")
+    parser.add_argument("--track-memory", action="store_true",
+                        help="메모리 추적 (500장마다 RSS/상위 할당 위치 → memory_profile.json, 누수 경고, tracemalloc으로 수 배 느려짐)")
     args = parser.parse_args()
 
     generate_dataset(
@@ -781,4 +798,5 @@ if __name__ == "__main__":
         binder_ratio=args.binder_ratio,
         visualize=args.visualize,
         seed=args.seed,
+        track_memory=args.track_memory,
     )
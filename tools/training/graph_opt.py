@@ -0,0 +1,522 @@
+"""
+onnx2torch 변환 모델 그래프 정리
+================================
+변환된 DocAligner(torch.fx GraphModule)는 ONNX 그래프 구조를 그대로 유지하여
+Conv/BatchNorm 분리, Constant/Reshape/Transpose 체인, 매 forward마다 도는 shape 계산이 남아 있습니다.
+이 모듈은 변환 직후 다음 패스를 적용하고 수치 동일성을 검증합니다.
+
+    1. 동결 Conv+BN 융합   — 학습하지 않는 레이어만 (융합 가중치는 비영속 버퍼)
+    2. 상수 폴딩           — 입력에 의존하지 않는 서브그래프를 한 번만 계산
+                             (input_shape 지정 시 Shape 노드도 상수로 특수화)
+    3. 레이아웃 정리        — Identity 제거, 상수 Reshape → torch.reshape,
+                             연속 Reshape/Transpose 병합·상쇄
+
+state_dict()는 키/값 모두 원본과 동일하게 유지되므로 체크포인트는 최적화 여부와 무관하게 호환됩니다.
+(융합/폴딩 결과는 persistent=False 버퍼로만 보관)
+
+주의: 융합된 BN은 running stats를 사용(eval 동작)하므로 학습 모드 출력(배치 통계)과 다릅니다.
+학습용(optimize_model(training=True))에서는 Conv+BN 융합을 건너뛰고 eval/train 두 모드 모두 동일성을 검증합니다.
+가중치를 로드한 뒤에 적용해야 합니다 (융합 버퍼는 적용 시점의 값으로 계산).
+
+별도 패스 enable_flexible_resolution(): head가 256 입력 기준 토큰 수/positional embedding에
+고정되어 있으므로, backbone 출력 feature map을 256 기준 크기로 보간해 backbone만 저해상도로 실행
+(점진적 해상도 학습용, 256 입력에서는 no-op).
+
+별도 패스 enable_checkpointing(): backbone 블록 단위 segment를 torch.utils.checkpoint로 감싸
+backward 때 activation을 재계산 (plan_checkpointing()이 메모리 예산에 맞춰 블록 선택).
+"""
+
+import contextlib
+import copy
+import operator
+import re
+
+import torch
+import torch.fx as fx
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.fx.passes.shape_prop import ShapeProp
+from torch.nn.utils.fusion import fuse_conv_bn_weights
+from torch.utils.checkpoint import checkpoint
+
+
+def _assert_input_shape(x, shape):
+    """shape 특수화된 그래프의 입력 가드"""
+    if tuple(x.shape) != shape:
+        raise ValueError(f"그래프가 입력 shape {shape}로 특수화됨, 입력: {tuple(x.shape)}")
+    return x
+
+
+def _module(gm, node):
+    return gm.get_submodule(node.target) if node.op == "call_module" else None
+
+
+def _type_name(gm, node):
+    module = _module(gm, node)
+    return type(module).__name__ if module is not None else None
+
+
+def _register_constant(gm, prefix: str, value: torch.Tensor) -> str:
+    """비영속 버퍼로 등록 (state_dict에 포함되지 않음) 후 속성 이름 반환"""
+    i = 0
+    while hasattr(gm, f"{prefix}_{i}"):
+        i += 1
+    name = f"{prefix}_{i}"
+    gm.register_buffer(name, value.detach().clone(), persistent=False)
+    return name
+
+
+def _get_attr_value(gm, node):
+    value = gm
+    for part in node.target.split("."):
+        value = getattr(value, part)
+    return value
+
+
+# ========== 1. 동결 Conv+BN 융합 ==========
+
+def fuse_frozen_conv_bn(gm, trainable: set) -> int:
+    """Conv2d → BatchNorm2d 쌍 중 두 레이어 모두 학습 대상이 아니면 F.conv2d 하나로 융합"""
+    fused = 0
+    for node in list(gm.graph.nodes):
+        bn = _module(gm, node)
+        if not isinstance(bn, nn.BatchNorm2d) or not bn.track_running_stats:
+            continue
+        conv_node = node.args[0]
+        conv = _module(gm, conv_node) if isinstance(conv_node, fx.Node) else None
+        if not isinstance(conv, nn.Conv2d) or conv.padding_mode != "zeros" or len(conv_node.users) != 1:
+            continue
+        names = [f"{conv_node.target}.{n}" for n, _ in conv.named_parameters()]
+        names += [f"{node.target}.{n}" for n, _ in bn.named_parameters()]
+        if any(n in trainable for n in names):
+            continue
+
+        weight, bias = fuse_conv_bn_weights(
+            conv.weight, conv.bias, bn.running_mean, bn.running_var, bn.eps, bn.weight, bn.bias)
+        w_name = _register_constant(gm, "_fused_weight", weight)
+        b_name = _register_constant(gm, "_fused_bias", bias)
+
+        with gm.graph.inserting_before(node):
+            w_node = gm.graph.get_attr(w_name)
+            b_node = gm.graph.get_attr(b_name)
+            new = gm.graph.call_function(
+                F.conv2d,
+                (conv_node.args[0], w_node, b_node, conv.stride, conv.padding, conv.dilation, conv.groups),
+            )
+        node.replace_all_uses_with(new)
+        gm.graph.erase_node(node)
+        gm.graph.erase_node(conv_node)
+        fused += 1
+    return fused
+
+
+# ========== 2. 상수 폴딩 ==========
+
+def fold_constants(gm, specialize_shapes: bool = False) -> int:
+    """
+    모든 입력이 상수인 노드를 미리 계산 (파라미터가 없는 모듈/함수만)
+    specialize_shapes=True: ShapeProp 결과로 Shape 노드를 상수화 (입력 shape 고정 전제)
+    """
+    const = {}
+    for node in gm.graph.nodes:
+        if node.op in ("placeholder", "output"):
+            continue
+
+        if node.op == "get_attr":
+            value = _get_attr_value(gm, node)
+            if not isinstance(value, nn.Parameter):
+                const[node] = value
+            continue
+
+        module = _module(gm, node)
+        if specialize_shapes and type(module).__name__ == "OnnxShape" and "tensor_meta" in node.args[0].meta:
+            meta = node.args[0].meta["tensor_meta"]
+            const[node] = module(torch.empty(meta.shape, dtype=meta.dtype))
+            continue
+
+        if any(n not in const for n in node.all_input_nodes):
+            continue
+        # Dropout: 학습 모드 확률 연산, FakeQuantize: QAT weight 양자화 (QDQ export에 남아야 함)
+        if module is not None and (any(True for _ in module.parameters())
+                                   or any(k in type(module).__name__ for k in ("Dropout", "FakeQuantize"))):
+            continue
+
+        args = fx.node.map_arg(node.args, lambda n: const[n])
+        kwargs = fx.node.map_arg(node.kwargs, lambda n: const[n])
+        with torch.no_grad():
+            if node.op == "call_module":
+                const[node] = module(*args, **kwargs)
+            elif node.op == "call_function":
+                const[node] = node.target(*args, **kwargs)
+            elif node.op == "call_method":
+                const[node] = getattr(args[0], node.target)(*args[1:], **kwargs)
+
+    # 상수가 아닌 노드가 사용하는 경계 노드만 치환
+    folded = 0
+    for node, value in const.items():
+        if node.op == "get_attr" or all(user in const for user in node.users):
+            continue
+        if isinstance(value, torch.Tensor):
+            name = _register_constant(gm, "_folded", value)
+            with gm.graph.inserting_before(node):
+                new = gm.graph.get_attr(name)
+            node.replace_all_uses_with(new, delete_user_cb=lambda user: user not in const)
+        elif isinstance(value, (int, float, bool, tuple, list, torch.Size)):
+            for user in list(node.users):
+                if user not in const:
+                    user.args = fx.node.map_arg(user.args, lambda n: value if n is node else n)
+                    user.kwargs = fx.node.map_arg(user.kwargs, lambda n: value if n is node else n)
+        else:
+            continue
+        folded += 1
+    return folded
+
+
+# ========== 3. 레이아웃 정리 ==========
+
+def _const_shape(gm, node, input_node):
+    """상수 Reshape target → 튜플 (0은 입력 dim 복사, 입력 shape를 모르면 None)"""
+    if not isinstance(node, fx.Node) or node.op != "get_attr":
+        return None
+    shape = [int(v) for v in _get_attr_value(gm, node).tolist()]
+    if 0 in shape:
+        meta = input_node.meta.get("tensor_meta") if isinstance(input_node, fx.Node) else None
+        if meta is None:
+            return None
+        shape = [meta.shape[i] if s == 0 else s for i, s in enumerate(shape)]
+    return tuple(shape)
+
+
+def simplify_layout(gm) -> int:
+    removed = 0
+    for node in list(gm.graph.nodes):
+        name = _type_name(gm, node)
+
+        # Identity (OnnxCopyIdentity는 clone) 제거
+        if name in ("OnnxCopyIdentity", "Identity"):
+            node.replace_all_uses_with(node.args[0])
+            gm.graph.erase_node(node)
+            removed += 1
+
+        # 상수 shape Reshape → torch.reshape (매 호출 any(shape == 0) 검사/host 동기화 제거)
+        elif name == "OnnxReshape":
+            shape = _const_shape(gm, node.args[1], node.args[0])
+            if shape is None:
+                continue
+            with gm.graph.inserting_before(node):
+                new = gm.graph.call_function(torch.reshape, (node.args[0], shape))
+            new.meta = node.meta
+            node.replace_all_uses_with(new)
+            gm.graph.erase_node(node)
+            removed += 1
+
+        # Transpose → permute (체인 병합 대상)
+        elif name == "OnnxTranspose" and _module(gm, node).perm is not None:
+            with gm.graph.inserting_before(node):
+                new = gm.graph.call_function(torch.permute, (node.args[0], tuple(_module(gm, node).perm)))
+            new.meta = node.meta
+            node.replace_all_uses_with(new)
+            gm.graph.erase_node(node)
+
+    # 연속 reshape/permute 병합
+    for node in list(gm.graph.nodes):
+        if node.op != "call_function" or node.target not in (torch.reshape, torch.permute):
+            continue
+        inner = node.args[0]
+        if not isinstance(inner, fx.Node) or inner.target is not node.target or len(inner.users) != 1:
+            continue
+        if node.target is torch.reshape:
+            node.args = (inner.args[0], node.args[1])
+        else:
+            perm = tuple(inner.args[1][p] for p in node.args[1])
+            node.args = (inner.args[0], perm)
+        gm.graph.erase_node(inner)
+        removed += 1
+
+    # 항등 permute / 입력과 같은 shape의 reshape 제거
+    for node in list(gm.graph.nodes):
+        if node.op != "call_function":
+            continue
+        src = node.args[0] if node.args else None
+        identity = False
+        if node.target is torch.permute:
+            identity = tuple(node.args[1]) == tuple(range(len(node.args[1])))
+        elif node.target is torch.reshape and isinstance(src, fx.Node) and "tensor_meta" in src.meta:
+            identity = tuple(src.meta["tensor_meta"].shape) == tuple(node.args[1])
+        if identity:
+            node.replace_all_uses_with(src)
+            gm.graph.erase_node(node)
+            removed += 1
+    return removed
+
+
+# ========== 4. 가변 입력 해상도 ==========
+
+def _match_size(x, size):
+    """feature map을 기준 해상도 크기로 보간 (이미 같으면 그대로)"""
+    if tuple(x.shape[-2:]) == size:
+        return x
+    return F.interpolate(x, size=size, mode="bilinear", align_corners=False)
+
+
+def enable_flexible_resolution(gm, input_shape=(1, 3, 256, 256), backbone_prefix: str = "backbone") -> int:
+    """
+    backbone → 나머지(head) 경계의 4D feature map마다 _match_size 삽입
+    backbone(Conv/BN/활성화)은 입력 크기와 무관하므로 저해상도 입력에서도 head는 input_shape 기준
+    토큰 수를 그대로 받음 (Reshape 상수/positional embedding 수정 불필요)
+    """
+    if not isinstance(gm, fx.GraphModule):
+        return 0
+    training = gm.training
+    gm.eval()
+    with torch.no_grad():
+        ShapeProp(gm).propagate(torch.rand(input_shape, device=next(gm.parameters()).device))
+    gm.train(training)
+
+    def in_backbone(node):
+        return node.op == "call_module" and node.target.startswith(backbone_prefix)
+
+    inserted = 0
+    for node in list(gm.graph.nodes):
+        meta = node.meta.get("tensor_meta")
+        if not in_backbone(node) or meta is None or len(meta.shape) != 4:
+            continue
+        outside = [user for user in node.users if not in_backbone(user)]
+        if not outside:
+            continue
+        with gm.graph.inserting_after(node):
+            resized = gm.graph.call_function(_match_size, (node, tuple(meta.shape[-2:])))
+        for user in outside:
+            user.replace_input_with(node, resized)
+        inserted += 1
+
+    # 기준 해상도 shape 메타데이터 제거 (이후 패스가 256 shape로 특수화하지 않도록)
+    for node in gm.graph.nodes:
+        node.meta.pop("tensor_meta", None)
+    gm.graph.lint()
+    gm.recompile()
+    return inserted
+
+
+# ========== 5. 활성화 재계산 (gradient checkpointing) ==========
+
+_BLOCK_PATTERN = re.compile(r"blocks[/\\](\d+)[/\\]")
+
+
+class _CheckpointSegment(nn.Module):
+    """
+    segment(GraphModule)를 checkpoint로 실행 — forward activation을 저장하지 않고 backward 때 재계산
+    segment는 서브모듈로 등록하지 않음 (모듈/파라미터는 원래 이름으로 gm에만 등록 → state_dict 불변)
+    """
+
+    def __init__(self, segment):
+        super().__init__()
+        object.__setattr__(self, "segment", segment)
+        self.batch_norms = [m for m in segment.modules() if isinstance(m, nn.BatchNorm2d)]
+
+    @contextlib.contextmanager
+    def _recompute(self):
+        """재계산 forward에서는 BN running stats를 다시 갱신하지 않음 (momentum 0, 카운터 복원)"""
+        saved = [(bn.momentum, bn.num_batches_tracked.clone()) for bn in self.batch_norms]
+        for bn in self.batch_norms:
+            bn.momentum = 0.0
+        try:
+            yield
+        finally:
+            for bn, (momentum, tracked) in zip(self.batch_norms, saved):
+                bn.momentum = momentum
+                bn.num_batches_tracked.copy_(tracked)
+
+    def forward(self, *args):
+        if self.training and torch.is_grad_enabled():
+            return checkpoint(self.segment, *args, use_reentrant=False,
+                              context_fn=lambda: (contextlib.nullcontext(), self._recompute()))
+        return self.segment(*args)
+
+
+def _block_segments(gm, backbone_prefix: str = "backbone") -> dict:
+    """backbone 블록 번호 → 위상 순서상 연속된 노드 목록 (모듈 없는 함수/상수 노드는 직전 블록에 포함)"""
+    segments, current, prev = {}, None, None
+    for node in gm.graph.nodes:
+        if node.op in ("placeholder", "output"):
+            current = None
+        elif node.op == "call_module":
+            match = _BLOCK_PATTERN.search(node.target)
+            current = int(match.group(1)) if match and node.target.startswith(backbone_prefix) else None
+        if current is not None:
+            nodes = segments.setdefault(current, [])
+            if nodes and nodes[-1] is not prev:  # 블록이 끊겼다 다시 나오면 앞부분만 사용
+                current = None
+                continue
+            nodes.append(node)
+        prev = node
+    return segments
+
+
+def activation_memory(gm, trainable: set, input_shape=(1, 3, 256, 256)) -> dict:
+    """
+    backward용으로 저장될 activation 추정 (gradient가 흐르는 노드의 출력 크기 합, bytes)
+    반환: {"total": 전체, "blocks": {블록 번호: 해당 segment 저장량}}
+    """
+    training = gm.training
+    gm.eval()
+    with torch.no_grad():
+        ShapeProp(gm).propagate(torch.rand(input_shape, device=next(gm.parameters()).device))
+    gm.train(training)
+
+    grad_nodes = set()
+    for node in gm.graph.nodes:
+        needs = any(a in grad_nodes for a in node.all_input_nodes)
+        if node.op == "call_module":
+            needs |= any(f"{node.target}.{n}" in trainable for n, _ in _module(gm, node).named_parameters())
+        elif node.op == "get_attr":
+            needs |= node.target in trainable
+        if needs:
+            grad_nodes.add(node)
+
+    def nbytes(node):
+        meta = node.meta.get("tensor_meta")
+        if node not in grad_nodes or not hasattr(meta, "shape"):
+            return 0
+        return meta.shape.numel() * torch.empty((), dtype=meta.dtype).element_size()
+
+    blocks = {}
+    for block, nodes in _block_segments(gm).items():
+        inside = set(nodes)
+        saved = sum(nbytes(n) for n in nodes)
+        kept = sum(nbytes(n) for n in nodes if any(u not in inside for u in n.users))  # segment 출력은 유지
+        blocks[block] = max(0, saved - kept)
+    total = sum(nbytes(n) for n in gm.graph.nodes)
+    for node in gm.graph.nodes:
+        node.meta.pop("tensor_meta", None)
+    return {"total": total, "blocks": blocks}
+
+
+def plan_checkpointing(memory: dict, base_bytes: float, budget_bytes: float) -> list:
+    """base + activation이 예산을 넘는 동안 절약량이 큰 블록부터 재계산 대상으로 선택"""
+    need = base_bytes + memory["total"]
+    chosen = []
+    for block, saved in sorted(memory["blocks"].items(), key=lambda item: -item[1]):
+        if need <= budget_bytes or saved <= 0:
+            break
+        chosen.append(block)
+        need -= saved
+    return sorted(chosen)
+
+
+def enable_checkpointing(gm, blocks: list) -> int:
+    """선택한 backbone 블록 segment를 _CheckpointSegment 호출 하나로 치환, 치환 수 반환"""
+    if not isinstance(gm, fx.GraphModule):
+        return 0
+    segments = _block_segments(gm)
+    replaced = 0
+    for block in blocks:
+        nodes = segments.get(block)
+        if not nodes:
+            continue
+        inside = set(nodes)
+        inputs = []
+        for node in nodes:
+            inputs += [a for a in node.all_input_nodes if a not in inside and a not in inputs]
+        outputs = [n for n in nodes if any(u not in inside for u in n.users)]
+
+        graph = fx.Graph()
+        env = {a: graph.placeholder(a.name) for a in inputs}
+        for node in nodes:
+            env[node] = graph.node_copy(node, lambda n: env[n])
+        graph.output(tuple(env[n] for n in outputs))
+        name = f"_checkpoint_block_{block}"
+        gm.add_submodule(name, _CheckpointSegment(fx.GraphModule(gm, graph)))
+
+        with gm.graph.inserting_after(nodes[-1]):
+            call = gm.graph.call_module(name, tuple(inputs))
+        with gm.graph.inserting_after(call):
+            for i, node in enumerate(outputs):
+                item = gm.graph.call_function(operator.getitem, (call, i))
+                node.replace_all_uses_with(item, delete_user_cb=lambda user: user not in inside)
+        for node in reversed(nodes):
+            gm.graph.erase_node(node)
+        replaced += 1
+    gm.graph.lint()
+    gm.recompile()
+    return replaced
+
+
+# ========== 진입점 ==========
+
+def max_output_diff(reference, optimized, input_shape, n_tests: int = 3, training: bool = False) -> float:
+    """
+    eval 모드 출력 최대 차이 (랜덤 입력)
+    training=True면 train 모드(BN 배치 통계)로 비교 — running stats가 바뀌지 않도록 복사본에서 실행
+    """
+    if training:
+        reference, optimized = copy.deepcopy(reference), copy.deepcopy(optimized)
+    modes = reference.training, optimized.training
+    reference.train(training)
+    optimized.train(training)
+    diff = 0.0
+    with torch.no_grad():
+        for _ in range(n_tests):
+            x = torch.rand(input_shape)
+            for a, b in zip(reference(x), optimized(x)):
+                diff = max(diff, (a - b).abs().max().item())
+    reference.train(modes[0])
+    optimized.train(modes[1])
+    return diff
+
+
+def _compute_nodes(gm) -> int:
+    """연산 노드 수 (get_attr/placeholder/output 제외 — 융합 가중치 참조가 노드 수를 늘리지 않도록)"""
+    return sum(1 for n in gm.graph.nodes if n.op in ("call_module", "call_function", "call_method"))
+
+
+def optimize_model(model, trainable: set = None, input_shape=(1, 3, 256, 256),
+                   specialize_shapes: bool = False, atol: float = 1e-4, training: bool = False):
+    """
+    변환 모델에 그래프 정리 패스 적용 (가중치 로드 후 호출)
+    - trainable: 학습 대상 파라미터 이름 (None이면 전체 동결로 간주 → 추론용)
+    - training: 학습에 쓸 모델 — Conv+BN 융합 생략 (train 모드 BN은 배치 통계 사용),
+                train 모드 출력 차이도 검증
+    - specialize_shapes: input_shape로 Shape 계산 상수화 (다른 입력 shape는 ValueError)
+    수치 차이가 atol을 넘으면 경고 후 원본 모델 반환
+    """
+    if not isinstance(model, fx.GraphModule):
+        return model
+    trainable = trainable or set()
+    reference = copy.deepcopy(model)
+    device = next(model.parameters()).device
+
+    nodes_before = _compute_nodes(model)
+    fused = 0 if training else fuse_frozen_conv_bn(model, trainable)
+
+    if specialize_shapes:
+        placeholder = next(n for n in model.graph.nodes if n.op == "placeholder")
+        with model.graph.inserting_after(placeholder):
+            guard = model.graph.call_function(_assert_input_shape, (placeholder, tuple(input_shape)))
+        placeholder.replace_all_uses_with(guard, delete_user_cb=lambda user: user is not guard)
+        model.recompile()
+        # eval + no_grad: 학습 모드 BN의 running stats가 shape 전파 중 갱신되지 않도록
+        training = model.training
+        model.eval()
+        with torch.no_grad():
+            ShapeProp(model).propagate(torch.rand(input_shape, device=device))
+        model.train(training)
+
+    folded = fold_constants(model, specialize_shapes)
+    simplified = simplify_layout(model)
+    model.graph.eliminate_dead_code()
+    model.graph.lint()
+    model.recompile()
+    nodes_after = _compute_nodes(model)
+
+    diff = max_output_diff(reference.cpu(), model.cpu(), input_shape)
+    if training:
+        diff = max(diff, max_output_diff(reference, model, input_shape, training=True))
+    model.to(device)
+    if diff > atol:
+        print(f"  [경고] 그래프 최적화 후 출력 차이 {diff:.2e} > {atol:.0e}, 원본 모델 사용")
+        return reference.to(device)
+
+    print(f"  그래프 최적화: 연산 노드 {nodes_before} → {nodes_after} "
+          f"(Conv+BN 융합 {fused}, 상수 폴딩 {folded}, 레이아웃 정리 {simplified}, 최대 차이 {diff:.1e})")
+    return model
@@ -0,0 +1,211 @@
+"""
+메모리 사용량 추적 (opt-in)
+==========================
+OOM으로 종료되기 전에 RSS 증가를 확인할 수 있도록 구간별 메모리 스냅샷을 기록합니다.
+    - 프로세스 RSS / 최대 RSS (telemetry.current_rss_mb, peak_rss_mb)
+    - tracemalloc 상위 할당 위치 + 직전 스냅샷 대비 증가 위치 (Python/numpy 할당만, torch 텐서 저장소 제외)
+    - 자식 프로세스 RSS (비동기 검증 프로세스 등, 스냅샷 시점에 살아있는 프로세스)
+    - DataLoader 워커별 RSS 최대치 (WorkerMemory — 워커가 __getitem__마다 공유 배열에 기록)
+      (train.py 학습 DataLoader는 num_workers=0이라 메인 프로세스 RSS에 포함, 워커 항목은 검증/테스트만)
+    - 누수 의심 경고: 주기 스냅샷(학습은 에폭, 데이터 생성은 500장 단위) RSS가 연속으로 증가하고
+      누적 증가량이 임계값 이상이면 출력 + 기록
+
+tracemalloc은 Python 할당마다 추적 비용이 있어 기본 비활성입니다 (train.py / generate_synthetic_data.py --track-memory).
+
+출력: memory_profile.json (train.py는 training_history.json 옆, 데이터 생성은 데이터셋 디렉토리)
+
+사용법:
+    tracker = MemoryTracker(output_dir / "memory_profile.json")
+    tracker.start()
+    tracker.snapshot("epoch 1", periodic=True, workers={"val": val_ds.worker_memory})
+    tracker.save()
+"""
+
+import json
+import multiprocessing as mp
+import os
+import time
+import tracemalloc
+from pathlib import Path
+
+from telemetry import current_rss_mb, peak_rss_mb
+
+
+def children_rss_mb() -> dict:
+    """자식 프로세스 pid → RSS (MB) — psutil, 없으면 Linux /proc (그 외 플랫폼은 빈 dict)"""
+    try:
+        import psutil
+        result = {}
+        for child in psutil.Process().children(recursive=True):
+            try:
+                result[child.pid] = child.memory_info().rss / 2**20
+            except psutil.Error:
+                pass
+        return result
+    except ImportError:
+        pass
+    result = {}
+    page = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+    try:
+        tasks = os.listdir(f"/proc/{os.getpid()}/task")
+    except OSError:
+        return result
+    for tid in tasks:
+        try:
+            with open(f"/proc/{os.getpid()}/task/{tid}/children") as f:
+                pids = [int(p) for p in f.read().split()]
+        except OSError:
+            continue
+        for pid in pids:
+            try:
+                with open(f"/proc/{pid}/statm") as f:
+                    result[pid] = int(f.read().split()[1]) * page / 2**20
+            except (OSError, ValueError):
+                pass
+    return result
+
+
+class WorkerMemory:
+    """
+    DataLoader 워커별 RSS 최대치 (공유 배열) — Dataset 속성으로 두고 워커가 update() 호출
+    fork/spawn 모두 워커 생성 시 Dataset과 함께 전달됨. RSS는 fork 공유 페이지를 포함합니다.
+    """
+
+    def __init__(self, num_workers: int):
+        self.num_workers = num_workers
+        self._peak = mp.Array("d", max(num_workers, 1))
+
+    def update(self):
+        from torch.utils.data import get_worker_info
+        info = get_worker_info()
+        if info is None or info.id >= self.num_workers:  # 메인 프로세스 로드는 tracker가 직접 기록
+            return
+        if tracemalloc.is_tracing():  # fork로 상속된 추적은 워커에서 불필요한 비용
+            tracemalloc.stop()
+        rss = current_rss_mb()
+        with self._peak.get_lock():
+            if rss > self._peak[info.id]:
+                self._peak[info.id] = rss
+
+    def peaks(self) -> dict:
+        """워커 번호 → 최대 RSS (MB, 한 번도 실행되지 않은 워커 제외)"""
+        with self._peak.get_lock():
+            return {i: v for i, v in enumerate(self._peak[:self.num_workers]) if v > 0}
+
+
+class MemoryTracker:
+    """구간별 메모리 스냅샷 + 누수 의심 경고 (rank 0/단일 프로세스에서만 사용)"""
+
+    def __init__(self, path, enabled: bool = True, top: int = 10, frames: int = 1,
+                 leak_periods: int = 3, leak_mb: float = 20.0):
+        self.path = Path(path)
+        self.enabled = enabled
+        self.top = top
+        self.frames = frames
+        self.leak_periods = leak_periods
+        self.leak_mb = leak_mb
+        self.snapshots = []
+        self.warnings = []
+        self._previous = None
+
+    def start(self):
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def stop(self):
+        if self.enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @staticmethod
+    def _site(stat) -> dict:
+        frame = stat.traceback[0]
+        return {"site": f"{frame.filename}:{frame.lineno}", "size_mb": stat.size / 2**20, "count": stat.count}
+
+    def snapshot(self, label: str, periodic: bool = False, workers: dict = None) -> dict:
+        """
+        현재 메모리 기록 — periodic=True(에폭 끝 등 주기 스냅샷)만 누수 판정 대상
+        workers: {이름: WorkerMemory} (DataLoader 워커별 최대 RSS)
+        """
+        if not self.enabled:
+            return {}
+        entry = {
+            "label": label,
+            "time": time.time(),
+            "rss_mb": current_rss_mb(),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        if periodic:
+            entry["periodic"] = True
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            entry["traced_mb"] = current / 2**20
+            entry["traced_peak_mb"] = peak / 2**20
+            snap = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),  # 이전 스냅샷/기록 자체
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            ])
+            entry["top_sites"] = [self._site(s) for s in snap.statistics("lineno")[:self.top]]
+            if self._previous is not None:
+                growth = [s for s in snap.compare_to(self._previous, "lineno") if s.size_diff > 0][:self.top]
+                entry["growth_sites"] = [{**self._site(s), "diff_mb": s.size_diff / 2**20} for s in growth]
+            self._previous = snap
+        children = children_rss_mb()
+        if children:
+            entry["children_mb"] = {str(pid): rss for pid, rss in children.items()}
+        if workers:
+            entry["workers_mb"] = {name: {str(i): v for i, v in w.peaks().items()}
+                                   for name, w in workers.items() if w is not None}
+        self.snapshots.append(entry)
+        if periodic:
+            self._check_leak(entry)
+        return entry
+
+    def _check_leak(self, entry: dict):
+        """
+        주기 스냅샷 RSS가 leak_periods회 연속 증가하고 누적 증가량이 leak_mb 이상이면 경고
+        (첫 주기는 할당자 풀/캐시 준비 구간이라 기준에서 제외)
+        """
+        periods = [s for s in self.snapshots if s.get("periodic")][1:]
+        if len(periods) <= self.leak_periods:
+            return
+        window = periods[-(self.leak_periods + 1):]
+        rss = [s["rss_mb"] for s in window]
+        growth = rss[-1] - rss[0]
+        if all(b > a for a, b in zip(rss, rss[1:])) and growth >= self.leak_mb:
+            sites = ", ".join(f"{s['site']} +{s['diff_mb']:.1f}MB" for s in entry.get("growth_sites", [])[:3])
+            message = (f"RSS가 {self.leak_periods}회 연속 증가 ({window[0]['label']} {rss[0]:.0f}MB → "
+                       f"{entry['label']} {rss[-1]:.0f}MB, +{growth:.0f}MB) — 누수 의심")
+            if sites:
+                message += f" | 증가 위치: {sites}"
+            self.warnings.append({"label": entry["label"], "message": message})
+            print(f"    [memory] 경고: {message}")
+
+    def save(self, extra: dict = None):
+        if not self.enabled:
+            return
+        with open(self.path, "w") as f:
+            json.dump({
+                "pid": os.getpid(),
+                "tracemalloc_frames": self.frames,
+                "snapshots": self.snapshots,
+                "warnings": self.warnings,
+                **(extra or {}),
+            }, f, indent=2)
+
+    @staticmethod
+    def format(entry: dict) -> str:
+        """스냅샷 요약 한 줄"""
+        parts = [f"rss {entry['rss_mb']:.0f}MB (peak {entry['peak_rss_mb']:.0f}MB)"]
+        if "traced_mb" in entry:
+            parts.append(f"python {entry['traced_mb']:.1f}MB")
+        if entry.get("top_sites"):
+            top = entry["top_sites"][0]
+            parts.append(f"top {Path(top['site']).name} {top['size_mb']:.1f}MB")
+        if entry.get("children_mb"):
+            parts.append(f"children {sum(entry['children_mb'].values()):.0f}MB")
+        for name, peaks in entry.get("workers_mb", {}).items():
+            if peaks:
+                parts.append(f"{name} workers max {max(peaks.values()):.0f}MB")
+        return "    [memory] " + " | ".join(parts)
@@ -0,0 +1,279 @@
+"""
+변환 모델 연산자 단위 프로파일러
+=================================
+onnx2torch로 변환한 DocAligner를 PyTorch profiler로 N 학습 스텝 + N 추론 스텝 실행하고,
+원본 ONNX 노드 이름 단위로 비용을 집계합니다. 같은 그래프를 ONNX Runtime으로도
+노드별 프로파일링하여 eager PyTorch에서 특히 느린 노드(Reshape/Transpose/Resize 등)를 찾습니다.
+
+출력 (--output):
+    profile_nodes.csv    — 노드별 학습 forward / 추론 / ORT 시간 (ms/step)
+    profile_report.json  — 노드/op_type 순위 + aten 연산 상위 목록
+    trace_train.json     — 학습 스텝 Chrome trace (chrome://tracing, Perfetto)
+    trace_infer.json     — 추론 스텝 Chrome trace
+    ort_profile_*.json   — ONNX Runtime 노드 프로파일
+
+사용법:
+    python profile_model.py --steps 20
+    python profile_model.py --data tools/training/dataset --steps 50 --top 30
+"""
+
+import argparse
+import csv
+import json
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import onnx
+import torch
+from torch.profiler import ProfilerActivity, profile, record_function
+
+from convert_cache import load_converted
+from train import CornerDataset, CornerLoss, _freeze_backbone, _unfreeze_last_blocks
+
+
+# ========== 노드 스코프 ==========
+
+def _attach_node_scopes(model, op_types: dict) -> dict:
+    """
+    변환된 각 노드 모듈의 forward를 record_function 스코프로 감싸기
+    스코프 이름 = "onnx::<op_type>::<원본 노드 이름>" → profiler에서 노드 단위로 집계
+    """
+    labels = {}
+    open_scopes = {}
+
+    def pre_hook(module, inputs):
+        scope = record_function(labels[id(module)])
+        scope.__enter__()
+        open_scopes[id(module)] = scope
+
+    def post_hook(module, inputs, outputs):
+        open_scopes.pop(id(module)).__exit__(None, None, None)
+
+    for name, module in model.named_modules():
+        if not name or list(module.children()):
+            continue  # 루트/컨테이너 제외, 노드(leaf)만
+        node_name = "/" + name
+        op_type = op_types.get(node_name, type(module).__name__)
+        labels[id(module)] = f"onnx::{op_type}::{node_name}"
+        module.register_forward_pre_hook(pre_hook)
+        module.register_forward_hook(post_hook)
+    return labels
+
+
+def _node_times(prof, steps: int) -> dict:
+    """profiler 결과에서 노드 스코프별 ms/step"""
+    times = {}
+    for evt in prof.key_averages():
+        if evt.key.startswith("onnx::"):
+            times[evt.key] = evt.cpu_time_total / 1000 / steps
+    return times
+
+
+def _top_aten(prof, steps: int, top: int) -> list:
+    """aten 연산 self 시간 상위 (backward 포함)"""
+    rows = []
+    for evt in prof.key_averages():
+        if evt.key.startswith("onnx::") or evt.key.startswith("ProfilerStep"):
+            continue
+        rows.append({
+            "op": evt.key,
+            "self_ms_per_step": evt.self_cpu_time_total / 1000 / steps,
+            "calls_per_step": evt.count / steps,
+        })
+    rows.sort(key=lambda r: r["self_ms_per_step"], reverse=True)
+    return rows[:top]
+
+
+# ========== 프로파일 실행 ==========
+
+def _load_batches(args, n: int) -> list:
+    """학습/추론 입력 (--data 지정 시 실제 학습 샘플, 아니면 랜덤)"""
+    if args.data:
+        data_path = Path(args.data)
+        splits = json.loads((data_path / "splits.json").read_text())
+        ds = CornerDataset(data_path / "images", data_path / "labels", splits["train"][:n])
+        return [tuple(t.unsqueeze(0) for t in ds[i]) for i in range(len(ds))]
+
+    batches = []
+    for _ in range(n):
+        pts = torch.rand(1, 8) * 0.6 + 0.2
+        batches.append((torch.rand(1, 3, 256, 256), pts, torch.ones(1, 1)))
+    return batches
+
+
+def profile_train(model, batches, steps: int, trace_path: Path):
+    """학습 스텝 (forward + loss + backward + AdamW) 프로파일"""
+    criterion = CornerLoss(points_weight=1.0, obj_weight=0.5, area_weight=0.1)
+    optimizer = torch.optim.AdamW(filter(lambda p: p.requires_grad, model.parameters()), lr=1e-5)
+    model.train()
+
+    def step(i):
+        imgs, gt_pts, gt_obj = batches[i % len(batches)]
+        outputs = model(imgs)
+        loss, _ = criterion(outputs[0], torch.sigmoid(outputs[1]), gt_pts, gt_obj)
+        loss.backward()
+        optimizer.step()
+        optimizer.zero_grad()
+
+    for i in range(3):  # 워밍업
+        step(i)
+    with profile(activities=[ProfilerActivity.CPU], record_shapes=True) as prof:
+        for i in range(steps):
+            step(i)
+    prof.export_chrome_trace(str(trace_path))
+    return prof
+
+
+def profile_infer(model, batches, steps: int, trace_path: Path):
+    """추론 스텝 (no_grad forward) 프로파일"""
+    model.eval()
+    with torch.no_grad():
+        for i in range(3):  # 워밍업
+            model(batches[i % len(batches)][0])
+        with profile(activities=[ProfilerActivity.CPU], record_shapes=True) as prof:
+            for i in range(steps):
+                model(batches[i % len(batches)][0])
+    prof.export_chrome_trace(str(trace_path))
+    return prof
+
+
+def profile_ort(onnx_path: str, batches, steps: int, output_dir: Path) -> dict:
+    """
+    ONNX Runtime 노드별 시간 (ms/step)
+    그래프 최적화를 끄고 실행 → 노드가 융합되지 않아 PyTorch 노드와 1:1 비교 가능
+    """
+    import onnxruntime as ort
+
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+    opts.intra_op_num_threads = torch.get_num_threads()
+    opts.enable_profiling = True
+    opts.profile_file_prefix = str(output_dir / "ort_profile")
+    sess = ort.InferenceSession(onnx_path, opts, providers=["CPUExecutionProvider"])
+
+    for i in range(steps):
+        sess.run(None, {"img": batches[i % len(batches)][0].numpy()})
+    profile_path = sess.end_profiling()
+
+    times = defaultdict(float)
+    for evt in json.loads(Path(profile_path).read_text()):
+        if evt.get("cat") == "Node" and evt["name"].endswith("_kernel_time"):
+            times[evt["name"][:-len("_kernel_time")]] += evt["dur"] / 1000 / steps
+    return dict(times)
+
+
+# ========== 리포트 ==========
+
+def build_report(args):
+    torch.set_num_threads(args.threads) if args.threads else None
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"=== 연산자 프로파일 ===")
+    print(f"  모델: {args.model}")
+    print(f"  스텝: 학습 {args.steps}, 추론 {args.steps} (threads: {torch.get_num_threads()})")
+
+    onnx_model = onnx.load(args.model)
+    op_types = {node.name: node.op_type for node in onnx_model.graph.node}
+    model = load_converted(args.model)
+    if args.stage == 1:
+        _freeze_backbone(model)
+    else:
+        _unfreeze_last_blocks(model)
+    labels = _attach_node_scopes(model, op_types)
+    print(f"  노드 스코프: {len(labels)}개")
+
+    batches = _load_batches(args, min(args.steps, 32))
+
+    start = time.time()
+    train_prof = profile_train(model, batches, args.steps, output_dir / "trace_train.json")
+    print(f"  학습 프로파일 완료 ({time.time() - start:.1f}s)")
+    start = time.time()
+    infer_prof = profile_infer(model, batches, args.steps, output_dir / "trace_infer.json")
+    print(f"  추론 프로파일 완료 ({time.time() - start:.1f}s)")
+
+    train_fwd = _node_times(train_prof, args.steps)
+    infer = _node_times(infer_prof, args.steps)
+    ort_times = profile_ort(args.model, batches, args.steps, output_dir) if not args.no_ort else {}
+
+    rows = []
+    for label in set(labels.values()):
+        _, op_type, node_name = label.split("::", 2)
+        ort_ms = ort_times.get(node_name)
+        infer_ms = infer.get(label, 0.0)
+        rows.append({
+            "node": node_name,
+            "op_type": op_type,
+            "train_fwd_ms": train_fwd.get(label, 0.0),
+            "infer_ms": infer_ms,
+            "ort_ms": ort_ms,
+            "torch_vs_ort": infer_ms / ort_ms if ort_ms else None,
+        })
+    rows.sort(key=lambda r: r["infer_ms"], reverse=True)
+
+    by_op = defaultdict(lambda: {"count": 0, "train_fwd_ms": 0.0, "infer_ms": 0.0, "ort_ms": None})
+    for r in rows:
+        agg = by_op[r["op_type"]]
+        agg["count"] += 1
+        agg["train_fwd_ms"] += r["train_fwd_ms"]
+        agg["infer_ms"] += r["infer_ms"]
+        if r["ort_ms"] is not None:  # ORT가 함수 op를 전개한 노드(HardSwish 등)는 매칭 불가
+            agg["ort_ms"] = (agg["ort_ms"] or 0.0) + r["ort_ms"]
+    op_rows = sorted(({"op_type": k, **v} for k, v in by_op.items()),
+                     key=lambda r: r["infer_ms"], reverse=True)
+
+    # 출력
+    print(f"\n상위 {args.top} 노드 (추론 시간 순, ms/step)")
+    print(f"  {'#':>3} {'op_type':<20} {'train_fwd':>9} {'infer':>8} {'ort':>8} {'x':>6}  node")
+    for i, r in enumerate(rows[:args.top]):
+        ort_ms = f"{r['ort_ms']:.3f}" if r["ort_ms"] is not None else "-"
+        ratio = f"{r['torch_vs_ort']:.1f}" if r["torch_vs_ort"] else "-"
+        print(f"  {i + 1:>3} {r['op_type']:<20} {r['train_fwd_ms']:>9.3f} {r['infer_ms']:>8.3f} "
+              f"{ort_ms:>8} {ratio:>6}  {r['node']}")
+
+    print(f"\nop_type별 합계 (ms/step)")
+    print(f"  {'op_type':<20} {'count':>5} {'train_fwd':>9} {'infer':>8} {'ort':>8}")
+    for r in op_rows[:args.top]:
+        ort_ms = f"{r['ort_ms']:.3f}" if r["ort_ms"] is not None else "-"
+        print(f"  {r['op_type']:<20} {r['count']:>5} {r['train_fwd_ms']:>9.3f} "
+              f"{r['infer_ms']:>8.3f} {ort_ms:>8}")
+
+    with open(output_dir / "profile_nodes.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    with open(output_dir / "profile_report.json", "w") as f:
+        json.dump({
+            "model": args.model,
+            "steps": args.steps,
+            "threads": torch.get_num_threads(),
+            "nodes": rows,
+            "op_types": op_rows,
+            "top_aten_train": _top_aten(train_prof, args.steps, args.top),
+            "top_aten_infer": _top_aten(infer_prof, args.steps, args.top),
+        }, f, indent=2)
+
+    print(f"\n  리포트: {output_dir / 'profile_report.json'}, {output_dir / 'profile_nodes.csv'}")
+    print(f"  Trace: {output_dir / 'trace_train.json'}, {output_dir / 'trace_infer.json'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="변환 모델 연산자 단위 프로파일")
+    parser.add_argument("--model", type=str,
+                        default="assets/models/lcnet050_p_multi_decoder_l3_d64_256_fp32.onnx",
+                        help="원본 ONNX 모델 경로")
+    parser.add_argument("--data", type=str, default=None,
+                        help="학습 데이터셋 경로 (미지정시 랜덤 입력)")
+    parser.add_argument("--output", type=str, default="tools/training/profile",
+                        help="리포트/trace 출력 경로")
+    parser.add_argument("--steps", type=int, default=20, help="학습/추론 프로파일 스텝 수")
+    parser.add_argument("--top", type=int, default=25, help="출력할 상위 항목 수")
+    parser.add_argument("--stage", type=int, default=2,
+                        help="학습 스텝의 동결 설정 (1=헤드만, 2=백본 3~5+헤드)")
+    parser.add_argument("--threads", type=int, default=0, help="torch 스레드 수 (0=기본)")
+    parser.add_argument("--no-ort", action="store_true", help="ONNX Runtime 노드 비교 생략")
+    args = parser.parse_args()
+
+    build_report(args)
@@ -0,0 +1,427 @@
+"""
+구조적 채널 가지치기 + 지연 시간 목표 탐색
+=========================================
+변환 모델(torch.fx GraphModule)에서 채널 그룹을 찾아 중요도가 낮은 채널을 실제로 제거합니다
+(마스킹이 아닌 weight shape 변경 → export된 ONNX도 작아지고 빨라짐).
+
+채널 그룹: 채널을 만드는 연산(producer) → 채널별 연산(BN/활성화/depthwise Conv/상수 곱·합) → 소비 연산(consumer)
+    - backbone: Conv → BN → act → (depthwise Conv → BN → act) → Conv
+    - decoder:  상수 weight MatMul/Linear → (상수 bias Add) → act → MatMul/Linear (FFN hidden 차원)
+    Reshape/Concat/잔차 Add 등으로 채널이 다른 곳에 묶이는 그룹은 건드리지 않음 (shape 상수 수정 불필요)
+
+중요도: 검증 split 샘플의 1차 Taylor 근사 |Σ activation × gradient| (producer 출력 채널별 평균)
+
+탐색: 가지치기 비율을 이분 탐색 — 후보마다 제거 → train.py로 짧게 fine-tuning → ONNX export →
+benchmark_onnx 지연 시간 + 검증 avg_corner_dist_px 측정
+    val_dist ≤ 기준 + --tolerance-px 이면 더 많이 제거, 아니면 줄임
+    조건을 모두 만족(지연 시간 ≤ --target-ms)하는 가장 작은 모델을 doc_aligner_pruned.onnx로 저장
+
+--target-ms 등 외의 인자는 fine-tuning용 train.py 인자로 전달됩니다 (--data, --batch-size, --lr, --stage ...).
+
+사용법:
+    python prune.py --checkpoint checkpoints/checkpoint_best.pt --target-ms 15 --tolerance-px 1.0 \\
+        --data dataset --finetune-epochs 3
+    python prune.py --checkpoint checkpoints/checkpoint_best.pt --target-ms 10 --max-ratio 0.7 --search-steps 5 \\
+        --data dataset --stage 0 --stage1-epochs 1
+"""
+
+import argparse
+import copy
+import json
+import shutil
+import time
+from pathlib import Path
+
+import torch
+import torch.fx as fx
+import torch.nn as nn
+from torch.utils.data import DataLoader, Subset
+
+from export_onnx import benchmark_onnx, export_onnx, load_model
+from graph_opt import fold_constants
+from train import CornerDataset, CornerLoss, build_parser, evaluate_onnx, train
+
+# 채널별로 동작하는 (채널 수와 무관한) 모듈
+_ELEMENTWISE = {"Hardswish", "ReLU", "ReLU6", "Hardsigmoid", "Sigmoid", "SiLU", "GELU", "Tanh",
+                "Identity", "OnnxCopyIdentity", "Dropout", "OnnxClip", "OnnxErf"}
+
+
+def _module(gm, node):
+    return gm.get_submodule(node.target) if node.op == "call_module" else None
+
+
+def _get_attr_value(gm, node):
+    value = gm
+    for part in node.target.split("."):
+        value = getattr(value, part)
+    return value
+
+
+def _set_attr_value(gm, node, value):
+    *path, name = node.target.split(".")
+    owner = gm.get_submodule(".".join(path)) if path else gm
+    setattr(owner, name, value)
+
+
+def _const_weight(gm, node, index: int):
+    """node.args[index]가 다른 곳에서 쓰이지 않는 2D 상수(get_attr)면 그 노드"""
+    arg = node.args[index] if len(node.args) > index else None
+    if not isinstance(arg, fx.Node) or arg.op != "get_attr" or len(arg.users) != 1:
+        return None
+    shared = [n for n in gm.graph.nodes if n.op == "get_attr" and n.target == arg.target]
+    value = _get_attr_value(gm, arg)
+    return arg if len(shared) == 1 and isinstance(value, torch.Tensor) and value.dim() == 2 else None
+
+
+# ========== 채널 그룹 ==========
+
+def _producer(gm, node):
+    """(채널 수, 채널 축) — 채널 축 "conv": NCHW dim 1, "last": 마지막 dim"""
+    module = _module(gm, node)
+    if type(module) is nn.Conv2d and module.groups == 1:
+        return module.out_channels, "conv"
+    if type(module) is nn.Linear:
+        return module.out_features, "last"
+    if type(module).__name__ == "OnnxMatMul" and _const_weight(gm, node, 1) is not None:
+        return _get_attr_value(gm, node.args[1]).shape[1], "last"
+    return None
+
+
+def _classify(gm, user, src, channels: int, axis: str):
+    """src(채널 그룹 텐서)를 입력으로 받는 user 노드의 역할: "pass" / "consumer" / None(그룹 불가)"""
+    module = _module(gm, user)
+    name = type(module).__name__
+    first = user.args[0] is src if user.args else False
+
+    if isinstance(module, nn.BatchNorm2d) and axis == "conv" and module.num_features == channels:
+        return "pass"
+    if name in _ELEMENTWISE and first and all(a is src or not isinstance(a, fx.Node) for a in user.args):
+        return "pass"
+    if type(module) is nn.Conv2d and first and axis == "conv" and module.in_channels == channels:
+        if module.groups == channels and module.out_channels == channels:
+            return "pass"  # depthwise
+        if module.groups == 1:
+            return "consumer"
+    if type(module) is nn.Linear and first and axis == "last" and module.in_features == channels:
+        return "consumer"
+    if name == "OnnxMatMul" and first and axis == "last":
+        weight = _const_weight(gm, user, 1)
+        if weight is not None and _get_attr_value(gm, weight).shape[0] == channels:
+            return "consumer"
+    if name == "OnnxBinaryMathOperation":
+        # 상수 operand와의 채널별 합/곱 (bias Add, scale Mul)
+        others = [a for a in user.args if isinstance(a, fx.Node) and a is not src]
+        if len(others) == 1 and others[0].op == "get_attr" and len(others[0].users) == 1 \
+                and _const_axis(_get_attr_value(gm, others[0]), channels, axis) is not False:
+            return "pass"
+    return None
+
+
+def _const_axis(value, channels: int, axis: str):
+    """상수의 채널 축 (스칼라 브로드캐스트면 None, 채널별 상수가 아니면 False)"""
+    if not isinstance(value, torch.Tensor) or value.numel() == 1:
+        return None
+    dim = value.dim() - 1 if axis == "last" else value.dim() - 3  # [C], [C,1,1], [1,C,1,1]
+    if dim < 0 or value.shape[dim] != channels or value.numel() != channels:
+        return False
+    return dim
+
+
+def find_channel_groups(gm) -> list:
+    """
+    가지치기 가능한 채널 그룹 목록 [{producer, axis, channels, members, consumers}] (노드 이름 기준)
+    상수 weight의 Transpose 등은 먼저 폴딩 (MatMul weight가 get_attr 상수로 보이도록)
+    """
+    if fold_constants(gm):
+        gm.graph.eliminate_dead_code()
+        gm.recompile()
+    groups = []
+    for node in gm.graph.nodes:
+        info = _producer(gm, node)
+        if info is None:
+            continue
+        channels, axis = info
+        members, consumers, frontier, ok = [], [], [node], True
+        while frontier and ok:
+            src = frontier.pop()
+            for user in src.users:
+                role = _classify(gm, user, src, channels, axis)
+                if role is None:
+                    ok = False
+                    break
+                if role == "consumer":
+                    consumers.append(user.name)
+                elif user.name not in members:
+                    members.append(user.name)
+                    frontier.append(user)
+        if ok and consumers:
+            groups.append({"producer": node.name, "axis": axis, "channels": channels,
+                           "members": members, "consumers": consumers})
+    return groups
+
+
+# ========== 중요도 ==========
+
+def channel_importance(gm, groups: list, dataloader, criterion, n_samples: int = 64) -> dict:
+    """producer 출력 채널별 1차 Taylor 중요도 |Σ a·g| (샘플 평균), {producer 이름: [C] 텐서}"""
+    nodes = {n.name: n for n in gm.graph.nodes}
+    scores = {g["producer"]: torch.zeros(g["channels"]) for g in groups}
+    handles = []
+
+    def hook_for(group):
+        def forward_hook(module, inputs, output):
+            channel_dim = 1 if group["axis"] == "conv" else output.dim() - 1
+            dims = [d for d in range(output.dim()) if d != channel_dim]
+
+            def grad_hook(grad):
+                scores[group["producer"]] += (output.detach() * grad).sum(dim=dims).abs().cpu()
+            output.register_hook(grad_hook)
+        return forward_hook
+
+    for group in groups:
+        module = _module(gm, nodes[group["producer"]])
+        handles.append(module.register_forward_hook(hook_for(group)))
+
+    requires_grad = {name: p.requires_grad for name, p in gm.named_parameters()}
+    for p in gm.parameters():
+        p.requires_grad_(True)
+    gm.eval()
+    seen = 0
+    for imgs, gt_pts, gt_obj in dataloader:
+        for i in range(imgs.size(0)):
+            outputs = gm(imgs[i:i + 1])
+            loss, _ = criterion(outputs[0], torch.sigmoid(outputs[1]), gt_pts[i:i + 1], gt_obj[i:i + 1])
+            gm.zero_grad(set_to_none=True)
+            loss.backward()
+            seen += 1
+            if seen >= n_samples:
+                break
+        if seen >= n_samples:
+            break
+
+    for handle in handles:
+        handle.remove()
+    for name, p in gm.named_parameters():
+        p.requires_grad_(requires_grad[name])
+        p.grad = None
+    return {name: s / max(seen, 1) for name, s in scores.items()}
+
+
+# ========== 구조적 제거 ==========
+
+def _keep_count(channels: int, ratio: float, multiple: int = 8) -> int:
+    """제거 후 남길 채널 수 (SIMD 친화적인 multiple 배수, 최소 multiple)"""
+    keep = int(round(channels * (1 - ratio) / multiple)) * multiple
+    return min(channels, max(multiple, keep))
+
+
+def _index_param(module, name: str, keep, dim: int):
+    tensor = getattr(module, name)
+    if tensor is None:
+        return
+    value = tensor.data.index_select(dim, keep.to(tensor.device)).clone()
+    if isinstance(tensor, nn.Parameter):
+        setattr(module, name, nn.Parameter(value, requires_grad=tensor.requires_grad))
+    else:
+        setattr(module, name, value)
+
+
+def prune_channels(gm, groups: list, importance: dict, ratio: float) -> int:
+    """각 그룹에서 중요도 하위 ratio 비율 채널 제거 (제자리), 제거한 채널 수 반환"""
+    nodes = {n.name: n for n in gm.graph.nodes}
+    removed = 0
+    for group in groups:
+        channels = group["channels"]
+        keep_n = _keep_count(channels, ratio)
+        if keep_n >= channels:
+            continue
+        keep = importance[group["producer"]].topk(keep_n).indices.sort().values
+        removed += channels - keep_n
+        axis = group["axis"]
+
+        # producer: 출력 채널
+        node = nodes[group["producer"]]
+        module = _module(gm, node)
+        if isinstance(module, nn.Conv2d):
+            _index_param(module, "weight", keep, 0)
+            _index_param(module, "bias", keep, 0)
+            module.out_channels = keep_n
+        elif isinstance(module, nn.Linear):
+            _index_param(module, "weight", keep, 0)
+            _index_param(module, "bias", keep, 0)
+            module.out_features = keep_n
+        else:  # 상수 weight MatMul [K, N]
+            weight = node.args[1]
+            _set_attr_value(gm, weight, _get_attr_value(gm, weight).index_select(1, keep).clone())
+
+        # 채널별 연산
+        for name in group["members"]:
+            node = nodes[name]
+            module = _module(gm, node)
+            if isinstance(module, nn.BatchNorm2d):
+                for attr in ("weight", "bias", "running_mean", "running_var"):
+                    _index_param(module, attr, keep, 0)
+                module.num_features = keep_n
+            elif isinstance(module, nn.Conv2d):  # depthwise
+                _index_param(module, "weight", keep, 0)
+                _index_param(module, "bias", keep, 0)
+                module.in_channels = module.out_channels = module.groups = keep_n
+            elif type(module).__name__ == "OnnxBinaryMathOperation":
+                const = next(a for a in node.args if isinstance(a, fx.Node) and a.op == "get_attr")
+                value = _get_attr_value(gm, const)
+                dim = _const_axis(value, channels, axis)
+                if dim is not None:
+                    _set_attr_value(gm, const, value.index_select(dim, keep).clone())
+
+        # consumer: 입력 채널
+        for name in group["consumers"]:
+            node = nodes[name]
+            module = _module(gm, node)
+            if isinstance(module, nn.Conv2d):
+                _index_param(module, "weight", keep, 1)
+                module.in_channels = keep_n
+            elif isinstance(module, nn.Linear):
+                _index_param(module, "weight", keep, 1)
+                module.in_features = keep_n
+            else:
+                weight = node.args[1]
+                _set_attr_value(gm, weight, _get_attr_value(gm, weight).index_select(0, keep).clone())
+    return removed
+
+
+# ========== 지연 시간 목표 탐색 ==========
+
+def _measure(onnx_path: Path, val_dl, criterion) -> dict:
+    metrics = evaluate_onnx(onnx_path, val_dl, criterion)
+    return {
+        "latency_ms": benchmark_onnx(str(onnx_path)),
+        "size_mb": onnx_path.stat().st_size / 1024 / 1024,
+        "val_dist": metrics["avg_corner_dist_px"],
+        "val_success": metrics["success_rate_10px"],
+    }
+
+
+def _candidate(model, groups, importance, ratio: float, train_args, finetune_epochs: int,
+               out_dir: Path, val_dl, criterion) -> dict:
+    """비율 ratio로 제거 → train.py fine-tuning → ONNX export → 측정"""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    pruned = copy.deepcopy(model)
+    removed = prune_channels(pruned, groups, importance, ratio)
+    params = sum(p.numel() for p in pruned.parameters())
+    pruned_onnx = out_dir / "pruned.onnx"
+    export_onnx(pruned, str(pruned_onnx))
+
+    if finetune_epochs > 0:
+        # 제거된 ONNX를 원본 모델로 삼아 train.py로 fine-tuning (가중치는 ONNX initializer로 전달)
+        args = argparse.Namespace(**{**vars(train_args), "model": str(pruned_onnx), "output": str(out_dir),
+                                     "epochs": finetune_epochs, "resume": None, "no_convert_cache": True})
+        finetuned, _ = train(args)
+        final_onnx = out_dir / "pruned_finetuned.onnx"
+        export_onnx(finetuned, str(final_onnx))
+    else:
+        final_onnx = pruned_onnx
+
+    result = {"ratio": ratio, "removed_channels": removed, "params": params, "onnx": str(final_onnx)}
+    result.update(_measure(final_onnx, val_dl, criterion))
+    return result
+
+
+def search(model, train_args, target_ms: float, tolerance_px: float, output_dir: Path,
+           max_ratio: float = 0.75, steps: int = 4, finetune_epochs: int = 3, n_importance: int = 64) -> dict:
+    """목표 지연 시간/정확도 허용치를 만족하는 최대 가지치기 비율 이분 탐색"""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    data_path = Path(train_args.data)
+    splits = json.loads((data_path / "splits.json").read_text())
+    cache_dir = data_path / "cache" if train_args.data_cache else None
+    val_ds = CornerDataset(data_path / "images", data_path / "labels", splits["val"], augment=False,
+                           cache_dir=cache_dir)
+    val_dl = DataLoader(val_ds, batch_size=train_args.val_batch_size, shuffle=False)
+    criterion = CornerLoss(points_weight=train_args.points_weight, obj_weight=train_args.obj_weight,
+                           area_weight=train_args.area_weight)
+
+    groups = find_channel_groups(model)
+    total = sum(g["channels"] for g in groups)
+    print(f"\n채널 그룹: {len(groups)}개, 채널 {total}개 "
+          f"(conv {sum(g['axis'] == 'conv' for g in groups)}, FFN {sum(g['axis'] == 'last' for g in groups)})")
+    if not groups:
+        raise RuntimeError("가지치기 가능한 채널 그룹이 없습니다")
+
+    print(f"채널 중요도 계산 (검증 {min(n_importance, len(val_ds))}장, 1차 Taylor)...")
+    start = time.time()
+    importance = channel_importance(model, groups, DataLoader(Subset(val_ds, range(min(n_importance, len(val_ds))))),
+                                    criterion, n_importance)
+    print(f"  완료 ({time.time() - start:.1f}초)")
+
+    baseline_onnx = output_dir / "baseline.onnx"
+    export_onnx(model, str(baseline_onnx))
+    baseline = {"ratio": 0.0, "removed_channels": 0, "params": sum(p.numel() for p in model.parameters()),
+                "onnx": str(baseline_onnx), **_measure(baseline_onnx, val_dl, criterion)}
+    limit = baseline["val_dist"] + tolerance_px
+    print(f"\n기준: {baseline['latency_ms']:.2f}ms, val_dist {baseline['val_dist']:.2f}px "
+          f"→ 목표 ≤ {target_ms:.2f}ms, val_dist ≤ {limit:.2f}px")
+
+    results, best = [baseline], baseline if baseline["latency_ms"] <= target_ms else None
+    lo, hi = 0.0, max_ratio
+    for step in range(steps):
+        ratio = round((lo + hi) / 2, 3)
+        print(f"\n=== 탐색 {step + 1}/{steps}: 채널 {ratio:.0%} 제거 ===")
+        result = _candidate(model, groups, importance, ratio, train_args, finetune_epochs,
+                            output_dir / f"ratio_{ratio:.3f}", val_dl, criterion)
+        result["accurate"] = result["val_dist"] <= limit
+        result["fast"] = result["latency_ms"] <= target_ms
+        results.append(result)
+        print(f"  → {result['latency_ms']:.2f}ms, val_dist {result['val_dist']:.2f}px, "
+              f"params {result['params']:,} ({'정확도 OK' if result['accurate'] else '정확도 초과'}, "
+              f"{'목표 달성' if result['fast'] else '목표 미달'})")
+        if result["accurate"]:
+            lo = ratio
+            if result["fast"] and (best is None or ratio > best["ratio"]):
+                best = result
+        else:
+            hi = ratio
+
+    _print_results(results, best)
+    summary = {"target_ms": target_ms, "tolerance_px": tolerance_px, "baseline": baseline,
+               "best": best, "results": results}
+    with open(output_dir / "prune_results.json", "w") as f:
+        json.dump(summary, f, indent=2)
+    if best is not None:
+        shutil.copy(best["onnx"], output_dir / "doc_aligner_pruned.onnx")
+        print(f"\n  선택: {best['ratio']:.0%} 제거 → {output_dir / 'doc_aligner_pruned.onnx'}")
+    else:
+        print(f"\n  [경고] 목표 {target_ms:.2f}ms + 허용치 {tolerance_px}px를 동시에 만족하는 후보 없음")
+    return summary
+
+
+def _print_results(results: list, best):
+    print(f"\n{'=' * 80}")
+    print(f"  {'ratio':>6} {'params':>10} {'size':>8} {'latency':>10} {'val_dist':>9} {'ok@10px':>8}")
+    for r in sorted(results, key=lambda r: r["ratio"]):
+        mark = " *" if r is best else ""
+        print(f"  {r['ratio']:>6.0%} {r['params']:>10,} {r['size_mb']:>6.2f}MB {r['latency_ms']:>8.2f}ms "
+              f"{r['val_dist']:>7.2f}px {r['val_success']:>8.1%}{mark}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DocAligner 구조적 채널 가지치기")
+    parser.add_argument("--checkpoint", type=str, required=True, help="가지치기할 학습 체크포인트")
+    parser.add_argument("--target-ms", type=float, required=True, help="benchmark_onnx 목표 지연 시간 (ms/image)")
+    parser.add_argument("--tolerance-px", type=float, default=1.0,
+                        help="허용 val avg_corner_dist_px 증가량 (가지치기 전 대비)")
+    parser.add_argument("--max-ratio", type=float, default=0.75, help="탐색할 최대 채널 제거 비율")
+    parser.add_argument("--search-steps", type=int, default=4, help="이분 탐색 횟수")
+    parser.add_argument("--finetune-epochs", type=int, default=3, help="후보별 train.py fine-tuning 에폭")
+    parser.add_argument("--importance-samples", type=int, default=64, help="중요도 계산에 쓸 검증 샘플 수")
+    parser.add_argument("--prune-dir", type=str, default=None,
+                        help="출력 경로 (기본: 체크포인트 폴더/pruned)")
+    prune_args, rest = parser.parse_known_args()
+
+    # 나머지 인자는 fine-tuning용 train.py 인자 (기본 Stage 2: backbone 뒤쪽 + head)
+    train_args = build_parser().parse_args(["--stage", "2", "--val-interval", "1"] + rest)
+    model = load_model(train_args.model, prune_args.checkpoint, graph_opt=False,
+                       use_cache=not train_args.no_convert_cache)
+    output_dir = Path(prune_args.prune_dir or Path(prune_args.checkpoint).parent / "pruned")
+
+    search(model, train_args, prune_args.target_ms, prune_args.tolerance_px, output_dir,
+           max_ratio=prune_args.max_ratio, steps=prune_args.search_steps,
+           finetune_epochs=prune_args.finetune_epochs, n_importance=prune_args.importance_samples)
@@ -0,0 +1,172 @@
+"""
+양자화 인식 학습 (QAT)
+=====================
+export_onnx.quantize_onnx의 동적 양자화는 학습과 무관하게 가중치만 INT8로 바꾸므로
+배포 모델의 코너 정확도가 fp32보다 떨어질 수 있습니다.
+이 모듈은 변환 모델(torch.fx GraphModule)에 fake-quant를 삽입해 양자화 오차를 포함한 채
+fine-tuning할 수 있게 합니다 (train.py --stage 3).
+
+    1. Conv+BN 전체 융합    — BN은 Conv weight/bias 파라미터로 흡수 (학습 가능, export 시 BN 없음)
+    2. weight fake-quant   — Conv/Linear: int8 대칭 per-channel, 상수 weight MatMul: int8 대칭 per-tensor
+    3. activation fake-quant — Conv/Linear/MatMul 입력과 출력: uint8 비대칭 per-tensor (moving average min/max)
+                              (모델 출력으로 바로 이어지는 마지막 레이어의 출력은 fp32 유지 → 좌표 해상도 보존)
+
+torch.onnx.export 시 FakeQuantize는 QuantizeLinear/DequantizeLinear 쌍으로 변환되어 QDQ INT8 ONNX가 되고,
+ONNX Runtime이 DQ → Conv → Q 패턴을 QLinearConv 등 INT8 커널로 융합합니다.
+
+fp32 가중치를 로드한 뒤에 적용해야 합니다 (BN 융합은 적용 시점의 running stats 사용).
+QAT 체크포인트는 prepare_qat() 적용 후의 state_dict이므로, 로드할 때도 먼저 prepare_qat()을 적용합니다.
+
+사용법:
+    from qat import prepare_qat, set_qat_observers
+    model.load_state_dict(fp32_ckpt["model"])
+    model = prepare_qat(model)
+    set_qat_observers(model, False)  # 검증/export 전 (양자화 범위 고정)
+"""
+
+import torch
+import torch.ao.nn.qat as nnqat
+import torch.fx as fx
+import torch.nn as nn
+from torch.ao.quantization import (FakeQuantize, MovingAverageMinMaxObserver,
+                                   MovingAveragePerChannelMinMaxObserver, QConfig,
+                                   disable_observer, enable_observer)
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+# ONNX QuantizeLinear로 export 가능한 범위: activation uint8 [0, 255], weight int8 [-128, 127]
+ACTIVATION_FAKE_QUANT = FakeQuantize.with_args(
+    observer=MovingAverageMinMaxObserver, quant_min=0, quant_max=255,
+    dtype=torch.quint8, qscheme=torch.per_tensor_affine)
+WEIGHT_FAKE_QUANT = FakeQuantize.with_args(
+    observer=MovingAveragePerChannelMinMaxObserver, quant_min=-128, quant_max=127,
+    dtype=torch.qint8, qscheme=torch.per_channel_symmetric, ch_axis=0)
+TENSOR_WEIGHT_FAKE_QUANT = FakeQuantize.with_args(
+    observer=MovingAverageMinMaxObserver, quant_min=-128, quant_max=127,
+    dtype=torch.qint8, qscheme=torch.per_tensor_symmetric)
+QAT_QCONFIG = QConfig(activation=ACTIVATION_FAKE_QUANT, weight=WEIGHT_FAKE_QUANT)
+
+_QAT_MODULES = {nn.Conv2d: nnqat.Conv2d, nn.Linear: nnqat.Linear}
+
+
+def _module(gm, node):
+    return gm.get_submodule(node.target) if node.op == "call_module" else None
+
+
+def _is_quantized_op(gm, node) -> bool:
+    module = _module(gm, node)
+    return isinstance(module, (nn.Conv2d, nn.Linear)) or type(module).__name__ == "OnnxMatMul"
+
+
+def _is_fake_quant(gm, node) -> bool:
+    return isinstance(_module(gm, node), FakeQuantize)
+
+
+# ========== 1. Conv+BN 융합 ==========
+
+def fuse_all_conv_bn(gm) -> int:
+    """Conv2d → BatchNorm2d 쌍을 Conv2d 하나로 융합 (융합 weight/bias는 학습 가능한 파라미터)"""
+    fused = 0
+    for node in list(gm.graph.nodes):
+        bn = _module(gm, node)
+        if not isinstance(bn, nn.BatchNorm2d) or not bn.track_running_stats:
+            continue
+        conv_node = node.args[0]
+        conv = _module(gm, conv_node) if isinstance(conv_node, fx.Node) else None
+        if type(conv) is not nn.Conv2d or len(conv_node.users) != 1:
+            continue
+        training = conv.training
+        new_conv = fuse_conv_bn_eval(conv.eval(), bn.eval()).train(training)
+        gm.add_submodule(conv_node.target, new_conv)
+
+        node.replace_all_uses_with(conv_node)
+        gm.graph.erase_node(node)
+        gm.delete_submodule(node.target)
+        fused += 1
+    return fused
+
+
+# ========== 2. fake-quant 삽입 ==========
+
+def _fake_quant_after(gm, node, factory, done: dict):
+    """node 출력 뒤에 FakeQuantize 삽입 (모든 사용처가 양자화된 값을 받음), 이미 있으면 재사용"""
+    if _is_fake_quant(gm, node):
+        return node
+    if node in done:
+        return done[node]
+    name = f"_fake_quant_{len(done)}"
+    gm.add_submodule(name, factory())
+    with gm.graph.inserting_after(node):
+        fq = gm.graph.call_module(name, (node,))
+    node.replace_all_uses_with(fq, delete_user_cb=lambda user: user is not fq)
+    done[node] = fq
+    return fq
+
+
+def _feeds_output(gm, node) -> bool:
+    """양자화 연산을 거치지 않고 그래프 출력에 도달하면 True (마지막 레이어 판별)"""
+    stack, seen = list(node.users), set()
+    while stack:
+        user = stack.pop()
+        if user in seen:
+            continue
+        seen.add(user)
+        if user.op == "output":
+            return True
+        if not _is_quantized_op(gm, user):
+            stack.extend(user.users)
+    return False
+
+
+def insert_fake_quant(gm) -> tuple:
+    """Conv/Linear → QAT 모듈 교체 + activation/상수 weight fake-quant 삽입, (교체 수, 삽입 수) 반환"""
+    swapped = 0
+    targets = [node for node in gm.graph.nodes if _is_quantized_op(gm, node)]
+    for node in targets:
+        module = _module(gm, node)
+        qat_cls = _QAT_MODULES.get(type(module))
+        if qat_cls is not None:
+            module.qconfig = QAT_QCONFIG
+            gm.add_submodule(node.target, qat_cls.from_float(module))
+            swapped += 1
+
+    done = {}
+    for node in targets:
+        if type(_module(gm, node)).__name__ == "OnnxMatMul":
+            inputs = node.args[:2]
+        else:
+            inputs = node.args[:1]
+        for arg in inputs:
+            if not isinstance(arg, fx.Node):
+                continue
+            factory = TENSOR_WEIGHT_FAKE_QUANT if arg.op == "get_attr" else ACTIVATION_FAKE_QUANT
+            _fake_quant_after(gm, arg, factory, done)
+        if not _feeds_output(gm, node):
+            _fake_quant_after(gm, node, ACTIVATION_FAKE_QUANT, done)
+    return swapped, len(done)
+
+
+# ========== 진입점 ==========
+
+def set_qat_observers(model, enabled: bool):
+    """양자화 범위 관측 on/off (검증/export 전에는 off → scale/zero_point 고정)"""
+    model.apply(enable_observer if enabled else disable_observer)
+
+
+def is_qat_model(model) -> bool:
+    return any(isinstance(m, FakeQuantize) for m in model.modules())
+
+
+def prepare_qat(model):
+    """변환 모델에 Conv+BN 융합 + fake-quant 삽입 (fp32 가중치 로드 후 호출, 제자리 변경)"""
+    if not isinstance(model, fx.GraphModule):
+        raise TypeError("prepare_qat은 onnx2torch 변환 모델(GraphModule)에만 적용됩니다")
+    device = next(model.parameters()).device
+    nodes_before = len(model.graph.nodes)
+    fused = fuse_all_conv_bn(model)
+    swapped, inserted = insert_fake_quant(model)
+    model.graph.lint()
+    model.recompile()
+    model.to(device)
+    print(f"  QAT 준비: 노드 {nodes_before} → {len(model.graph.nodes)} "
+          f"(Conv+BN 융합 {fused}, weight fake-quant {swapped}, activation/상수 fake-quant {inserted})")
+    return model
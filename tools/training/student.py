@@ -0,0 +1,72 @@
+"""
+지식 증류용 경량 student 모델
+============================
+teacher(lcnet050 + multi decoder)보다 좁고 얕은 PP-LCNet 스타일 네트워크입니다.
+    - backbone: depthwise separable 블록 (폭 = LCNet 채널 × width, 256 채널 단계 반복 수 = depth)
+    - head: 1x1 Conv → 4x4 평균 풀링 → MLP → points(8, sigmoid) / has_obj(1, logit)
+
+출력 형식은 onnx2torch 변환 teacher와 같으므로 (points, has_obj) 평가/ONNX export 경로를 그대로 사용합니다.
+네이티브 PyTorch 모듈이라 batch/입력 해상도 제한이 없습니다.
+
+사용법:
+    from student import build_student
+    model = build_student(width=0.25, depth=2)
+"""
+
+import torch
+import torch.nn as nn
+
+# PP-LCNet x1.0 채널/stride (stem 이후), 256 채널 단계는 depth만큼 반복
+_STAGES = [(32, 1), (64, 2), (64, 1), (128, 2), (128, 1), (256, 2)]
+_DEEP_CHANNELS = 256
+_LAST_STAGE = [(512, 2), (512, 1)]
+
+
+def _channels(c: int, width: float) -> int:
+    return max(8, int(c * width + 4) // 8 * 8)
+
+
+class _ConvBNAct(nn.Sequential):
+    def __init__(self, c_in: int, c_out: int, kernel: int = 1, stride: int = 1, groups: int = 1):
+        super().__init__(
+            nn.Conv2d(c_in, c_out, kernel, stride, kernel // 2, groups=groups, bias=False),
+            nn.BatchNorm2d(c_out),
+            nn.Hardswish(),
+        )
+
+
+class _DepthwiseSeparable(nn.Sequential):
+    def __init__(self, c_in: int, c_out: int, stride: int):
+        super().__init__(
+            _ConvBNAct(c_in, c_in, 3, stride, groups=c_in),
+            _ConvBNAct(c_in, c_out),
+        )
+
+
+class StudentDetector(nn.Module):
+    """경량 코너 검출기 — forward(img [B,3,H,W]) → (points [B,8], has_obj logit [B,1])"""
+
+    def __init__(self, width: float = 0.25, depth: int = 2, hidden: int = 128):
+        super().__init__()
+        stages = _STAGES + [(_DEEP_CHANNELS, 1)] * depth + _LAST_STAGE
+        c_in = _channels(16, width)
+        layers = [_ConvBNAct(3, c_in, 3, 2)]
+        for c, stride in stages:
+            c_out = _channels(c, width)
+            layers.append(_DepthwiseSeparable(c_in, c_out, stride))
+            c_in = c_out
+        self.backbone = nn.Sequential(*layers)
+
+        c_head = _channels(64, width * 2)
+        self.neck = nn.Sequential(_ConvBNAct(c_in, c_head), nn.AdaptiveAvgPool2d(4), nn.Flatten())
+        self.head = nn.Sequential(nn.Linear(c_head * 16, hidden), nn.Hardswish())
+        self.points = nn.Linear(hidden, 8)
+        self.has_obj = nn.Linear(hidden, 1)
+
+    def forward(self, x):
+        feat = self.head(self.neck(self.backbone(x)))
+        return torch.sigmoid(self.points(feat)), self.has_obj(feat)
+
+
+def build_student(width: float = 0.25, depth: int = 2) -> StudentDetector:
+    return StudentDetector(width=width, depth=depth)
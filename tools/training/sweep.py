@@ -0,0 +1,238 @@
+"""
+하이퍼파라미터 스윕
+==================
+train.py 설정 조합을 프로세스 풀에서 동시에 실행합니다.
+    - trial마다 torch 스레드 수 제한 (코어 / 동시 실행 수)
+    - 모든 trial이 디코드 완료 memmap 데이터 캐시 하나를 공유 (<data>/cache, --data-cache)
+    - 중간 val_dist 중앙값 기준 가지치기: 같은 에폭까지의 best가 다른 trial 중앙값보다 나쁘면 중단
+    - 결과를 비교 표로 출력 + sweep_results.csv / sweep_results.json 저장
+
+--param 외의 인자는 모든 trial의 train.py 기본 인자로 전달됩니다.
+
+사용법:
+    python sweep.py --data dataset --epochs 30 --val-interval 2 \\
+        --param lr=1e-4,3e-4,1e-3 --param weight_decay=1e-5,1e-4 --parallel 4
+    python sweep.py --data dataset --param points_weight=1,2 --param obj_weight=0.25,0.5 \\
+        --param stage1_epochs=10,20 --max-trials 6 --graph-opt
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing as mp
+import os
+import random
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from train import build_data_cache, build_parser, train
+
+
+# ========== 설정 조합 ==========
+
+def _parse_params(specs: list, train_parser) -> dict:
+    """["lr=1e-4,3e-4", ...] → {"lr": [1e-4, 3e-4]} (train.py 인자 타입으로 변환)"""
+    actions = {a.dest: a for a in train_parser._actions}
+    grid = {}
+    for spec in specs:
+        name, values = spec.split("=", 1)
+        dest = name.strip().lstrip("-").replace("-", "_")
+        if dest not in actions:
+            raise ValueError(f"train.py에 없는 인자: {name}")
+        action = actions[dest]
+        if action.type is None and isinstance(action.default, bool):  # store_true
+            convert = lambda v: v.lower() in ("1", "true", "yes")
+        else:
+            convert = action.type or str
+        grid[dest] = [convert(v) for v in values.split(",")]
+    return grid
+
+
+def _trial_configs(grid: dict, max_trials: int, seed: int) -> list:
+    names = list(grid)
+    configs = [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+    if max_trials and len(configs) > max_trials:
+        configs = random.Random(seed).sample(configs, max_trials)
+    return configs
+
+
+# ========== 가지치기 ==========
+
+class MedianPruner:
+    """
+    중간 val_dist 중앙값 규칙 (trial 프로세스 안에서 train()의 report 콜백으로 호출)
+    board: trial_id → {epoch: val_dist} (Manager dict, 모든 trial 공유)
+    """
+
+    def __init__(self, board, trial_id: int, warmup: int, min_trials: int):
+        self.board = board
+        self.trial_id = trial_id
+        self.warmup = warmup
+        self.min_trials = min_trials
+
+    def __call__(self, history: list):
+        if not history:
+            return None
+        curve = {h["epoch"]: h["val_dist"] for h in history}
+        self.board[self.trial_id] = curve
+        epoch = max(curve)
+        best = min(curve.values())
+        if epoch < self.warmup:
+            return None
+
+        # 같은 에폭까지 진행한(또는 끝난) 다른 trial들의 그 시점 best
+        others = []
+        for trial_id, other in self.board.items():
+            if trial_id == self.trial_id or not other or max(other) < epoch:
+                continue
+            others.append(min(v for e, v in other.items() if e <= epoch))
+        if len(others) < self.min_trials:
+            return None
+        median = float(np.median(others))
+        if best > median:
+            return f"pruned (best {best:.1f}px > median {median:.1f}px @ epoch {epoch})"
+        return None
+
+
+# ========== trial 실행 ==========
+
+def _init_worker():
+    torch.set_num_interop_threads(1)  # 프로세스당 한 번만 설정 가능 → 풀 워커 초기화 시
+
+
+def _run_trial(trial_id: int, args_dict: dict, threads: int, board, warmup: int, min_trials: int) -> dict:
+    """풀 워커 본체 — 스레드 제한 후 train() 실행, 출력은 trial 디렉토리의 train.log"""
+    torch.set_num_threads(threads)
+    args = argparse.Namespace(**args_dict)
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    sys.stdout = sys.stderr = open(output_dir / "train.log", "w", buffering=1)
+
+    start = time.time()
+    status = "ok"
+    try:
+        train(args, report=MedianPruner(board, trial_id, warmup, min_trials))
+    except Exception:
+        traceback.print_exc()
+        status = "failed"
+    elapsed = time.time() - start
+
+    result = {"trial": trial_id, "status": status, "elapsed_seconds": elapsed}
+    history_path = output_dir / "training_history.json"
+    if status == "ok" and history_path.exists():
+        summary = json.loads(history_path.read_text())
+        stop_reason = summary.get("stop_reason") or ""
+        result.update({
+            "status": "pruned" if stop_reason.startswith("pruned") else ("stopped" if stop_reason else "ok"),
+            "best_val_dist": summary["best_val_dist"],
+            "test_dist": summary["test_metrics"]["avg_corner_dist_px"],
+            "test_success": summary["test_metrics"]["success_rate_10px"],
+            "epochs": summary.get("epochs_completed", args.epochs),
+        })
+    return result
+
+
+def run_sweep(base_args, grid: dict, sweep_dir: Path, parallel: int, threads: int,
+              max_trials: int = 0, warmup: int = 4, min_trials: int = 2, seed: int = 0) -> list:
+    configs = _trial_configs(grid, max_trials, seed)
+    sweep_dir.mkdir(parents=True, exist_ok=True)
+    print(f"=== 하이퍼파라미터 스윕 ===")
+    print(f"  trial: {len(configs)}개, 동시 실행: {parallel}, trial당 스레드: {threads}")
+    print(f"  가지치기: epoch {warmup} 이후, 비교 trial {min_trials}개 이상일 때 중앙값 기준")
+
+    # 모든 trial이 공유할 디코드 캐시를 먼저 생성
+    build_data_cache(base_args.data)
+    base_args.data_cache = True
+
+    ctx = mp.get_context("spawn")
+    manager = ctx.Manager()
+    board = manager.dict()
+    results = []
+    with ProcessPoolExecutor(max_workers=parallel, mp_context=ctx, initializer=_init_worker) as pool:
+        futures = {}
+        for trial_id, config in enumerate(configs):
+            args_dict = {**vars(base_args), **config, "output": str(sweep_dir / f"trial_{trial_id:03d}")}
+            future = pool.submit(_run_trial, trial_id, args_dict, threads, board, warmup, min_trials)
+            futures[future] = config
+        for future in as_completed(futures):
+            result = {**future.result(), "params": futures[future]}
+            results.append(result)
+            line = f"  trial {result['trial']:3d} [{result['status']:7s}] {_format_params(result['params'])}"
+            if "best_val_dist" in result:
+                line += f" | best_val_dist={result['best_val_dist']:.2f}px ({result['epochs']} epochs)"
+            print(line)
+    manager.shutdown()
+
+    results.sort(key=lambda r: r.get("best_val_dist", float("inf")))
+    _save_results(results, list(grid), sweep_dir)
+    return results
+
+
+# ========== 결과 표 ==========
+
+def _format_params(params: dict) -> str:
+    return " ".join(f"{k}={v}" for k, v in params.items())
+
+
+def _save_results(results: list, names: list, sweep_dir: Path):
+    columns = ["trial"] + names + ["status", "best_val_dist", "test_dist", "test_success", "epochs",
+                                   "elapsed_seconds"]
+    rows = [{"trial": r["trial"], **r["params"], **{c: r.get(c) for c in columns[len(names) + 1:]}}
+            for r in results]
+
+    with open(sweep_dir / "sweep_results.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(sweep_dir / "sweep_results.json", "w") as f:
+        json.dump(rows, f, indent=2)
+
+    print(f"\n{'=' * 100}")
+    widths = {n: max(12, len(n)) for n in names}
+    header = f"{'trial':>5} | " + " | ".join(f"{n:>{widths[n]}}" for n in names)
+    header += f" | {'status':>7} | {'val_dist':>8} | {'test_dist':>9} | {'test_ok':>7} | {'epochs':>6} | {'min':>6}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        line = f"{row['trial']:>5} | " + " | ".join(f"{str(row[n]):>{widths[n]}}" for n in names)
+        if row["best_val_dist"] is None:
+            line += f" | {row['status']:>7} | {'-':>8} | {'-':>9} | {'-':>7} | {'-':>6} | {row['elapsed_seconds'] / 60:>6.1f}"
+        else:
+            line += (f" | {row['status']:>7} | {row['best_val_dist']:>8.2f} | {row['test_dist']:>9.2f} | "
+                     f"{row['test_success']:>7.1%} | {row['epochs']:>6} | {row['elapsed_seconds'] / 60:>6.1f}")
+        print(line)
+    print(f"\n  결과: {sweep_dir / 'sweep_results.csv'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DocAligner 하이퍼파라미터 스윕")
+    parser.add_argument("--param", action="append", default=[], required=True,
+                        help="스윕할 train.py 인자 (예: lr=1e-4,3e-4), 여러 번 지정 → 조합")
+    parser.add_argument("--parallel", type=int, default=4, help="동시 실행 trial 수")
+    parser.add_argument("--threads-per-trial", type=int, default=0,
+                        help="trial당 torch 스레드 수 (0: 코어 수 / parallel)")
+    parser.add_argument("--max-trials", type=int, default=0, help="조합 중 무작위 N개만 실행 (0: 전체)")
+    parser.add_argument("--prune-warmup", type=int, default=4, help="이 에폭 이전에는 가지치기하지 않음")
+    parser.add_argument("--prune-min-trials", type=int, default=2,
+                        help="가지치기에 필요한 비교 trial 최소 수")
+    parser.add_argument("--sweep-dir", type=str, default=None,
+                        help="스윕 출력 경로 (기본: tools/training/sweeps/<시각>)")
+    parser.add_argument("--sweep-seed", type=int, default=0, help="--max-trials 샘플링 시드")
+    sweep_args, rest = parser.parse_known_args()
+
+    train_parser = build_parser()
+    base_args = train_parser.parse_args(rest)
+    grid = _parse_params(sweep_args.param, train_parser)
+    threads = sweep_args.threads_per_trial or max(1, (os.cpu_count() or 1) // sweep_args.parallel)
+    sweep_dir = Path(sweep_args.sweep_dir or f"tools/training/sweeps/{time.strftime('%Y%m%d_%H%M%S')}")
+
+    run_sweep(base_args, grid, sweep_dir, sweep_args.parallel, threads,
+              max_trials=sweep_args.max_trials, warmup=sweep_args.prune_warmup,
+              min_trials=sweep_args.prune_min_trials, seed=sweep_args.sweep_seed)
@@ -0,0 +1,178 @@
+"""
+학습 처리량 텔레메트리
+=====================
+train.py 학습 루프의 스텝별 구간 시간(data-wait / forward / backward / optimizer)을
+기록하고 에폭마다 samples/sec, 구간별 백분위수, CPU 사용률, 스텝별 RSS 최대치를 요약합니다.
+
+출력 (training_history.json 옆):
+    telemetry_steps.csv  — 스텝별 구간 시간 (ms) + forward 직후 RSS (MB)
+    telemetry.json       — 에폭별 요약
+"""
+
+import csv
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+PHASES = ("data", "forward", "backward", "optimizer")
+
+
+def current_rss_mb() -> float:
+    """현재 프로세스 RSS (MB) — Linux는 /proc, 그 외 psutil (없으면 최대 RSS로 대체)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """프로세스 시작 이후 최대 RSS (MB, 지원하지 않는 플랫폼은 0)"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 2**20
+        except (ImportError, AttributeError):
+            return 0.0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 2**20 if sys.platform == "darwin" else maxrss / 2**10  # macOS는 bytes, Linux는 KB
+
+
+class StepTelemetry:
+    """스텝별 구간 시간 수집 + 에폭 요약 (host 시간 기준, CPU 학습에서는 그대로 실측치)"""
+
+    def __init__(self, output_dir, enabled: bool = True, resume_epoch: int = None):
+        """
+        resume_epoch: 재개 시작 에폭 (0부터) — 이전 실행 기록 중 이 에폭 이전만 유지
+        None(새 실행)이면 같은 출력 디렉토리의 이전 CSV/JSON 기록을 버림
+        """
+        self.output_dir = Path(output_dir)
+        self.enabled = enabled
+        self.csv_path = self.output_dir / "telemetry_steps.csv"
+        self.json_path = self.output_dir / "telemetry.json"
+        self.epochs = []
+        self._rows = []
+        if enabled:
+            self._truncate(resume_epoch)
+
+    def _truncate(self, resume_epoch: int = None):
+        """재개 에폭 이후(중간 재개 에폭 포함) 스텝 행 제거 → (epoch, step) 중복 없이 이어서 기록"""
+        if resume_epoch is None:
+            self.csv_path.unlink(missing_ok=True)
+            return
+        if self.json_path.exists():
+            previous = json.loads(self.json_path.read_text()).get("epochs", [])
+            self.epochs = [e for e in previous if e["epoch"] <= resume_epoch]  # 요약 epoch는 1부터
+        if not self.csv_path.exists():
+            return
+        with open(self.csv_path, newline="") as f:
+            rows = list(csv.reader(f))
+        if not rows:  # 빈 파일: 헤더부터 다시 쓰도록 제거
+            self.csv_path.unlink()
+            return
+        with open(self.csv_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(rows[0])
+            writer.writerows(r for r in rows[1:] if int(r[0]) <= resume_epoch)
+
+    def start_epoch(self, epoch: int):
+        self.epoch = epoch
+        self._rows = []
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self._last = self._wall_start
+
+    def mark(self) -> float:
+        """직전 mark 이후 경과 시간(초)"""
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self._last = now
+        return elapsed
+
+    def rss_mb(self) -> float:
+        """스텝 RSS 샘플 (forward 직후 = 저장된 activation이 가장 많은 시점), 비활성 시 0"""
+        return current_rss_mb() if self.enabled else 0.0
+
+    def record(self, step: int, data: float, forward: float, backward: float, optimizer: float,
+               rss_mb: float = 0.0):
+        if self.enabled:
+            self._rows.append((step, data, forward, backward, optimizer, rss_mb))
+
+    def end_epoch(self, samples: int, threads: int) -> dict:
+        wall = time.perf_counter() - self._wall_start
+        cpu = time.process_time() - self._cpu_start
+        summary = {
+            "epoch": self.epoch + 1,
+            "samples": samples,
+            "wall_seconds": wall,
+            "samples_per_sec": samples / wall if wall > 0 else 0.0,
+            # 프로세스 CPU 시간 / (wall × 스레드 수): 1.0이면 할당된 코어를 모두 사용
+            "cpu_util": cpu / (wall * max(threads, 1)) if wall > 0 else 0.0,
+        }
+        if self.enabled and self._rows:
+            times = np.asarray([r[1:5] for r in self._rows]) * 1000  # ms
+            for i, phase in enumerate(PHASES):
+                values = times[:, i]
+                if phase == "optimizer":
+                    values = values[values > 0]  # 옵티마이저 step이 있던 스텝만
+                if len(values) == 0:
+                    continue
+                p50, p95, p99 = np.percentile(values, [50, 95, 99])
+                summary[phase] = {
+                    "mean_ms": float(values.mean()),
+                    "p50_ms": float(p50),
+                    "p95_ms": float(p95),
+                    "p99_ms": float(p99),
+                    "total_s": float(values.sum() / 1000),
+                }
+            rss = np.asarray([r[5] for r in self._rows])
+            summary["rss"] = {
+                "peak_mb": float(rss.max()),
+                "p50_mb": float(np.percentile(rss, 50)),
+                "process_peak_mb": peak_rss_mb(),
+            }
+            self._write_rows()
+        self.epochs.append(summary)
+        return summary
+
+    def _write_rows(self):
+        new_file = not self.csv_path.exists()
+        with open(self.csv_path, "a", newline="") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(["epoch", "step"] + [f"{p}_ms" for p in PHASES] + ["rss_mb"])
+            for step, *phases, rss in self._rows:
+                writer.writerow([self.epoch + 1, step] + [f"{t * 1000:.3f}" for t in phases] + [f"{rss:.1f}"])
+
+    def save(self, extra: dict = None):
+        with open(self.json_path, "w") as f:
+            json.dump({
+                "pid": os.getpid(),
+                "epochs": self.epochs,
+                **(extra or {}),
+            }, f, indent=2)
+
+    @staticmethod
+    def format(summary: dict) -> str:
+        """에폭 요약 한 줄"""
+        parts = [f"{summary['samples_per_sec']:.1f} samples/s"]
+        for phase, label in zip(PHASES, ("data", "fwd", "bwd", "opt")):
+            if phase in summary:
+                p = summary[phase]
+                parts.append(f"{label} p50 {p['p50_ms']:.1f}ms p95 {p['p95_ms']:.1f}ms")
+        parts.append(f"cpu {summary['cpu_util']:.0%}")
+        if "rss" in summary:
+            parts.append(f"rss peak {summary['rss']['peak_mb']:.0f}MB")
+        return "    [perf] " + " | ".join(parts)
@@ -8,44 +8,88 @@ DocAligner Fine-tuning 학습 파이프라인
     python train.py --data dataset --epochs 50 --batch-size 64
     python train.py --data dataset --epochs 50 --stage 1  # Stage 1만 (헤드 학습)
     python train.py --data dataset --epochs 50 --stage 2  # Stage 2만 (백본+헤드)
+    python train.py --data dataset --stage 3 --resume checkpoints/checkpoint_best.pt --epochs 5 --lr 1e-5 \
+        --val-backend ort --output checkpoints_qat --export-onnx  # QAT → QDQ INT8 ONNX
     python train.py --data dataset --resume checkpoint_best.pt  # 이어서 학습
+    python train.py --data dataset --resume checkpoints/checkpoint_step.pt  # 중단된 step부터 정확히 재개
+    python train.py --data dataset --val-backend ort --val-batch-size 128  # ONNX Runtime 배치 검증
+    python train.py --data dataset --async-val  # 검증을 별도 프로세스에서 (학습 중단 없음)
+    python train.py --data dataset --val-interval 1 --patience 3 --time-budget 120  # 정체 시 조기 종료, 2시간 예산
+    python train.py --data dataset --res-schedule 160:4,224:8  # 점진적 해상도 (초반 에폭은 backbone 저해상도)
+    python train.py --data dataset --adaptive-sampling  # 고손실(binder/book) 샘플 우선 추출
+    python train.py --data dataset --teacher assets/models/doc_aligner_book_v2_int8.onnx --export-onnx \
+        --student-width 0.25 --student-depth 2  # 지식 증류: 경량 student 학습 + teacher 대비 속도/정확도 비교
+    python train.py --data dataset --graph-opt  # 상수 폴딩 + 레이아웃 정리 (BN은 융합하지 않아 학습 결과 동일)
+    python train.py --data dataset --max-memory 2048  # 2GB 예산: 초과 예상 시 backbone 블록 activation 재계산
+    python train.py --data dataset --track-memory  # 에폭별 RSS/할당 위치/검증·테스트 워커 메모리 → memory_profile.json, 누수 경고
+    # ONNX→PyTorch 변환은 ~/.cache/doc_aligner에 캐시 (모델 파일 내용이 바뀌면 자동 재변환, --no-convert-cache로 비활성화)
+
+    # 분산 데이터 병렬 (gloo, CPU) — 로컬 멀티 프로세스
+    torchrun --nproc-per-node 8 train.py --data dataset --batch-size 64
+    python train.py --data dataset --batch-size 8 --check-ddp-equivalence  # 2 ranks gradient == 단일 프로세스 확인
+    # 여러 대 (LAN): 각 노드에서 --node-rank만 바꿔 실행
+    torchrun --nnodes 2 --node-rank 0 --nproc-per-node 16 --master-addr 192.168.0.10 --master-port 29500 train.py --data dataset
 """
 
 import argparse
+import copy
 import json
+import math
+import os
+import queue
+import random
+import sys
+import threading
 import time
+from datetime import timedelta
 from pathlib import Path
 
 import cv2
 import numpy as np
-import onnx
 import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
 import torch.nn as nn
-from onnx2torch import convert
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, DataLoader, Sampler
+
+from convert_cache import load_converted
+from graph_opt import (activation_memory, enable_checkpointing, enable_flexible_resolution, optimize_model,
+                       plan_checkpointing)
+from memprof import MemoryTracker, WorkerMemory
+from qat import prepare_qat, set_qat_observers
+from student import build_student
+from telemetry import StepTelemetry, current_rss_mb
 
 
 # ========== Dataset ==========
 
 class CornerDataset(Dataset):
-    """코너 감지 학습 데이터셋"""
+    """
+    코너 감지 학습 데이터셋
+    cache_dir: build_data_cache()로 만든 디코드 완료 memmap (JPEG 디코드 생략, 여러 프로세스가 페이지 캐시 공유)
+    """
 
-    def __init__(self, image_dir: str, label_dir: str, indices: list, augment: bool = False):
+    def __init__(self, image_dir: str, label_dir: str, indices: list, augment: bool = False,
+                 cache_dir=None):
         self.image_dir = Path(image_dir)
         self.label_dir = Path(label_dir)
         self.indices = indices
         self.augment = augment
+        self.resolution = None  # 점진적 해상도 학습: 축소 디코드 해상도 (None이면 원본 256)
+        self.worker_memory = None  # --track-memory: DataLoader 워커별 RSS 기록 (memprof.WorkerMemory)
+        self.images = self.labels = None
+        if cache_dir is not None:
+            self.images = np.load(Path(cache_dir) / "images_u8.npy", mmap_mode="r")
+            self.labels = np.load(Path(cache_dir) / "labels_f32.npy")
 
     def __len__(self):
         return len(self.indices)
 
     def __getitem__(self, idx):
         i = self.indices[idx]
-        img_path = self.image_dir / f"{i:05d}.jpg"
-        label_path = self.label_dir / f"{i:05d}.npy"
 
         # 이미지 로드 + 전처리
-        img = cv2.imread(str(img_path))
+        img = self._load_image(i)
         img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
         img = img.astype(np.float32) / 255.0  # [0, 1] 정규화
 
@@ -57,13 +101,38 @@ class CornerDataset(Dataset):
         img = torch.from_numpy(img).permute(2, 0, 1)  # [3, 256, 256]
 
         # 라벨 로드
-        label = np.load(str(label_path)).astype(np.float32)
+        if self.labels is not None:
+            label = self.labels[i].copy()
+        else:
+            label = np.load(str(self.label_dir / f"{i:05d}.npy")).astype(np.float32)
 
         # has_obj: 코너 합이 0이면 문서 없음
         has_obj = 1.0 if label.sum() > 0 else 0.0
 
+        if self.worker_memory is not None:
+            self.worker_memory.update()
         return img, torch.from_numpy(label), torch.tensor([has_obj])
 
+    def _load_image(self, i: int) -> np.ndarray:
+        """BGR 로드 — resolution 지정 시 libjpeg 축소 디코드(1/2, 1/4) 후 목표 크기로 축소"""
+        if self.images is not None:
+            img = np.array(self.images[i])  # memmap → 쓰기 가능한 복사본
+            if self.resolution:
+                img = cv2.resize(img, (self.resolution, self.resolution), interpolation=cv2.INTER_AREA)
+            return img
+        path = self.image_dir / f"{i:05d}.jpg"
+        if not self.resolution:
+            return cv2.imread(str(path))
+        flag = cv2.IMREAD_COLOR
+        for factor, reduced in ((4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if 256 // factor >= self.resolution:
+                flag = reduced
+                break
+        img = cv2.imread(str(path), flag)
+        if img.shape[0] != self.resolution or img.shape[1] != self.resolution:
+            img = cv2.resize(img, (self.resolution, self.resolution), interpolation=cv2.INTER_AREA)
+        return img
+
     def _augment(self, img: np.ndarray) -> np.ndarray:
         """경량 온라인 증강 (좌우 반전, 색상 지터)"""
         # 색상 지터
@@ -78,6 +147,159 @@ class CornerDataset(Dataset):
         return img.astype(np.float32)
 
 
+def build_data_cache(data_path) -> Path:
+    """
+    전체 이미지를 한 번만 디코드해 uint8 memmap(.npy)으로 저장 (+ 라벨 배열)
+    splits.json보다 오래된 캐시는 다시 생성 (데이터셋 재생성 감지)
+    """
+    data_path = Path(data_path)
+    cache_dir = data_path / "cache"
+    images_path = cache_dir / "images_u8.npy"
+    labels_path = cache_dir / "labels_f32.npy"
+    splits_file = data_path / "splits.json"
+    if (images_path.exists() and labels_path.exists()
+            and images_path.stat().st_mtime >= splits_file.stat().st_mtime):
+        return cache_dir
+
+    splits = json.loads(splits_file.read_text())
+    ids = sorted({i for split in splits.values() for i in split})
+    size = ids[-1] + 1
+    print(f"  데이터 캐시 생성: {len(ids)}장 → {images_path}")
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_images = cache_dir / f"images_u8.{os.getpid()}.tmp.npy"
+    images = np.lib.format.open_memmap(tmp_images, mode="w+", dtype=np.uint8, shape=(size, 256, 256, 3))
+    labels = np.zeros((size, 8), dtype=np.float32)
+    for i in ids:
+        images[i] = cv2.imread(str(data_path / "images" / f"{i:05d}.jpg"))
+        labels[i] = np.load(str(data_path / "labels" / f"{i:05d}.npy"))
+    images.flush()
+    del images
+    np.save(labels_path, labels)
+    os.replace(tmp_images, images_path)  # 이미지가 마지막 → 중단 시 다음 실행에서 재생성
+    return cache_dir
+
+
+class ResumableSampler(Sampler):
+    """
+    재현 가능한 셔플 샘플러 (에폭별 seed + epoch 순열)
+    - rank별 shard (분산 학습 시 DistributedSampler 역할)
+    - start: 에폭 중간 재개 시 이미 처리한 샘플 수만큼 건너뜀
+    """
+
+    def __init__(self, num_samples: int, num_replicas: int = 1, rank: int = 0, seed: int = 0):
+        self.num_samples = num_samples
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self.epoch = 0
+        self.start = 0
+        self.per_rank = num_samples // num_replicas  # drop_last
+
+    def set_epoch(self, epoch: int, start: int = 0):
+        self.epoch = epoch
+        self.start = start
+
+    def __iter__(self):
+        g = torch.Generator()
+        g.manual_seed(self.seed + self.epoch)
+        perm = torch.randperm(self.num_samples, generator=g)[:self.per_rank * self.num_replicas]
+        return iter(perm[self.rank::self.num_replicas][self.start:].tolist())
+
+    def __len__(self):
+        return self.per_rank - self.start
+
+
+class LossAwareSampler(ResumableSampler):
+    """
+    손실 기반 적응 샘플러 (어려운 binder/book 샘플을 더 자주 추출)
+    - 샘플별 손실 EMA 테이블: 에폭 동안 누적 → 에폭 끝에 갱신 (분산 학습 시 rank 간 합산)
+    - 추출 확률: uniform 비율 + 손실 비례 나머지, 에폭마다 복원 추출 (seed + epoch로 재현 가능)
+    - 중요도 가중치 1/(N·p)를 [1/max_weight, max_weight]로 제한해 loss에 곱함
+    - 손실이 아직 없는 첫 에폭은 ResumableSampler와 동일한 순열
+    """
+
+    def __init__(self, num_samples: int, num_replicas: int = 1, rank: int = 0, seed: int = 0,
+                 uniform: float = 0.3, max_weight: float = 3.0, momentum: float = 0.7, device="cpu"):
+        super().__init__(num_samples, num_replicas, rank, seed)
+        self.uniform = uniform
+        self.max_weight = max_weight
+        self.momentum = momentum
+        self.loss = torch.full((num_samples,), float("nan"))
+        self.probs = None  # 현재 에폭 추출 확률 (중간 재개 시 그대로 복원)
+        self._sums = torch.zeros(num_samples, device=device)
+        self._counts = torch.zeros(num_samples, device=device)
+
+    def _epoch_probs(self):
+        seen = ~torch.isnan(self.loss)
+        if not seen.any():
+            return None
+        loss = torch.where(seen, self.loss, self.loss[seen].mean()).clamp(min=1e-6)  # 미관측 샘플은 평균
+        return self.uniform / self.num_samples + (1 - self.uniform) * loss / loss.sum()
+
+    def set_epoch(self, epoch: int, start: int = 0):
+        super().set_epoch(epoch, start)
+        if start == 0 or self.probs is None:
+            self.probs = self._epoch_probs()
+        g = torch.Generator()
+        g.manual_seed(self.seed + epoch)
+        total = self.per_rank * self.num_replicas
+        if self.probs is None:
+            indices = torch.randperm(self.num_samples, generator=g)[:total]
+            self.weights = torch.ones(total)
+        else:
+            indices = torch.multinomial(self.probs, total, replacement=True, generator=g)
+            self.weights = (1.0 / (self.num_samples * self.probs[indices])).clamp(
+                1.0 / self.max_weight, self.max_weight)
+        self.indices = indices[self.rank::self.num_replicas]
+        self.weights = self.weights[self.rank::self.num_replicas]
+
+    def __iter__(self):
+        return iter(self.indices[self.start:].tolist())
+
+    def weight(self, step: int) -> float:
+        """에폭 내 step번째 샘플의 중요도 가중치"""
+        return float(self.weights[step])
+
+    def record(self, step: int, loss: torch.Tensor):
+        """step번째 샘플의 손실 누적 (디바이스 텐서, host 동기화 없음)"""
+        idx = int(self.indices[step])
+        self._sums[idx] += loss.detach()
+        self._counts[idx] += 1
+
+    def update(self, world_size: int = 1) -> dict:
+        """에폭 끝: 누적 손실로 EMA 테이블 갱신 (분산 시 모든 rank에서 호출)"""
+        stats = torch.stack([self._sums, self._counts])
+        if world_size > 1:
+            dist.all_reduce(stats)
+        sums, counts = stats.cpu()
+        seen = counts > 0
+        mean = sums / counts.clamp(min=1)
+        ema = torch.where(torch.isnan(self.loss), mean, self.momentum * self.loss + (1 - self.momentum) * mean)
+        self.loss = torch.where(seen, ema, self.loss)
+        self._sums.zero_()
+        self._counts.zero_()
+        return {
+            "coverage": seen.float().mean().item(),
+            "max_prob_ratio": (self.probs.max() * self.num_samples).item() if self.probs is not None else 1.0,
+        }
+
+    def state_dict(self) -> dict:
+        return {
+            "loss": self.loss.clone(),
+            "probs": None if self.probs is None else self.probs.clone(),
+            "sums": self._sums.cpu(),
+            "counts": self._counts.cpu(),
+        }
+
+    def load_state_dict(self, state: dict, accumulators: bool = True):
+        """accumulators=False: 에폭 중 누적분은 버림 (rank 0 체크포인트를 다른 rank가 읽을 때)"""
+        self.loss = state["loss"].clone()
+        self.probs = None if state["probs"] is None else state["probs"].clone()
+        if accumulators:
+            self._sums.copy_(state["sums"])
+            self._counts.copy_(state["counts"])
+
+
 # ========== Loss ==========
 
 class CornerLoss(nn.Module):
@@ -100,103 +322,583 @@ class CornerLoss(nn.Module):
         # has_obj 손실 (모든 샘플)
         obj_loss = self.bce(pred_obj, gt_obj)
 
-        # points 손실 (문서가 있는 샘플만)
-        mask = gt_obj.squeeze(-1) > 0.5  # [B]
-        if mask.sum() > 0:
-            pred_pts = pred_points[mask]  # [N, 8]
-            gt_pts = gt_points[mask]  # [N, 8]
-            pts_loss = self.smooth_l1(pred_pts, gt_pts).mean()
+        # points 손실 (문서가 있는 샘플만) — 불리언 인덱싱/분기 대신 마스크 가중치로 벡터화
+        # 문서가 없는 배치는 분모가 clamp되어 0이 되므로 host 동기화가 필요 없음
+        weight = (gt_obj.squeeze(-1) > 0.5).to(pred_points.dtype)  # [B]
+        denom = weight.sum().clamp(min=1.0)
+        per_sample = self.smooth_l1(pred_points, gt_points).mean(dim=-1)  # [B]
+        pts_loss = (per_sample * weight).sum() / denom
 
-            # 면적 정규화
-            area_loss = self._area_regularization(pred_pts)
-        else:
-            pts_loss = torch.tensor(0.0, device=pred_points.device)
-            area_loss = torch.tensor(0.0, device=pred_points.device)
+        # 면적 정규화
+        area_loss = (self._area_regularization(pred_points) * weight).sum() / denom
 
         total = (self.points_weight * pts_loss +
                  self.obj_weight * obj_loss +
                  self.area_weight * area_loss)
 
+        # .item() 호출 없이 디바이스 텐서 그대로 반환 (RunningMetrics에서 누적)
         return total, {
-            "total": total.item(),
-            "points": pts_loss.item(),
-            "obj": obj_loss.item(),
-            "area": area_loss.item(),
+            "total": total.detach(),
+            "points": pts_loss.detach(),
+            "obj": obj_loss.detach(),
+            "area": area_loss.detach(),
         }
 
     def _area_regularization(self, pred_pts):
-        """Shoelace formula — 면적이 너무 작으면 페널티"""
+        """Shoelace formula — 면적이 너무 작으면 페널티 (샘플별 [B])"""
         corners = pred_pts.view(-1, 4, 2)
         x = corners[:, :, 0]
         y = corners[:, :, 1]
-        n = 4
-        area = torch.zeros(corners.shape[0], device=corners.device)
-        for i in range(n):
-            j = (i + 1) % n
-            area += x[:, i] * y[:, j] - x[:, j] * y[:, i]
-        area = torch.abs(area) / 2
+        # 다음 코너 (i+1) % 4 를 roll로 한 번에 계산
+        x_next = torch.roll(x, shifts=-1, dims=1)
+        y_next = torch.roll(y, shifts=-1, dims=1)
+        area = torch.abs((x * y_next - x_next * y).sum(dim=1)) / 2
 
         # 최소 면적 10% (256×256의 10% = 0.1 정규화 기준)
-        penalty = torch.relu(0.05 - area).mean()
-        return penalty
+        return torch.relu(0.05 - area)
+
+
+class DistillationLoss(nn.Module):
+    """
+    teacher 출력 모방 손실 (지식 증류)
+    - points: student ↔ teacher 좌표 SmoothL1, teacher has_obj 확률로 가중 (teacher가 문서를 본 샘플 위주)
+    - has_obj: temperature로 부드럽게 한 teacher 확률에 대한 BCE (× T²로 gradient 크기 보정)
+    """
+
+    def __init__(self, points_weight=1.0, obj_weight=0.5, temperature=2.0):
+        super().__init__()
+        self.smooth_l1 = nn.SmoothL1Loss(reduction="none")
+        self.points_weight = points_weight
+        self.obj_weight = obj_weight
+        self.temperature = temperature
+
+    def forward(self, pred_points, pred_obj_logit, teacher_points, teacher_obj_logit):
+        weight = torch.sigmoid(teacher_obj_logit).squeeze(-1)  # [B]
+        per_sample = self.smooth_l1(pred_points, teacher_points).mean(dim=-1)
+        pts_loss = (per_sample * weight).sum() / weight.sum().clamp(min=1e-6)
+
+        t = self.temperature
+        obj_loss = nn.functional.binary_cross_entropy_with_logits(
+            pred_obj_logit / t, torch.sigmoid(teacher_obj_logit / t)) * t * t
+
+        total = self.points_weight * pts_loss + self.obj_weight * obj_loss
+        return total, {"distill": total.detach(), "distill_points": pts_loss.detach()}
+
+
+class Teacher:
+    """
+    고정 teacher — ONNX 모델을 ONNX Runtime으로 실행 (배포 INT8 모델도 그대로 사용 가능)
+    teacher 입력은 256 기준이므로 저해상도 스케줄 입력은 보간해서 전달
+    """
+
+    def __init__(self, onnx_path: str):
+        self.sess = _ort_session(onnx_path)
+        self.batch_state = {}
+
+    def _run(self, imgs):
+        points, has_obj = self.sess.run(None, {"img": imgs.numpy()})
+        return torch.from_numpy(points), torch.from_numpy(has_obj)
+
+    def __call__(self, imgs):
+        device = imgs.device
+        imgs = imgs.detach().cpu().float()
+        if imgs.shape[-2:] != (256, 256):
+            imgs = nn.functional.interpolate(imgs, size=(256, 256), mode="bilinear", align_corners=False)
+        points, has_obj = _batched_call(self._run, imgs, self.batch_state)
+        return points.to(device), has_obj.to(device)
+
+
+class RunningMetrics:
+    """
+    디바이스 상의 손실 누적기
+    - 매 스텝 .item() 대신 텐서 합만 누적
+    - compute() 호출 시(로깅 간격) 한 번만 host로 읽어옴
+    """
+
+    def __init__(self, keys, device):
+        self.keys = list(keys)
+        self.sums = torch.zeros(len(self.keys), device=device)
+        self.count = 0
+
+    def update(self, values: dict, n: int = 1):
+        self.sums += torch.stack([values[k] for k in self.keys]) * n
+        self.count += n
+
+    def all_reduce(self):
+        """분산 학습: 모든 rank의 합계를 합산 (rank별 샘플 수는 동일)"""
+        if dist.is_available() and dist.is_initialized():
+            dist.all_reduce(self.sums)
+            self.count *= dist.get_world_size()
+
+    def compute(self) -> dict:
+        values = (self.sums / max(self.count, 1)).tolist()  # 단일 동기화
+        return dict(zip(self.keys, values))
+
+    def reset(self):
+        self.sums.zero_()
+        self.count = 0
 
 
 # ========== Evaluation ==========
 
-def evaluate(model, dataloader, device, criterion):
-    """검증 데이터셋 평가"""
+def _batched_call(fn, imgs, state: dict):
+    """
+    배치 추론 호출
+    onnx2torch 모델과 여기서 export한 그래프는 Reshape가 batch=1로 하드코딩되어 있어
+    배치 입력이 실패하면 샘플 단위로 나눠 실행 후 결합 (결과는 state에 캐시)
+    """
+    if state.get("batched", True) and imgs.size(0) > 1:
+        try:
+            outputs = fn(imgs)
+            state["batched"] = True
+            return outputs
+        except Exception:  # torch RuntimeError / ORT Fail
+            state["batched"] = False
+    outputs = [fn(imgs[i:i + 1]) for i in range(imgs.size(0))]
+    return tuple(torch.cat(parts) for parts in zip(*outputs))
+
+
+def _export_graph(model, output_path: str, device="cpu"):
+    """현재 가중치를 ONNX 그래프로 저장 (검증 출력 없음)"""
     model.eval()
-    total_loss = 0
-    total_pts_loss = 0
-    total_count = 0
-    corner_dists = []
+    dummy = torch.randn(1, 3, 256, 256, device=device)
+    torch.onnx.export(
+        model,
+        dummy,
+        str(output_path),
+        input_names=["img"],
+        output_names=["points", "has_obj"],
+        opset_version=16,
+        dynamic_axes={
+            "img": {0: "batch"},
+            "points": {0: "batch"},
+            "has_obj": {0: "batch"},
+        },
+    )
+    return output_path
+
+
+def _ort_session(onnx_path: str):
+    """검증용 ONNX Runtime 세션 (CPU, 학습과 같은 스레드 수)"""
+    import onnxruntime as ort
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = torch.get_num_threads()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    ort.set_default_logger_severity(4)  # batch 폴백 시 Reshape 에러(ERROR 레벨) 로그 억제
+    return ort.InferenceSession(str(onnx_path), opts, providers=["CPUExecutionProvider"])
+
+
+def evaluate(model, dataloader, device, criterion, backend="torch", snapshot_path=None):
+    """
+    검증 데이터셋 평가
+    - 배치 단위 로드 + 벡터화된 메트릭 계산 (디바이스 누적, 종료 시 한 번만 동기화)
+    - backend="ort": 현재 가중치를 snapshot_path로 export 후 ONNX Runtime으로 평가 (배포 경로와 동일)
+    """
+    model.eval()
+    if backend == "ort":
+        _export_graph(model, snapshot_path, device)
+        return evaluate_onnx(snapshot_path, dataloader, criterion)
+
+    def run(imgs):
+        outputs = model(imgs)
+        return outputs[0], outputs[1]
+
+    return _evaluate_run(run, dataloader, device, criterion)
+
+
+def evaluate_onnx(onnx_path, dataloader, criterion):
+    """ONNX 모델 파일을 ONNX Runtime으로 평가 (teacher/student 비교 등 export된 모델 그대로)"""
+    sess = _ort_session(onnx_path)
+
+    def run(imgs):
+        points, has_obj = sess.run(None, {"img": imgs.cpu().numpy()})
+        return torch.from_numpy(points), torch.from_numpy(has_obj)
+
+    return _evaluate_run(run, dataloader, torch.device("cpu"), criterion)
+
+
+def _evaluate_run(run, dataloader, device, criterion):
+    """run(imgs) → (points, has_obj logit) 으로 메트릭 계산"""
+    batch_state = {}
+    meter = RunningMetrics(["total", "points"], device)
+    dist_sum = torch.zeros((), device=device)
+    success_sum = torch.zeros((), device=device)
+    obj_count = torch.zeros((), device=device)
 
     with torch.no_grad():
         for imgs, gt_pts, gt_obj in dataloader:
-            imgs = imgs.to(device)
-            gt_pts = gt_pts.to(device)
-            gt_obj = gt_obj.to(device)
+            imgs = imgs.to(device, non_blocking=True)
+            gt_pts = gt_pts.to(device, non_blocking=True)
+            gt_obj = gt_obj.to(device, non_blocking=True)
 
-            outputs = model(imgs)
-            pred_pts = outputs[0]
-            pred_obj = torch.sigmoid(outputs[1])
+            pred_pts, pred_obj = _batched_call(run, imgs, batch_state)
+            pred_obj = torch.sigmoid(pred_obj)
 
-            loss, loss_dict = criterion(pred_pts, pred_obj, gt_pts, gt_obj)
-            total_loss += loss.item() * imgs.size(0)
-            total_pts_loss += loss_dict["points"] * imgs.size(0)
-            total_count += imgs.size(0)
-
-            # 코너 거리 계산 (문서 있는 샘플만)
-            mask = gt_obj.squeeze(-1) > 0.5
-            if mask.sum() > 0:
-                pred_corners = pred_pts[mask].view(-1, 4, 2).cpu().numpy()
-                gt_corners = gt_pts[mask].view(-1, 4, 2).cpu().numpy()
-                dists = np.linalg.norm(pred_corners - gt_corners, axis=-1) * 256  # 픽셀 단위
-                corner_dists.extend(dists.mean(axis=1).tolist())
-
-    avg_loss = total_loss / max(total_count, 1)
-    avg_pts = total_pts_loss / max(total_count, 1)
-    avg_dist = np.mean(corner_dists) if corner_dists else 0
-    success_rate = np.mean([d < 10 for d in corner_dists]) if corner_dists else 0
+            _, loss_dict = criterion(pred_pts, pred_obj, gt_pts, gt_obj)
+            meter.update(loss_dict, n=imgs.size(0))
+
+            # 코너 거리 계산 (문서 있는 샘플만, 마스크 가중치)
+            weight = (gt_obj.squeeze(-1) > 0.5).to(pred_pts.dtype)
+            dists = torch.linalg.norm(
+                pred_pts.view(-1, 4, 2) - gt_pts.view(-1, 4, 2), dim=-1
+            ).mean(dim=1) * 256  # 픽셀 단위
+            dist_sum += (dists * weight).sum()
+            success_sum += ((dists < 10).to(dists.dtype) * weight).sum()
+            obj_count += weight.sum()
+
+    losses = meter.compute()
+    # 평가 종료 시 한 번만 host로 읽어옴
+    dist_sum, success_sum, obj_count = torch.stack([dist_sum, success_sum, obj_count]).tolist()
 
     return {
-        "loss": avg_loss,
-        "pts_loss": avg_pts,
-        "avg_corner_dist_px": avg_dist,
-        "success_rate_10px": success_rate,
+        "loss": losses["total"],
+        "pts_loss": losses["points"],
+        "avg_corner_dist_px": dist_sum / obj_count if obj_count else 0,
+        "success_rate_10px": success_sum / obj_count if obj_count else 0,
+    }
+
+
+# ========== Background Validation ==========
+
+def _validation_worker_main(args_dict: dict, num_threads: int, jobs, results):
+    """검증 프로세스 본체 — 스냅샷 가중치를 받아 evaluate 후 결과 반환"""
+    torch.set_num_threads(num_threads)
+    args = argparse.Namespace(**args_dict)
+
+    data_path = Path(args.data)
+    splits = json.loads((data_path / "splits.json").read_text())
+    cache_dir = data_path / "cache" if args.data_cache else None
+    val_ds = CornerDataset(data_path / "images", data_path / "labels", splits["val"], augment=False,
+                           cache_dir=cache_dir)
+    # daemon 프로세스는 자식 프로세스를 만들 수 없음 → --val-workers 무시 (학습과는 이미 병렬)
+    val_dl = DataLoader(val_ds, batch_size=args.val_batch_size, shuffle=False, num_workers=0)
+
+    if args.teacher is not None:
+        model = build_student(args.student_width, args.student_depth)
+    else:
+        model = load_converted(args.model, use_cache=not args.no_convert_cache)
+    if args.stage == 3 and args.teacher is None:
+        model = prepare_qat(model)  # QAT 스냅샷 state_dict 구조와 일치 (관측 off 상태도 함께 로드)
+    criterion = CornerLoss(points_weight=args.points_weight, obj_weight=args.obj_weight,
+                           area_weight=args.area_weight)
+    snapshot_path = Path(args.output) / "_val_snapshot_async.onnx"
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        epoch, state = job
+        model.load_state_dict(state)
+        val_start = time.time()
+        metrics = evaluate(model, val_dl, torch.device("cpu"), criterion,
+                           backend=args.val_backend, snapshot_path=snapshot_path)
+        results.put((epoch, metrics, time.time() - val_start))
+
+    snapshot_path.unlink(missing_ok=True)
+
+
+class ValidationWorker:
+    """
+    별도 프로세스에서 가중치 스냅샷을 검증 (학습 루프와 비동기)
+    - submit(): CPU로 복사한 state_dict를 큐로 전달, 학습은 즉시 계속
+    - poll(): 완료된 결과를 제출 당시 스냅샷과 함께 반환 → 베스트 선택은 사후에 수행
+    """
+
+    def __init__(self, args, num_threads: int):
+        ctx = mp.get_context("spawn")  # Windows 호환
+        self.jobs = ctx.Queue()
+        self.results = ctx.Queue()
+        self.pending = {}
+        self.process = ctx.Process(
+            target=_validation_worker_main,
+            args=(vars(args), num_threads, self.jobs, self.results),
+            daemon=True,
+        )
+        self.process.start()
+
+    def submit(self, epoch: int, snapshot: dict):
+        self.pending[epoch] = snapshot
+        self.jobs.put((epoch, snapshot["model"]))
+
+    def poll(self, block: bool = False) -> list:
+        """완료된 (metrics, val_time, snapshot) 목록, block=True면 남은 작업을 모두 대기"""
+        done = []
+        while self.pending:
+            try:
+                epoch, metrics, val_time = self.results.get(timeout=5) if block else self.results.get_nowait()
+            except queue.Empty:
+                if not block:
+                    break
+                if not self.process.is_alive():
+                    raise RuntimeError("검증 프로세스가 비정상 종료되었습니다")
+                continue
+            done.append((metrics, val_time, self.pending.pop(epoch)))
+        return done
+
+    def close(self):
+        self.jobs.put(None)
+        self.process.join()
+
+
+def _record_validation(val_metrics, val_time, snapshot, best_val_dist, history, output_dir, args,
+                       checkpointer):
+    """검증 결과 반영 — 개선 시 스냅샷으로 베스트 체크포인트 저장 + 히스토리 기록"""
+    val_dist = val_metrics["avg_corner_dist_px"]
+    improved = ""
+    if val_dist < best_val_dist:
+        best_val_dist = val_dist
+        improved = " * BEST"
+        # 베스트 모델 저장 (검증한 시점의 가중치, 백그라운드 스레드)
+        checkpointer.save({
+            "epoch": snapshot["epoch"],
+            "model": snapshot["model"],
+            "optimizer": snapshot["optimizer"],
+            "scheduler": snapshot["scheduler"],
+            "sampler": snapshot.get("sampler"),
+            "stage_switch_epoch": snapshot.get("stage_switch_epoch"),
+            "best_val_dist": best_val_dist,
+            "args": vars(args),
+        }, output_dir / "checkpoint_best.pt")
+
+    history.append({
+        "epoch": snapshot["epoch"] + 1,
+        "train_loss": snapshot["train_loss"],
+        "train_pts": snapshot["train_pts"],
+        "val_loss": val_metrics["loss"],
+        "val_dist": val_dist,
+        "val_success": val_metrics["success_rate_10px"],
+        "lr": snapshot["lr"],
+        "train_seconds": snapshot["train_seconds"],
+        "resolution": snapshot.get("resolution", 256),
+        "val_seconds": val_time,
+    })
+    return best_val_dist, improved
+
+
+# ========== Checkpoint ==========
+
+def _to_cpu_copy(obj):
+    """텐서를 CPU 복사본으로 (중첩 dict/list 포함) — 저장 중 학습이 값을 바꾸지 않도록"""
+    if torch.is_tensor(obj):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: _to_cpu_copy(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu_copy(v) for v in obj)
+    return copy.deepcopy(obj)
+
+
+class AsyncCheckpointer:
+    """
+    백그라운드 스레드 체크포인트 저장
+    - 학습 루프는 CPU 스냅샷 복사만 기다리고 직렬화/디스크 쓰기는 스레드에서
+    - 임시 파일에 쓴 뒤 os.replace → 저장 중 중단되어도 이전 체크포인트 유지
+    """
+
+    def __init__(self):
+        self._thread = None
+        self._error = None
+
+    def save(self, state: dict, path):
+        self.wait()  # 동시에 하나만 (이전 저장이 끝나야 다음 스냅샷)
+        snapshot = _to_cpu_copy(state)
+        self._thread = threading.Thread(target=self._write, args=(snapshot, Path(path)), daemon=True)
+        self._thread.start()
+
+    def _write(self, state: dict, path: Path):
+        try:
+            tmp = path.with_name(path.name + ".tmp")
+            torch.save(state, tmp)
+            os.replace(tmp, path)
+        except Exception as e:
+            self._error = e
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+
+def _rng_state() -> dict:
+    state = {
+        "torch": torch.get_rng_state(),
+        "numpy": np.random.get_state(),
+        "python": random.getstate(),
     }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def _set_rng_state(state: dict):
+    torch.set_rng_state(state["torch"])
+    np.random.set_state(state["numpy"])
+    random.setstate(state["python"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+# ========== Distributed (gloo) ==========
+
+def _init_distributed(args):
+    """
+    torchrun 환경변수(WORLD_SIZE/RANK/LOCAL_RANK)로 gloo 프로세스 그룹 초기화
+    단일 프로세스 실행이면 (0, 1, 0) 반환
+    """
+    world_size = int(os.environ.get("WORLD_SIZE", "1"))
+    if world_size <= 1:
+        return 0, 1, 0
+
+    # 검증(rank 0)이 길어져도 다른 rank가 타임아웃되지 않도록 여유를 둠
+    dist.init_process_group(backend="gloo", timeout=timedelta(hours=2))
+    rank = dist.get_rank()
+    local_rank = int(os.environ.get("LOCAL_RANK", "0"))
+    local_world = int(os.environ.get("LOCAL_WORLD_SIZE", str(world_size)))
+
+    # torchrun은 OMP_NUM_THREADS=1을 기본 설정 → 노드 코어를 로컬 rank 수로 분배
+    threads = args.threads_per_rank or max(1, (os.cpu_count() or 1) // local_world)
+    torch.set_num_threads(threads)
+
+    # 로그/출력은 rank 0만
+    if rank != 0:
+        sys.stdout = open(os.devnull, "w")
+    return rank, world_size, local_rank
+
+
+def _broadcast_model(model):
+    """rank 0의 파라미터/버퍼를 모든 rank에 복제"""
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        dist.broadcast(tensor.data, src=0)
+
+
+def _sync_gradients(model, world_size: int):
+    """
+    누적된 gradient를 모든 rank에서 평균 (하나의 평탄화 버퍼로 all-reduce 1회)
+    BatchNorm running stats 등 버퍼는 DDP와 동일하게 rank 0 기준으로 맞춤
+    """
+    params = [p for p in model.parameters() if p.requires_grad]
+    grads = [p.grad if p.grad is not None else torch.zeros_like(p) for p in params]
+    flat = torch.cat([g.reshape(-1) for g in grads])
+    dist.all_reduce(flat)
+    flat /= world_size
+
+    offset = 0
+    for p in params:
+        n = p.numel()
+        p.grad = flat[offset:offset + n].view_as(p).clone()
+        offset += n
+
+    for buf in model.buffers():
+        dist.broadcast(buf.data, src=0)
+
+
+def _replica_drift(model) -> float:
+    """rank 간 파라미터 차이 (정상이면 0) — 에폭마다 동기화 검증용"""
+    flat = torch.cat([p.detach().reshape(-1) for p in model.parameters()])
+    ref = flat.clone()
+    dist.broadcast(ref, src=0)
+    drift = (flat - ref).abs().max()
+    dist.all_reduce(drift, op=dist.ReduceOp.MAX)
+    return drift.item()
+
+
+def _equivalence_gradients(args, rank: int, world_size: int, batch: int) -> torch.Tensor:
+    """
+    ResumableSampler shard로 첫 옵티마이저 step을 학습 루프와 같은 방식으로 누적한 gradient (평탄화)
+    rank마다 batch // world_size 샘플, 분산이면 _sync_gradients로 평균 — 증강/dropout 없이 결정적으로 비교
+    """
+    data_path = Path(args.data)
+    splits = json.loads((data_path / "splits.json").read_text())
+    dataset = CornerDataset(data_path / "images", data_path / "labels", splits["train"], augment=False)
+    if args.teacher is not None:
+        torch.manual_seed(args.seed)  # student 초기 가중치를 모든 프로세스에서 동일하게
+        model = build_student(args.student_width, args.student_depth)
+    else:
+        model = load_converted(args.model, use_cache=not args.no_convert_cache)
+    for param in model.parameters():
+        param.requires_grad = True
+    model.train()
+    for module in model.modules():
+        if isinstance(module, nn.Dropout):
+            module.eval()
+    criterion = CornerLoss(points_weight=args.points_weight, obj_weight=args.obj_weight,
+                           area_weight=args.area_weight)
+
+    sampler = ResumableSampler(len(dataset), num_replicas=world_size, rank=rank, seed=args.seed)
+    sampler.set_epoch(0)
+    accum_steps = batch // world_size
+    for _, idx in zip(range(accum_steps), sampler):
+        img, gt_pts, gt_obj = dataset[idx]
+        outputs = model(img.unsqueeze(0))
+        loss, _ = criterion(outputs[0], torch.sigmoid(outputs[1]), gt_pts.unsqueeze(0), gt_obj.unsqueeze(0))
+        (loss / accum_steps).backward()
+    if world_size > 1:
+        _sync_gradients(model, world_size)
+    return torch.cat([p.grad.reshape(-1) for p in model.parameters()])
+
+
+def _ddp_equivalence_worker(rank: int, world_size: int, args, init_file: str, output_path: str, batch: int):
+    dist.init_process_group(backend="gloo", init_method=f"file://{init_file}", rank=rank, world_size=world_size)
+    torch.set_num_threads(1)
+    grads = _equivalence_gradients(args, rank, world_size, batch)
+    if rank == 0:
+        torch.save(grads, output_path)
+    dist.destroy_process_group()
+
+
+def check_ddp_equivalence(args, world_size: int = 2, rtol: float = 1e-5) -> dict:
+    """
+    분산 학습 검증: world_size개 gloo 프로세스의 _sync_gradients 결과 vs 단일 프로세스가 같은 샘플
+    (ResumableSampler shard 합집합 = 단일 순열의 앞 batch개)을 누적한 gradient
+    최대 차이가 gradient 최대 크기의 rtol 이내면 통과 (차이는 합산 순서에 따른 부동소수점 오차)
+    """
+    import tempfile
+
+    num_train = len(json.loads((Path(args.data) / "splits.json").read_text())["train"])
+    batch = min(args.batch_size, num_train // world_size * world_size) // world_size * world_size
+    print(f"=== 분산 학습 등가성 검증 ===")
+    print(f"  샘플 {batch}개: 단일 프로세스 accum {batch} vs {world_size} ranks x accum {batch // world_size}")
+    if args.teacher is None:
+        load_converted(args.model, use_cache=not args.no_convert_cache)  # 변환 캐시를 미리 채움 (rank 간 쓰기 경합 방지)
+
+    single = _equivalence_gradients(args, 0, 1, batch)
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = str(Path(tmp) / "ddp_grads.pt")
+        mp.spawn(_ddp_equivalence_worker, args=(world_size, args, str(Path(tmp) / "init"), output_path, batch),
+                 nprocs=world_size)
+        distributed = torch.load(output_path)
+
+    max_diff = (single - distributed).abs().max().item()
+    scale = single.abs().max().item()
+    result = {"world_size": world_size, "samples": batch, "max_abs_diff": max_diff, "max_abs_grad": scale,
+              "passed": max_diff <= rtol * max(scale, 1e-12)}
+    print(f"  gradient 최대 크기 {scale:.3e}, 최대 차이 {max_diff:.3e} (허용 {rtol:.0e} x 최대 크기)")
+    print(f"  {'통과' if result['passed'] else '[경고] 불일치'}")
+    return result
 
 
 # ========== Training ==========
 
-def train(args):
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    import sys
+def train(args, report=None):
+    """
+    report: 에폭마다 검증 이력(history)을 받아 종료 사유(str) 또는 None 반환 (sweep 가지치기용, rank 0)
+    """
+    rank, world_size, local_rank = _init_distributed(args)
+    if torch.cuda.is_available():
+        device = torch.device(f"cuda:{local_rank}" if world_size > 1 else "cuda")
+    else:
+        device = torch.device("cpu")
     # stdout 버퍼링 비활성화
     sys.stdout.reconfigure(line_buffering=True) if hasattr(sys.stdout, 'reconfigure') else None
 
     print(f"=== DocAligner Fine-tuning ===")
     print(f"  Device: {device}")
+    if world_size > 1:
+        print(f"  Distributed: gloo, world_size={world_size}, "
+              f"threads/rank={torch.get_num_threads()}")
     if torch.cuda.is_available():
         print(f"  GPU: {torch.cuda.get_device_name(0)}")
         print(f"  VRAM: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.1f} GB")
@@ -205,40 +907,88 @@ def train(args):
     data_path = Path(args.data)
     splits = json.loads((data_path / "splits.json").read_text())
 
-    train_ds = CornerDataset(data_path / "images", data_path / "labels", splits["train"], augment=True)
-    val_ds = CornerDataset(data_path / "images", data_path / "labels", splits["val"], augment=False)
-    test_ds = CornerDataset(data_path / "images", data_path / "labels", splits["test"], augment=False)
+    # 디코드 캐시 (rank 0이 생성, 나머지는 대기)
+    cache_dir = None
+    if args.data_cache:
+        if rank == 0:
+            cache_dir = build_data_cache(data_path)
+        if world_size > 1:
+            dist.barrier()
+        cache_dir = data_path / "cache"
+
+    train_ds = CornerDataset(data_path / "images", data_path / "labels", splits["train"], augment=True,
+                             cache_dir=cache_dir)
+    val_ds = CornerDataset(data_path / "images", data_path / "labels", splits["val"], augment=False,
+                           cache_dir=cache_dir)
+    test_ds = CornerDataset(data_path / "images", data_path / "labels", splits["test"], augment=False,
+                            cache_dir=cache_dir)
 
     # onnx2torch 모델은 batch=1만 지원 (Reshape 하드코딩)
     # gradient accumulation으로 실질적 배치 효과 달성
+    # 분산 학습 시 rank마다 batch_size / world_size 만큼 누적 → 전체 유효 배치는 동일
     actual_batch = 1
-    accum_steps = args.batch_size  # 예: 64 → 64번 누적 후 step
-
-    train_dl = DataLoader(train_ds, batch_size=actual_batch, shuffle=True,
+    accum_steps = max(1, args.batch_size // world_size)  # 예: 64 → 64번 누적 후 step
+
+    # 에폭별 재현 가능한 셔플 (중간 재개 지원), 분산 학습 시 rank별 shard
+    if args.adaptive_sampling:
+        # 고손실 샘플 우선 추출 (손실 테이블은 체크포인트에 저장)
+        train_sampler = LossAwareSampler(len(train_ds), num_replicas=world_size, rank=rank, seed=args.seed,
+                                         uniform=args.sampling_uniform, max_weight=args.sampling_max_weight,
+                                         device=device)
+    else:
+        train_sampler = ResumableSampler(len(train_ds), num_replicas=world_size, rank=rank, seed=args.seed)
+    train_dl = DataLoader(train_ds, batch_size=actual_batch, sampler=train_sampler,
                           num_workers=0, pin_memory=True, drop_last=True)
-    val_dl = DataLoader(val_ds, batch_size=actual_batch, shuffle=False,
-                        num_workers=0, pin_memory=True)
-    test_dl = DataLoader(test_ds, batch_size=actual_batch, shuffle=False,
-                         num_workers=0, pin_memory=True)
+    # 검증/테스트는 큰 배치로 로드 (forward는 _batched_call이 필요 시 샘플 단위로 분할)
+    val_dl = DataLoader(val_ds, batch_size=args.val_batch_size, shuffle=False,
+                        num_workers=args.val_workers, pin_memory=True)
+    test_dl = DataLoader(test_ds, batch_size=args.val_batch_size, shuffle=False,
+                         num_workers=args.val_workers, pin_memory=True)
 
     print(f"  Train: {len(train_ds)}, Val: {len(val_ds)}, Test: {len(test_ds)}")
-    print(f"  Effective batch size: {args.batch_size} (accum {accum_steps} steps)")
+    print(f"  Effective batch size: {accum_steps * world_size} "
+          f"(accum {accum_steps} steps x {world_size} ranks)")
     print(f"  Note: onnx2torch 모델은 batch=1 제한, gradient accumulation 사용")
+    print(f"  Validation: batch {args.val_batch_size}, backend={args.val_backend}, "
+          f"every {args.val_interval} epochs")
 
-    # 모델 로드
+    # 모델 로드 (지식 증류: 고정 teacher ONNX + 학습할 student)
     print(f"\n모델 로드 중...")
-    onnx_model = onnx.load(args.model)
-    model = convert(onnx_model).to(device)
+    distill = args.teacher is not None
+    if distill:
+        model = build_student(args.student_width, args.student_depth).to(device)
+        teacher = Teacher(args.teacher)
+        print(f"  지식 증류: teacher={args.teacher} (ONNX Runtime, 고정), "
+              f"student width={args.student_width} depth={args.student_depth}")
+    else:
+        model = load_converted(args.model, use_cache=not args.no_convert_cache).to(device)
+        teacher = None
 
     total_params = sum(p.numel() for p in model.parameters())
     print(f"  총 파라미터: {total_params:,}")
+    if world_size > 1:
+        _broadcast_model(model)
 
     # Stage 설정
     stage = args.stage
-    if stage == 1:
+    if distill:
+        _unfreeze_all(model)  # student는 Stage 구분 없이 전체 학습
+        print("  [증류] Student 전체 파라미터 학습")
+    elif stage == 1:
         _freeze_backbone(model)
     elif stage == 2:
         _unfreeze_last_blocks(model)
+    elif stage == 3:
+        # QAT: fp32 체크포인트 가중치로 Conv+BN 융합 후 fake-quant 삽입 (QAT 체크포인트면 삽입 후 아래에서 로드)
+        if not args.resume:
+            raise ValueError("--stage 3 (QAT)은 --resume으로 fp32 학습 체크포인트를 지정해야 합니다")
+        ckpt = torch.load(weights_only=False, f=args.resume, map_location=device)
+        if ckpt.get("args", {}).get("stage") != 3:
+            model.load_state_dict(ckpt["model"])
+        model = prepare_qat(model)
+        set_qat_observers(model, False)  # 에폭 시작 시 --qat-observer-epochs 동안만 관측
+        _unfreeze_all(model)
+        print("  [Stage 3] QAT: fake-quant 삽입, 전체 파라미터 학습")
     else:
         # 자동: epoch 1~20은 Stage 1, 21~은 Stage 2
         _freeze_backbone(model)
@@ -256,17 +1006,26 @@ def train(args):
         optimizer, T_max=args.epochs, eta_min=args.lr * 0.01
     )
 
-    criterion = CornerLoss(points_weight=1.0, obj_weight=0.5, area_weight=0.1)
+    criterion = CornerLoss(points_weight=args.points_weight, obj_weight=args.obj_weight,
+                           area_weight=args.area_weight)
+    distill_criterion = DistillationLoss(points_weight=args.points_weight, obj_weight=args.obj_weight,
+                                         temperature=args.distill_temperature)
 
     # 체크포인트 로드
     start_epoch = 0
+    start_step = 0  # 에폭 중간 재개 시 이미 처리한 샘플(micro-step) 수
     best_val_dist = float("inf")
+    history = []
+    stage_switched = False
+    stage_switch_epoch = args.stage1_epochs  # 자동 모드 Stage 2 시작 에폭 (Stage 1 정체 시 앞당김)
+    resume_meter = None
     if args.resume:
         ckpt = torch.load(weights_only=False, f=args.resume, map_location=device)
-        model.load_state_dict(ckpt["model"])
         prev_stage = ckpt.get("args", {}).get("stage", None)
         # Stage가 변경된 경우 optimizer 재생성 + epoch 리셋
         if prev_stage is not None and prev_stage != stage:
+            if stage != 3:  # QAT는 위에서 fp32 가중치 로드 + 융합 완료
+                model.load_state_dict(ckpt["model"])
             print(f"  Stage 변경 감지: {prev_stage} -> {stage}, optimizer 재생성, epoch 리셋")
             optimizer = torch.optim.AdamW(
                 filter(lambda p: p.requires_grad, model.parameters()),
@@ -278,156 +1037,399 @@ def train(args):
             )
             start_epoch = 0  # 새 Stage는 epoch 0부터
         else:
+            # step 체크포인트: 진행 중이던 에폭의 step 위치부터, 그 외: 다음 에폭부터
+            step = ckpt.get("step")
+            if step is not None and step < len(train_sampler):
+                start_epoch, start_step = ckpt["epoch"], step
+            else:
+                start_epoch = ckpt["epoch"] + 1
+
+            # 자동 모드에서 Stage 2 구간에 저장된 체크포인트면 전환 상태 복원 (옵티마이저 파라미터 그룹 일치)
+            stage_switch_epoch = ckpt.get("stage_switch_epoch", 20)  # 구버전: epoch 20 고정
+            if stage == 0 and not distill and ckpt["epoch"] >= stage_switch_epoch:
+                _unfreeze_last_blocks(model)
+                optimizer, scheduler = _stage2_optimizer(model, args, stage_switch_epoch)
+                stage_switched = True
+
+            model.load_state_dict(ckpt["model"])
             optimizer.load_state_dict(ckpt["optimizer"])
-            start_epoch = ckpt["epoch"] + 1
-            # 스케줄러를 start_epoch 위치까지 진행
-            for _ in range(start_epoch):
-                scheduler.step()
-        best_val_dist = ckpt.get("best_val_dist", float("inf"))
-        print(f"  체크포인트 로드: epoch {start_epoch}, best_dist={best_val_dist:.2f}px")
-
-    # 학습 루프
+            if "scheduler" in ckpt:
+                scheduler.load_state_dict(ckpt["scheduler"])
+                # 체크포인트의 T_max 대신 현재 --epochs 기준 cosine 구간 (에폭 수를 늘려 재개해도 LR이 다시 오르지 않도록)
+                _reset_cosine_horizon(optimizer, scheduler, max(1, args.epochs - stage_switch_epoch)
+                                      if stage_switched else args.epochs)
+            else:
+                # 구버전 체크포인트: 스케줄러를 start_epoch 위치까지 진행
+                for _ in range(start_epoch - (stage_switch_epoch if stage_switched else 0)):
+                    scheduler.step()
+            if start_step:
+                _set_rng_state(ckpt["rng"])
+                resume_meter = ckpt["train_meter"]
+            if args.adaptive_sampling and ckpt.get("sampler") is not None:
+                # 에폭 중 누적 손실은 rank 0 것만 저장됨 → 다른 rank는 테이블/확률만 복원
+                train_sampler.load_state_dict(ckpt["sampler"], accumulators=rank == 0)
+            history = ckpt.get("history", [])
+        if stage != 3 or prev_stage == 3:  # QAT 베스트는 fp32 기록과 따로 선택
+            best_val_dist = ckpt.get("best_val_dist", float("inf"))
+        print(f"  체크포인트 로드: epoch {start_epoch}, step {start_step}, best_dist={best_val_dist:.2f}px")
+
+    # 점진적 해상도: backbone만 저해상도로 실행, head 입력 feature map은 256 기준 크기로 보간
+    res_schedule = _parse_res_schedule(args.res_schedule) if args.res_schedule else []
+    if res_schedule:
+        inserted = enable_flexible_resolution(model, input_shape=(actual_batch, 3, 256, 256))
+        print(f"  점진적 해상도: {' → '.join(f'{r}px(~{e}ep)' for r, e in res_schedule)} → 256px "
+              f"(backbone 경계 보간 {inserted}곳)")
+
+    # 그래프 정리 (가중치 로드 후): 학습 입력 shape로 특수화, Conv+BN 융합은 생략 (train 모드 BN은 배치 통계 사용)
+    # 체크포인트 state_dict는 최적화 여부와 무관하게 동일 (비동기 검증 프로세스는 원본 그래프 사용)
+    if args.graph_opt:
+        model = optimize_model(model, trainable=_run_trainable_names(model, stage),
+                               input_shape=(actual_batch, 3, 256, 256), specialize_shapes=not res_schedule,
+                               training=True)
+
+    # 메모리 예산: 예상 최대 RSS가 --max-memory를 넘으면 backbone 블록 activation을 backward 때 재계산
+    if args.max_memory > 0:
+        _apply_memory_budget(model, stage, (actual_batch, 3, 256, 256), args.max_memory)
+
+    # 학습 루프 (체크포인트/로그는 rank 0만)
     output_dir = Path(args.output)
-    output_dir.mkdir(parents=True, exist_ok=True)
-    history = []
+    if rank == 0:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    checkpointer = AsyncCheckpointer()
+    telemetry = StepTelemetry(output_dir, enabled=rank == 0 and not args.no_telemetry,
+                              resume_epoch=start_epoch if args.resume else None)
+    memory = MemoryTracker(output_dir / "memory_profile.json", enabled=rank == 0 and args.track_memory)
+    # 학습 DataLoader는 num_workers=0 → 학습 배치 로드는 메인 프로세스 rss에 포함, 워커 항목은 검증/테스트만
+    memory_scope = {"train_loader": "main process (num_workers=0, rss에 포함)",
+                    "workers_mb": "val/test DataLoader 워커만 (--val-workers > 0)"}
+    if memory.enabled:
+        memory.start()
+        print("  메모리 추적: 학습 데이터는 메인 프로세스에서 로드 (rss에 포함), "
+              "워커 RSS는 검증/테스트 DataLoader만 (--val-workers > 0)")
+        if args.val_workers > 0:
+            val_ds.worker_memory = WorkerMemory(args.val_workers)
+            test_ds.worker_memory = WorkerMemory(args.val_workers)
+        print(MemoryTracker.format(memory.snapshot("setup")))
 
     print(f"\n학습 시작 (epochs: {args.epochs}, lr: {args.lr})")
     print("-" * 80)
 
     start_time = time.time()
-    stage_switched = False
-
+    val_time_total = 0.0
+    snapshot_path = output_dir / "_val_snapshot.onnx"
+
+    # 비동기 검증: 별도 프로세스가 val 스레드를 쓰고 학습은 나머지 코어 사용
+    val_worker = None
+    if args.async_val and rank == 0:
+        val_threads = args.val_threads or max(1, (os.cpu_count() or 4) // 4)
+        torch.set_num_threads(max(1, torch.get_num_threads() - val_threads))
+        val_worker = ValidationWorker(args, val_threads)
+        print(f"  비동기 검증 프로세스 시작 (threads: {val_threads})")
+        if args.val_workers > 0:
+            print(f"  [경고] --val-workers {args.val_workers}는 비동기 검증에 적용되지 않음 "
+                  f"(daemon 프로세스 내 로드, 최종 테스트 평가에만 사용)")
+
+    stop_reason = None  # 조기 종료 사유 (rank 0 결정)
+    last_epoch = start_epoch - 1
     for epoch in range(start_epoch, args.epochs):
-        # Stage 자동 전환 (stage=0일 때)
-        if stage == 0 and epoch == 20 and not stage_switched:
-            print(f"\n>>> Stage 2로 전환: 마지막 3 블록 + 전체 헤드 학습 <<<")
+        if world_size > 1:
+            # rank 0의 조기 종료 / Stage 전환 결정을 모든 rank에 공유
+            decision = torch.tensor([int(stop_reason is not None), stage_switch_epoch])
+            dist.broadcast(decision, 0)
+            stop, stage_switch_epoch = decision.tolist()
+            if stop and stop_reason is None:
+                stop_reason = "rank 0 결정"
+        if stop_reason is not None:
+            break
+
+        # Stage 자동 전환 (stage=0일 때, Stage 1 정체 또는 --stage1-epochs 도달)
+        if stage == 0 and not distill and epoch >= stage_switch_epoch and not stage_switched:
+            print(f"\n>>> Stage 2로 전환 (epoch {epoch + 1}): 마지막 3 블록 + 전체 헤드 학습 <<<")
+            stage_switch_epoch = epoch
             _unfreeze_last_blocks(model)
             # 옵티마이저 재생성 (새 파라미터 포함)
-            optimizer = torch.optim.AdamW(
-                filter(lambda p: p.requires_grad, model.parameters()),
-                lr=args.lr * 0.1,  # Stage 2는 더 작은 LR
-                weight_decay=args.weight_decay,
-            )
-            scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(
-                optimizer, T_max=args.epochs - 20, eta_min=args.lr * 0.001
-            )
+            optimizer, scheduler = _stage2_optimizer(model, args, stage_switch_epoch)
             trainable = sum(p.numel() for p in model.parameters() if p.requires_grad)
             print(f"  학습 가능 파라미터: {trainable:,}")
             stage_switched = True
 
         epoch_start = time.time()
+        resolution = _resolution_for_epoch(res_schedule, epoch)
+        train_ds.resolution = resolution if resolution < 256 else None
         model.train()
-        epoch_loss = 0
-        epoch_pts = 0
-        batch_count = 0
+        if stage == 3:
+            # QAT 초반 에폭만 양자화 범위 관측, 이후 scale/zero_point 고정 상태로 가중치 적응
+            set_qat_observers(model, epoch < args.qat_observer_epochs)
+        skip = start_step if epoch == start_epoch else 0
+        train_sampler.set_epoch(epoch, start=skip)
+        train_meter = RunningMetrics(["total", "points"], device)
+        log_meter = RunningMetrics(["total", "points"], device)
+        if skip and resume_meter is not None:
+            train_meter.sums.copy_(resume_meter["sums"])
+            train_meter.count = resume_meter["count"]
+        batch_count = skip // accum_steps
         optimizer.zero_grad()
+        telemetry.start_epoch(epoch)
 
-        for step, (imgs, gt_pts, gt_obj) in enumerate(train_dl):
-            imgs = imgs.to(device)
-            gt_pts = gt_pts.to(device)
-            gt_obj = gt_obj.to(device)
+        for step, (imgs, gt_pts, gt_obj) in enumerate(train_dl, start=skip):
+            imgs = imgs.to(device, non_blocking=True)
+            gt_pts = gt_pts.to(device, non_blocking=True)
+            gt_obj = gt_obj.to(device, non_blocking=True)
+            t_data = telemetry.mark()  # JPEG 디코드 + 증강 + 전송 대기
 
             outputs = model(imgs)
             pred_pts = outputs[0]
             pred_obj = torch.sigmoid(outputs[1])
 
             loss, loss_dict = criterion(pred_pts, pred_obj, gt_pts, gt_obj)
+            if distill:
+                # 정답 손실과 teacher 모방 손실의 가중 합
+                with torch.no_grad():
+                    teacher_pts, teacher_obj = teacher(imgs)
+                kd_loss, _ = distill_criterion(pred_pts, outputs[1], teacher_pts, teacher_obj)
+                loss = (1 - args.distill_alpha) * loss + args.distill_alpha * kd_loss
+                loss_dict["total"] = loss.detach()
+            if args.adaptive_sampling:
+                train_sampler.record(step, loss_dict["total"])
+                loss = loss * train_sampler.weight(step)  # 제한된 중요도 가중치
             loss = loss / accum_steps  # gradient accumulation 스케일링
+            t_forward = telemetry.mark()
+            rss = telemetry.rss_mb()
             loss.backward()
 
-            epoch_loss += loss_dict["total"]
-            epoch_pts += loss_dict["points"]
+            train_meter.update(loss_dict)
+            log_meter.update(loss_dict)
+            t_backward = telemetry.mark()
 
             # accum_steps마다 파라미터 업데이트
+            t_optim = 0.0
             if (step + 1) % accum_steps == 0:
+                if world_size > 1:
+                    _sync_gradients(model, world_size)
                 torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=5.0)
                 optimizer.step()
                 optimizer.zero_grad()
                 batch_count += 1
+                t_optim = telemetry.mark()
+
+                # 로깅 간격마다만 host 동기화
+                if args.log_interval > 0 and batch_count % args.log_interval == 0:
+                    running = log_meter.compute()
+                    log_meter.reset()
+                    print(f"    step {batch_count:5d} | loss={running['total']:.4f} "
+                          f"pts={running['points']:.4f}")
+
+                # step 체크포인트 (옵티마이저 step 직후 → 누적 gradient 없음)
+                if rank == 0 and args.ckpt_interval > 0 and batch_count % args.ckpt_interval == 0:
+                    checkpointer.save({
+                        "epoch": epoch,
+                        "step": step + 1,
+                        "model": model.state_dict(),
+                        "optimizer": optimizer.state_dict(),
+                        "scheduler": scheduler.state_dict(),
+                        "rng": _rng_state(),
+                        "train_meter": {"sums": train_meter.sums, "count": train_meter.count},
+                        "sampler": train_sampler.state_dict() if args.adaptive_sampling else None,
+                        "stage_switch_epoch": stage_switch_epoch,
+                        "best_val_dist": best_val_dist,
+                        "history": history,
+                        "args": vars(args),
+                    }, output_dir / "checkpoint_step.pt")
+
+            telemetry.record(step, t_data, t_forward, t_backward, t_optim, rss)
+            telemetry.mark()  # 로깅/체크포인트 스냅샷 시간은 다음 data 구간에서 제외
 
         # 남은 gradient 처리
         if (step + 1) % accum_steps != 0:
+            if world_size > 1:
+                _sync_gradients(model, world_size)
             torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=5.0)
             optimizer.step()
             optimizer.zero_grad()
             batch_count += 1
 
         scheduler.step()
+        last_epoch = epoch
+        if stage == 3:
+            set_qat_observers(model, False)  # 검증/스냅샷 export 중 범위 갱신 방지
+        perf = telemetry.end_epoch(samples=step + 1 - skip, threads=torch.get_num_threads())
+        perf["resolution"] = resolution
 
-        total_steps = step + 1
-        avg_train_loss = epoch_loss / max(total_steps, 1)
-        avg_train_pts = epoch_pts / max(total_steps, 1)
+        train_meter.all_reduce()
+        train_losses = train_meter.compute()
+        avg_train_loss = train_losses["total"]
+        avg_train_pts = train_losses["points"]
 
         epoch_time = time.time() - epoch_start
-
-        # 검증 (5에폭마다 또는 마지막)
-        if (epoch + 1) % 5 == 0 or epoch == args.epochs - 1:
-            val_metrics = evaluate(model, val_dl, device, criterion)
-            val_dist = val_metrics["avg_corner_dist_px"]
-            val_success = val_metrics["success_rate_10px"]
-
-            improved = ""
-            if val_dist < best_val_dist:
-                best_val_dist = val_dist
-                improved = " * BEST"
-                # 베스트 모델 저장
-                torch.save({
-                    "epoch": epoch,
-                    "model": model.state_dict(),
-                    "optimizer": optimizer.state_dict(),
-                    "best_val_dist": best_val_dist,
-                    "args": vars(args),
-                }, output_dir / "checkpoint_best.pt")
-
-            lr = optimizer.param_groups[0]["lr"]
-            print(f"  Epoch {epoch+1:3d}/{args.epochs} [{epoch_time:.0f}s] | "
-                  f"loss={avg_train_loss:.4f} pts={avg_train_pts:.4f} | "
-                  f"val_dist={val_dist:.1f}px ok={val_success:.0%} | "
-                  f"lr={lr:.6f}{improved}")
-
-            history.append({
-                "epoch": epoch + 1,
+        sampling = train_sampler.update(world_size) if args.adaptive_sampling else None
+
+        if world_size > 1:
+            drift = _replica_drift(model)
+            if drift > 1e-5:
+                print(f"  [경고] rank 간 파라미터 불일치: {drift:.2e}")
+            if rank != 0:
+                continue  # 검증/체크포인트/로그는 rank 0 전담
+
+        # 시간 예산: 같은 길이의 에폭을 하나 더 돌면 초과 → 이번 에폭에서 종료 (마지막 검증 포함)
+        last = epoch == args.epochs - 1
+        if args.time_budget > 0 and not last and time.time() - start_time + epoch_time > args.time_budget * 60:
+            stop_reason = f"시간 예산 {args.time_budget:g}분 도달"
+
+        # 검증 (val_interval 에폭마다, 마지막 또는 종료 직전)
+        lr = optimizer.param_groups[0]["lr"]
+        val_results = []
+        if (epoch + 1) % args.val_interval == 0 or epoch == args.epochs - 1 or stop_reason:
+            snapshot = {
+                "epoch": epoch,
                 "train_loss": avg_train_loss,
                 "train_pts": avg_train_pts,
-                "val_loss": val_metrics["loss"],
-                "val_dist": val_dist,
-                "val_success": val_success,
                 "lr": lr,
-            })
+                "train_seconds": epoch_time,
+                "resolution": resolution,
+                "stage_switch_epoch": stage_switch_epoch,
+                "sampler": train_sampler.state_dict() if args.adaptive_sampling else None,
+            }
+            if val_worker is not None:
+                # 가중치 스냅샷만 넘기고 학습은 바로 다음 에폭으로
+                snapshot["model"] = {k: v.detach().cpu().clone() for k, v in model.state_dict().items()}
+                snapshot["optimizer"] = _to_cpu_copy(optimizer.state_dict())
+                snapshot["scheduler"] = scheduler.state_dict()
+                val_worker.submit(epoch, snapshot)
+            else:
+                val_start = time.time()
+                val_metrics = evaluate(model, val_dl, device, criterion,
+                                       backend=args.val_backend, snapshot_path=snapshot_path)
+                val_time = time.time() - val_start
+                snapshot["model"] = model.state_dict()
+                snapshot["optimizer"] = optimizer.state_dict()
+                snapshot["scheduler"] = scheduler.state_dict()
+                val_results.append((val_metrics, val_time, snapshot))
+
+        if val_worker is not None:
+            val_results.extend(val_worker.poll())
+
+        if val_worker is None and val_results:
+            val_metrics, val_time, snapshot = val_results.pop()
+            val_time_total += val_time
+            best_val_dist, improved = _record_validation(
+                val_metrics, val_time, snapshot, best_val_dist, history, output_dir, args, checkpointer)
+            print(f"  Epoch {epoch+1:3d}/{args.epochs} [{epoch_time:.0f}s + val {val_time:.0f}s] | "
+                  f"loss={avg_train_loss:.4f} pts={avg_train_pts:.4f} | "
+                  f"val_dist={val_metrics['avg_corner_dist_px']:.1f}px "
+                  f"ok={val_metrics['success_rate_10px']:.0%} | "
+                  f"lr={lr:.6f}{improved}")
         else:
-            lr = optimizer.param_groups[0]["lr"]
             print(f"  Epoch {epoch+1:3d}/{args.epochs} [{epoch_time:.0f}s] | "
                   f"loss={avg_train_loss:.4f} pts={avg_train_pts:.4f} | "
                   f"lr={lr:.6f}")
 
+        print(StepTelemetry.format(perf))
+        if sampling is not None:
+            print(f"    [sampler] coverage {sampling['coverage']:.0%} | "
+                  f"max p/uniform {sampling['max_prob_ratio']:.1f}x")
+        telemetry.save({"world_size": world_size, "accum_steps": accum_steps})
+        if memory.enabled:
+            print(MemoryTracker.format(memory.snapshot(f"epoch {epoch + 1}", periodic=True,
+                                                       workers={"val": val_ds.worker_memory})))
+            memory.save(memory_scope)
+
+        # 비동기 검증 결과 (이전 에폭 스냅샷)
+        for val_metrics, val_time, snapshot in val_results:
+            val_time_total += val_time
+            best_val_dist, improved = _record_validation(
+                val_metrics, val_time, snapshot, best_val_dist, history, output_dir, args, checkpointer)
+            print(f"    [val] Epoch {snapshot['epoch']+1:3d} [{val_time:.0f}s] | "
+                  f"val_dist={val_metrics['avg_corner_dist_px']:.1f}px "
+                  f"ok={val_metrics['success_rate_10px']:.0%}{improved}")
+
+        # 정체 판단 (검증 이력 기준): 자동 모드 Stage 1 → Stage 2 전환, 그 외 → 조기 종료
+        if stage == 0 and not distill and not stage_switched:
+            if epoch + 1 < stage_switch_epoch and _stalled(history, 0, args.stage_patience, args.min_delta):
+                stage_switch_epoch = epoch + 1
+                print(f"  Stage 1 val_dist 정체 ({args.stage_patience}회 검증) → 다음 에폭부터 Stage 2")
+        elif stop_reason is None and not last:
+            since = stage_switch_epoch if stage_switched else 0
+            if _stalled(history, since, args.patience, args.min_delta):
+                stop_reason = f"val_dist {args.patience}회 검증 동안 개선 없음"
+        if stop_reason is None and not last and report is not None:
+            stop_reason = report(history)
+        if stop_reason is not None:
+            print(f"\n>>> 조기 종료: {stop_reason} (epoch {epoch + 1}/{args.epochs}) <<<")
+
+        # 에폭 경계 체크포인트 (step=None → 다음 에폭부터 재개)
+        if args.ckpt_interval > 0:
+            checkpointer.save({
+                "epoch": epoch,
+                "step": None,
+                "model": model.state_dict(),
+                "optimizer": optimizer.state_dict(),
+                "scheduler": scheduler.state_dict(),
+                "sampler": train_sampler.state_dict() if args.adaptive_sampling else None,
+                "stage_switch_epoch": stage_switch_epoch,
+                "best_val_dist": best_val_dist,
+                "history": history,
+                "args": vars(args),
+            }, output_dir / "checkpoint_step.pt")
+
+    # 남은 비동기 검증 대기
+    if val_worker is not None:
+        for val_metrics, val_time, snapshot in val_worker.poll(block=True):
+            val_time_total += val_time
+            best_val_dist, improved = _record_validation(
+                val_metrics, val_time, snapshot, best_val_dist, history, output_dir, args, checkpointer)
+            print(f"    [val] Epoch {snapshot['epoch']+1:3d} [{val_time:.0f}s] | "
+                  f"val_dist={val_metrics['avg_corner_dist_px']:.1f}px "
+                  f"ok={val_metrics['success_rate_10px']:.0%}{improved}")
+        val_worker.close()
+        history.sort(key=lambda h: h["epoch"])
+
+    if rank != 0:
+        dist.barrier()  # rank 0의 테스트 평가/저장 완료 대기
+        dist.destroy_process_group()
+        return model, output_dir
+
     elapsed = time.time() - start_time
-    print(f"\n학습 완료! (총 {elapsed:.1f}초 = {elapsed/60:.1f}분)")
+    print(f"\n학습 완료! (총 {elapsed:.1f}초 = {elapsed/60:.1f}분, 검증 {val_time_total:.1f}초)")
     print(f"  Best val dist: {best_val_dist:.2f}px")
 
     # 마지막 체크포인트 저장
-    torch.save({
-        "epoch": args.epochs - 1,
+    checkpointer.save({
+        "epoch": last_epoch,
         "model": model.state_dict(),
         "optimizer": optimizer.state_dict(),
+        "scheduler": scheduler.state_dict(),
+        "sampler": train_sampler.state_dict() if args.adaptive_sampling else None,
+        "stage_switch_epoch": stage_switch_epoch,
         "best_val_dist": best_val_dist,
         "args": vars(args),
     }, output_dir / "checkpoint_last.pt")
+    checkpointer.wait()  # 베스트 체크포인트 로드 전 저장 완료 보장
 
     # 테스트 평가
     print(f"\n=== 테스트 평가 ===")
     # 베스트 모델 로드
     ckpt = torch.load(weights_only=False, f=output_dir / "checkpoint_best.pt", map_location=device)
     model.load_state_dict(ckpt["model"])
-    test_metrics = evaluate(model, test_dl, device, criterion)
+    test_metrics = evaluate(model, test_dl, device, criterion,
+                            backend=args.val_backend, snapshot_path=snapshot_path)
+    snapshot_path.unlink(missing_ok=True)
     print(f"  Test loss: {test_metrics['loss']:.4f}")
     print(f"  Test avg corner dist: {test_metrics['avg_corner_dist_px']:.2f}px")
     print(f"  Test success rate (10px): {test_metrics['success_rate_10px']:.1%}")
+    if memory.enabled:
+        print(MemoryTracker.format(memory.snapshot("test", workers={"test": test_ds.worker_memory})))
+        memory.save(memory_scope)
+        memory.stop()
 
     # 히스토리 저장
     with open(output_dir / "training_history.json", "w") as f:
         json.dump({
             "args": vars(args),
             "elapsed_seconds": elapsed,
+            "val_seconds_total": val_time_total,
+            "epochs_completed": last_epoch + 1,
+            "stop_reason": stop_reason,
+            "stage_switch_epoch": stage_switch_epoch if stage == 0 and not distill else None,
             "best_val_dist": best_val_dist,
             "test_metrics": test_metrics,
             "history": history,
@@ -435,37 +1437,137 @@ def train(args):
 
     print(f"\n  체크포인트: {output_dir / 'checkpoint_best.pt'}")
     print(f"  히스토리: {output_dir / 'training_history.json'}")
+    print(f"  텔레메트리: {telemetry.json_path}, {telemetry.csv_path}")
+    if memory.enabled:
+        print(f"  메모리: {memory.path}" + (f" (누수 의심 경고 {len(memory.warnings)}건)" if memory.warnings else ""))
+
+    if world_size > 1:
+        dist.barrier()
+        dist.destroy_process_group()
 
     return model, output_dir
 
 
+# ========== 메모리 예산 ==========
+
+def _apply_memory_budget(model, stage: int, input_shape, budget_mb: float):
+    """
+    예상 최대 RSS = 현재 RSS + gradient/AdamW 상태(학습 파라미터 × 3) + backward용 저장 activation
+    예산을 넘으면 plan_checkpointing()으로 고른 backbone 블록을 재계산 segment로 치환
+    """
+    if not isinstance(model, torch.fx.GraphModule):
+        print("  메모리 예산: 변환 모델(GraphModule)에만 적용 — 건너뜀")
+        return []
+    trainable = _run_trainable_names(model, stage)
+    params = dict(model.named_parameters())
+    state_bytes = 3 * sum(params[n].numel() * params[n].element_size() for n in trainable if n in params)
+    base_bytes = current_rss_mb() * 2**20 + state_bytes
+    memory = activation_memory(model, trainable, input_shape)
+    blocks = plan_checkpointing(memory, base_bytes, budget_mb * 2**20)
+
+    saved = sum(memory["blocks"][b] for b in blocks)
+    expected = (base_bytes + memory["total"] - saved) / 2**20
+    print(f"  메모리 예산 {budget_mb:.0f}MB: 현재 RSS + 옵티마이저 상태 {base_bytes / 2**20:.0f}MB, "
+          f"activation {memory['total'] / 2**20:.1f}MB (batch {input_shape[0]})")
+    if blocks:
+        enable_checkpointing(model, blocks)
+        print(f"    재계산 블록: {blocks} (activation -{saved / 2**20:.1f}MB) → 예상 {expected:.0f}MB")
+    else:
+        print(f"    재계산 불필요 → 예상 {expected:.0f}MB")
+    if expected > budget_mb:
+        print(f"    경고: 전체 재계산으로도 예산 초과 예상 ({expected:.0f}MB > {budget_mb:.0f}MB)")
+    return blocks
+
+
 # ========== Freeze/Unfreeze 전략 ==========
 
+def _stalled(history: list, since_epoch: int, patience: int, min_delta: float) -> bool:
+    """since_epoch 이후 검증 중 최근 patience회가 그 이전 최고 val_dist보다 min_delta 이상 개선되지 않았으면 True"""
+    values = [h["val_dist"] for h in sorted(history, key=lambda h: h["epoch"]) if h["epoch"] > since_epoch]
+    if patience <= 0 or len(values) <= patience:
+        return False
+    return min(values[-patience:]) > min(values[:-patience]) - min_delta
+
+
+def _reset_cosine_horizon(optimizer, scheduler, t_max: int):
+    """CosineAnnealingLR 구간을 t_max로 바꾸고 현재 LR을 같은 위치(last_epoch)의 새 곡선 값으로 맞춤"""
+    scheduler.T_max = t_max
+    progress = min(scheduler.last_epoch, t_max) / t_max
+    for group, base_lr in zip(optimizer.param_groups, scheduler.base_lrs):
+        group["lr"] = scheduler.eta_min + (base_lr - scheduler.eta_min) * (1 + math.cos(math.pi * progress)) / 2
+    scheduler._last_lr = [group["lr"] for group in optimizer.param_groups]
+
+
+def _stage2_optimizer(model, args, start_epoch: int = 20):
+    """Stage 1→2 자동 전환 시 옵티마이저/스케줄러 (새 파라미터 포함, 더 작은 LR, 남은 에폭에 cosine)"""
+    optimizer = torch.optim.AdamW(
+        filter(lambda p: p.requires_grad, model.parameters()),
+        lr=args.lr * 0.1,  # Stage 2는 더 작은 LR
+        weight_decay=args.weight_decay,
+    )
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(
+        optimizer, T_max=max(1, args.epochs - start_epoch), eta_min=args.lr * 0.001
+    )
+    return optimizer, scheduler
+
+
+def _is_stage1_param(name: str) -> bool:
+    """Stage 1 학습 대상: backbone 외 전체 (head)"""
+    return "backbone" not in name
+
+
+def _is_stage2_param(name: str) -> bool:
+    """Stage 2 학습 대상: 전체 head + backbone blocks/3, 4, 5"""
+    return "head" in name or any(f"blocks/{i}" in name or f"blocks\\{i}" in name
+                                 for i in [3, 4, 5])
+
+
+def _run_trainable_names(model, stage: int) -> set:
+    """학습 run 전체에서 한 번이라도 학습되는 파라미터 이름 (stage 0은 Stage 1 ∪ Stage 2, stage 3은 전체)"""
+    names = set()
+    for name, _ in model.named_parameters():
+        if (stage in (0, 1) and _is_stage1_param(name)) or (stage in (0, 2) and _is_stage2_param(name)) \
+                or stage == 3:
+            names.add(name)
+    return names
+
+
 def _freeze_backbone(model):
     """Stage 1: 전체 backbone 동결, head만 학습"""
     for name, param in model.named_parameters():
-        if "backbone" in name:
-            param.requires_grad = False
-        else:
-            param.requires_grad = True
+        param.requires_grad = _is_stage1_param(name)
     print("  [Stage 1] Backbone 동결, Head만 학습")
 
 
 def _unfreeze_last_blocks(model):
     """Stage 2: backbone 마지막 3블록(3,4,5) + 전체 head 학습"""
     for name, param in model.named_parameters():
-        param.requires_grad = False  # 일단 전체 동결
+        param.requires_grad = _is_stage2_param(name)
+    print("  [Stage 2] Backbone blocks/3~5 + 전체 Head 학습")
 
-    for name, param in model.named_parameters():
-        # head 전체 학습
-        if "head" in name:
-            param.requires_grad = True
-        # backbone blocks/3, 4, 5 학습
-        if any(f"blocks/{i}" in name or f"blocks\\{i}" in name
-               for i in [3, 4, 5]):
-            param.requires_grad = True
 
-    print("  [Stage 2] Backbone blocks/3~5 + 전체 Head 학습")
+def _unfreeze_all(model):
+    """전체 파라미터 학습 (Stage 3 QAT, 증류 student)"""
+    for param in model.parameters():
+        param.requires_grad = True
+
+
+# ========== 점진적 해상도 ==========
+
+def _parse_res_schedule(text: str) -> list:
+    """"160:4,224:8" → [(160, 4), (224, 8)]: epoch 1~4는 160, 5~8은 224, 이후 256"""
+    schedule = []
+    for part in text.split(","):
+        res, until = part.split(":")
+        schedule.append((int(res), int(until)))
+    return sorted(schedule, key=lambda item: item[1])
+
+
+def _resolution_for_epoch(schedule: list, epoch: int) -> int:
+    for res, until in schedule:
+        if epoch < until:
+            return res
+    return 256
 
 
 # ========== ONNX Export ==========
@@ -473,21 +1575,7 @@ def _unfreeze_last_blocks(model):
 def export_onnx(model, output_path: str, device="cpu"):
     """PyTorch 모델 → ONNX 변환"""
     model = model.to(device).eval()
-    dummy = torch.randn(1, 3, 256, 256, device=device)
-
-    torch.onnx.export(
-        model,
-        dummy,
-        output_path,
-        input_names=["img"],
-        output_names=["points", "has_obj"],
-        opset_version=16,
-        dynamic_axes={
-            "img": {0: "batch"},
-            "points": {0: "batch"},
-            "has_obj": {0: "batch"},
-        },
-    )
+    _export_graph(model, output_path, device)
 
     # 검증
     import onnxruntime as ort
@@ -509,7 +1597,61 @@ def export_onnx(model, output_path: str, device="cpu"):
     return output_path
 
 
-if __name__ == "__main__":
+# ========== 지식 증류 비교 ==========
+
+def compare_with_teacher(args, student_onnx: str, output_dir: Path) -> dict:
+    """
+    teacher ONNX vs student ONNX (fp32 + 동적 INT8): 테스트셋 정확도 (ONNX Runtime) + benchmark_onnx 지연 시간
+    결과는 distill_comparison.json에 저장
+    """
+    from export_onnx import benchmark_onnx, quantize_onnx
+
+    student_int8 = quantize_onnx(student_onnx, student_onnx.replace(".onnx", "_int8.onnx"))
+    data_path = Path(args.data)
+    splits = json.loads((data_path / "splits.json").read_text())
+    cache_dir = data_path / "cache" if args.data_cache else None
+    test_ds = CornerDataset(data_path / "images", data_path / "labels", splits["test"], augment=False,
+                            cache_dir=cache_dir)
+    test_dl = DataLoader(test_ds, batch_size=args.val_batch_size, shuffle=False, num_workers=args.val_workers)
+    criterion = CornerLoss(points_weight=args.points_weight, obj_weight=args.obj_weight,
+                           area_weight=args.area_weight)
+
+    results = {}
+    for name, path in [("teacher", args.teacher), ("student", student_onnx), ("student_int8", student_int8)]:
+        metrics = evaluate_onnx(path, test_dl, criterion)
+        print(f"\n[{name}] {path}")
+        results[name] = {
+            "path": str(path),
+            "size_mb": Path(path).stat().st_size / 1024 / 1024,
+            "latency_ms": benchmark_onnx(str(path)),
+            "avg_corner_dist_px": metrics["avg_corner_dist_px"],
+            "success_rate_10px": metrics["success_rate_10px"],
+        }
+
+    print(f"\n=== teacher vs student (test {len(test_ds)}장) ===")
+    print(f"  {'model':<14} {'size':>8} {'latency':>10} {'speedup':>8} {'dist':>8} {'ok@10px':>8}")
+    base = results["teacher"]["latency_ms"]
+    for name, r in results.items():
+        print(f"  {name:<14} {r['size_mb']:>6.2f}MB {r['latency_ms']:>8.2f}ms {base / r['latency_ms']:>7.2f}x "
+              f"{r['avg_corner_dist_px']:>6.2f}px {r['success_rate_10px']:>8.1%}")
+    with open(output_dir / "distill_comparison.json", "w") as f:
+        json.dump(results, f, indent=2)
+    return results
+
+
+def _positive_int(value: str) -> int:
+    """argparse type: 1 이상 정수"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"정수가 아닙니다: {value}") from None
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"1 이상이어야 합니다: {value}")
+    return number
+
+
+def build_parser():
+    """train.py CLI 파서 (sweep.py가 기본값/타입을 공유)"""
     parser = argparse.ArgumentParser(description="DocAligner Fine-tuning")
     parser.add_argument("--model", type=str,
                         default="assets/models/lcnet050_p_multi_decoder_l3_d64_256_fp32.onnx",
@@ -523,16 +1665,99 @@ if __name__ == "__main__":
     parser.add_argument("--lr", type=float, default=1e-4)
     parser.add_argument("--weight-decay", type=float, default=1e-5)
     parser.add_argument("--stage", type=int, default=0,
-                        help="0=자동(1→2전환), 1=헤드만, 2=백본+헤드")
+                        help="0=자동(1→2전환), 1=헤드만, 2=백본+헤드, 3=QAT (--resume fp32 체크포인트 필요)")
+    parser.add_argument("--qat-observer-epochs", type=int, default=2,
+                        help="QAT 양자화 범위(scale/zero_point) 관측 에폭 수, 이후 고정")
+    parser.add_argument("--teacher", type=str, default=None,
+                        help="지식 증류 teacher ONNX (지정 시 --model 대신 경량 student 학습, 예: "
+                             "assets/models/doc_aligner_book_v2_int8.onnx)")
+    parser.add_argument("--student-width", type=float, default=0.25, help="student 채널 폭 (PP-LCNet x1.0 대비)")
+    parser.add_argument("--student-depth", type=int, default=2, help="student 256 채널 단계 반복 수 (teacher 5)")
+    parser.add_argument("--distill-alpha", type=float, default=0.5,
+                        help="teacher 모방 손실 비중 (1-alpha는 정답 손실)")
+    parser.add_argument("--distill-temperature", type=float, default=2.0, help="has_obj 증류 temperature")
+    parser.add_argument("--points-weight", type=float, default=1.0, help="CornerLoss 코너 좌표 가중치")
+    parser.add_argument("--obj-weight", type=float, default=0.5, help="CornerLoss has_obj 가중치")
+    parser.add_argument("--area-weight", type=float, default=0.1, help="CornerLoss 면적 정규화 가중치")
     parser.add_argument("--resume", type=str, default=None,
                         help="체크포인트에서 이어서 학습")
     parser.add_argument("--export-onnx", action="store_true",
                         help="학습 후 ONNX 변환")
-    args = parser.parse_args()
+    parser.add_argument("--val-interval", type=_positive_int, default=5,
+                        help="검증 주기 (에폭)")
+    parser.add_argument("--val-batch-size", type=int, default=64,
+                        help="검증/테스트 배치 크기")
+    parser.add_argument("--val-workers", type=int, default=0,
+                        help="검증 DataLoader worker 수 (--async-val이면 검증 프로세스에서는 무시, 테스트 평가에만 사용)")
+    parser.add_argument("--val-backend", type=str, default="torch", choices=["torch", "ort"],
+                        help="검증 백엔드 (ort=현재 가중치를 export하여 ONNX Runtime으로 평가)")
+    parser.add_argument("--async-val", action="store_true",
+                        help="검증을 별도 프로세스에서 비동기 실행 (학습 중단 없음)")
+    parser.add_argument("--val-threads", type=int, default=0,
+                        help="비동기 검증 프로세스 스레드 수 (0=코어의 1/4)")
+    parser.add_argument("--threads-per-rank", type=int, default=0,
+                        help="분산 학습 시 rank당 스레드 수 (0=노드 코어 / 로컬 rank 수)")
+    parser.add_argument("--check-ddp-equivalence", action="store_true",
+                        help="학습 대신 2-rank gloo _sync_gradients 결과를 같은 샘플의 단일 프로세스 누적 gradient와 비교 "
+                             "(--batch-size 샘플, 일치하면 종료 코드 0)")
+    parser.add_argument("--ckpt-interval", type=int, default=20,
+                        help="N 옵티마이저 스텝마다 checkpoint_step.pt 저장 (백그라운드, 0=비활성)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="학습 데이터 셔플 시드 (에폭별 순열 재현)")
+    parser.add_argument("--no-telemetry", action="store_true",
+                        help="스텝별 구간 시간 기록(telemetry_steps.csv) 비활성화")
+    parser.add_argument("--patience", type=int, default=0,
+                        help="조기 종료: val_dist가 N회 검증 동안 개선 없으면 종료 (0: 비활성)")
+    parser.add_argument("--min-delta", type=float, default=0.1,
+                        help="개선으로 인정하는 최소 val_dist 감소 (px)")
+    parser.add_argument("--stage-patience", type=int, default=2,
+                        help="자동 모드: Stage 1 val_dist가 N회 검증 동안 정체되면 Stage 2로 전환 (0: 비활성)")
+    parser.add_argument("--stage1-epochs", type=int, default=20,
+                        help="자동 모드 Stage 1 최대 에폭 (정체가 없어도 이 에폭에서 Stage 2로 전환)")
+    parser.add_argument("--time-budget", type=float, default=0,
+                        help="학습 시간 예산 (분, 0: 무제한) — 초과 전 마지막 에폭에서 검증 후 종료")
+    parser.add_argument("--res-schedule", type=str, default=None,
+                        help="점진적 해상도 (예: 160:4,224:8 → epoch 1~4는 160px, 5~8은 224px, 이후 256px)")
+    parser.add_argument("--adaptive-sampling", action="store_true",
+                        help="손실 기반 적응 샘플링 (고손실 샘플을 더 자주, 손실 테이블은 체크포인트에 저장)")
+    parser.add_argument("--sampling-uniform", type=float, default=0.3,
+                        help="적응 샘플링 확률 중 uniform 비율 (커버리지 하한)")
+    parser.add_argument("--sampling-max-weight", type=float, default=3.0,
+                        help="중요도 가중치 상한 (하한은 역수)")
+    parser.add_argument("--data-cache", action="store_true",
+                        help="이미지를 한 번 디코드해 memmap 캐시(<data>/cache)로 공유 (JPEG 디코드 생략)")
+    parser.add_argument("--no-convert-cache", action="store_true",
+                        help="ONNX→PyTorch 변환 캐시 사용 안 함 (매번 onnx2torch 변환)")
+    parser.add_argument("--graph-opt", action="store_true",
+                        help="변환 그래프 정리 (상수 폴딩, Reshape/Transpose 정리 — 학습 중 BN 배치 통계 유지를 위해 Conv+BN 융합 생략)")
+    parser.add_argument("--track-memory", action="store_true",
+                        help="메모리 추적 (에폭별 RSS, tracemalloc 상위 할당 위치, 워커 RSS → memory_profile.json). "
+                             "학습 데이터는 메인 프로세스에서 로드(RSS에 포함)하므로 워커 RSS는 검증/테스트 DataLoader만")
+    parser.add_argument("--max-memory", type=float, default=0,
+                        help="학습 프로세스 메모리 예산 (MB, 0: 비활성) — 초과 예상 시 backbone 블록 activation 재계산")
+    parser.add_argument("--log-interval", type=int, default=0,
+                        help="N 옵티마이저 스텝마다 running loss 출력 (0=에폭 단위만)")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+
+    if args.check_ddp_equivalence:
+        sys.exit(0 if check_ddp_equivalence(args)["passed"] else 1)
 
     model, output_dir = train(args)
 
-    if args.export_onnx:
+    if args.export_onnx and int(os.environ.get("RANK", "0")) == 0:
         print(f"\n=== ONNX 변환 ===")
-        onnx_path = str(output_dir / "doc_aligner_finetuned.onnx")
+        # QAT 모델은 fake-quant가 QuantizeLinear/DequantizeLinear로 export → QDQ INT8 ONNX
+        if args.teacher is not None:
+            name = "doc_aligner_student.onnx"
+        elif args.stage == 3:
+            name = "doc_aligner_finetuned_qdq_int8.onnx"
+        else:
+            name = "doc_aligner_finetuned.onnx"
+        onnx_path = str(output_dir / name)
         export_onnx(model, onnx_path)
+        if args.teacher is not None:
+            compare_with_teacher(args, onnx_path, output_dir)